@@ -3,18 +3,91 @@ App configuration loaded from environment variables (or .env file).
 Uses pydantic-settings so values can be overridden via env vars in Docker.
 """
 
+import socket
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     REDIS_URL: str = "redis://redis:6379/0"          # Redis connection for Celery broker + job state
     DOWNLOADS_DIR: str = "/app/downloads"             # Where yt-dlp saves downloaded video files
-    MAX_CONCURRENT_DOWNLOADS: int = 3                 # Max Celery worker concurrency
+    MAX_CONCURRENT_DOWNLOADS: int = 3                 # Max Celery worker concurrency (prefork pool)
+    WORKER_POOL: str = "prefork"                      # "prefork" (a process per download) or "threads" (many per process)
+    WORKER_THREADS: int = 32                          # Concurrent downloads per worker process with WORKER_POOL=threads
+    MAX_CONCURRENT_MERGES: int = 2                    # ffmpeg merges/fixups/audio extractions at once per worker process
+    DOWNLOAD_RETRIES: int = 5                         # Retries of a download after a transient (network) error
+    RETRY_BACKOFF: float = 10.0                       # Delay before the first retry (s); doubles each time
+    RETRY_BACKOFF_MAX: float = 600.0                  # Longest delay between retries (s)
+    SCHEDULER_SLOTS: int = 3                          # Jobs handed to Celery at once (= total concurrency of all workers)
+    LONG_JOB_SLOTS: int = 2                           # How many of those slots long jobs may take
+    LONG_JOB_DURATION: int = 1200                     # Videos longer than this (seconds) are long jobs
+    LONG_JOB_BYTES: int = 1024**3                     # ...as are downloads bigger than this
+    MAX_JOBS_PER_DOMAIN: int = 2                      # Running jobs per site (avoids 429s from the origin)
+    CONNECTIONS_PER_JOB: int = 4                      # Parallel connections per job (HLS/DASH fragments, byte-range segments)
+    MAX_WORKER_CONNECTIONS: int = 12                  # Cap on connections summed over a worker's concurrent jobs
+    SEGMENTED_MIN_SIZE: int = 32 * 1024**2            # Progressive files at least this big are fetched in segments
+    WORKER_BANDWIDTH: int = 0                         # Bytes/s one worker host's downloads may use together, shared fairly (0 = unlimited)
+    JOB_BANDWIDTH: int = 0                            # Bytes/s cap for a single download (0 = unlimited)
+    BANDWIDTH_FINISH_BYTES: int = 16 * 1024**2        # Downloads with less than this left to fetch...
+    BANDWIDTH_FINISH_BOOST: float = 2.0               # ...get this many times the fair share of others
     CORS_ORIGINS: list[str] = [                       # Allowed frontend origins for CORS
         "http://localhost:5173",
         "http://localhost:3000",
         "http://localhost:3001",
     ]
+    REDIS_MAX_CONNECTIONS: int = 50                   # Size of the shared async Redis connection pool
+    EXTRACT_POOL: str = "process"                     # "process" (multi-core, warm worker processes) or "thread"
+    EXTRACT_WORKERS: int = 8                          # Extraction workers (processes or threads)
+    EXTRACT_QUEUE_DEPTH: int = 32                     # Extractions allowed to wait for a worker before 503s
+    EXTRACT_RECYCLE_AFTER: int = 100                  # Extractions before a worker's YoutubeDL (and process) is replaced
+    EXTRACT_TIMEOUT: float = 30.0                     # Per-request extraction deadline (seconds)
+    EXTRACT_CACHE_SIZE: int = 512                     # Max entries in the in-process metadata LRU
+    EXTRACT_CACHE_LOCAL_TTL: int = 60                 # Seconds an entry lives in the in-process LRU
+    EXTRACT_CACHE_REDIS_TTL: int = 300                # Seconds an entry lives in the shared Redis tier
+    INFO_REUSE_MAX_AGE: int = 1800                    # Max age (s) of a stored info_dict the worker will reuse
+    PREFETCH: bool = False                            # Start downloading the likely format right after /api/extract
+    PREFETCH_FORMAT: str = "bestvideo+bestaudio/best" # The format predicted (the "Best quality" entry)
+    PREFETCH_MAX_DURATION: int = 600                  # Only prefetch videos up to this long (s)...
+    PREFETCH_MAX_BYTES: int = 200 * 1024**2           # ...and this big (filesize / filesize_approx)
+    PREFETCH_SLOTS: int = 1                           # Scheduler slots prefetches may take (only ones no real job wants)
+    PREFETCH_TTL: int = 300                           # Seconds an unclaimed prefetch is kept before it is cancelled
+    SSE_HEARTBEAT_INTERVAL: float = 15.0              # Seconds of silence before an SSE heartbeat is sent
+    WS_MAX_RATE: float = 4.0                          # Max progress messages/second per WebSocket (also the default)
+    WS_MAX_SUBSCRIPTIONS: int = 200                   # Max downloads one WebSocket can watch at once
+    PROGRESS_INTERVAL: float = 0.5                    # Seconds between a worker's progress flushes to Redis
+    PROGRESS_IDLE_INTERVAL: float = 5.0               # ...for downloads no SSE/WebSocket client is watching
+    PROGRESS_MAX_RATE: int = 200                      # Progress publishes/second per worker process before flushes space out
+    METRICS_TOKEN: str = ""                           # Bearer token /metrics requires (empty = no check; keep the port private)
+    PROFILE_SLOWEST_PCT: float = 0.0                  # Keep sampled stacks of the slowest N% of downloads/extractions (0 = off)
+    PROFILE_INTERVAL: float = 0.01                    # Seconds between stack samples while profiling
+    PROFILE_DIR: str = "/app/profiles"                # Where the .folded stack files go (one per slow job)
+    STREAM_CHUNK_SIZE: int = 256 * 1024               # Bytes per chunk when tailing a growing download
+    STREAM_START_TIMEOUT: float = 30.0                # Max wait (s) for the worker to create the .part file
+    SERVE_GRACE_TTL: int = 300                        # Seconds a partially fetched file is kept for resumption
+    ACCEL_REDIRECT_PREFIX: str = ""                   # e.g. "/_downloads/" to let nginx send files (X-Accel-Redirect)
+    NODE_LOCAL_STORAGE: bool = False                  # Workers keep files on local disk; the API relays them (no shared volume)
+    NODE_FILE_PORT: int = 8001                        # Port of each worker's internal file server
+    NODE_URL: str = ""                                # How the API reaches this worker (default http://<hostname>:NODE_FILE_PORT)
+    NODE_TOKEN: str = ""                              # Shared secret between the API and the worker file servers
+    MIN_FREE_BYTES: int = 2 * 1024**3                 # Free space kept on the downloads volume; new jobs get 507 beyond it
+    JANITOR_INTERVAL: int = 300                       # Seconds between downloads-directory sweeps (0 = off)
+    STALE_PARTIAL_AGE: int = 3600                     # Partial files untouched this long (s) are deleted
+    ORPHAN_FILE_AGE: int = 600                        # Finished files no job refers to are deleted after this (s)
+    SHARED_DOWNLOADS: bool = False                    # Share one file between identical (video, format) jobs
+    SHARED_CACHE_MAX_BYTES: int = 20 * 1024**3        # Disk budget for shared files before LRU eviction
+    SHARED_CACHE_TTL: int = 3600                      # Seconds an unreferenced shared file is kept
+    MAX_BATCH_ITEMS: int = 100                        # Max videos in one batch (URLs + playlist entries)
+    BATCH_TTL: int = 3600                             # Seconds a batch and its items' job records live
+
+    @property
+    def worker_concurrency(self) -> int:
+        """Downloads one worker process runs at once."""
+        return self.WORKER_THREADS if self.WORKER_POOL == "threads" else self.MAX_CONCURRENT_DOWNLOADS
+
+    @property
+    def node_url(self) -> str:
+        """Base URL of this worker's file server, as recorded in its jobs."""
+        return self.NODE_URL or f"http://{socket.gethostname()}:{self.NODE_FILE_PORT}"
 
     class Config:
         env_file = ".env"
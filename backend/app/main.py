@@ -1,6 +1,8 @@
 """
 FastAPI app entry point.
-Sets up CORS, registers routers, and ensures the downloads directory exists on startup.
+Sets up CORS, registers routers, ensures the downloads directory exists on startup,
+runs the shared progress hub that feeds every SSE stream, and warms up the extraction pool.
+yt-dlp and Celery are not imported here — see services/extract_worker.py and tasks/dispatch.py.
 """
 
 import os
@@ -10,14 +12,24 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.routers import downloads, events
+from app.routers import downloads, events, metrics, progress_ws
+from app.services import node_files
+from app.services.extract_executor import extract_executor
+from app.utils.progress_hub import progress_hub
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create the downloads directory if it doesn't exist yet
     os.makedirs(settings.DOWNLOADS_DIR, exist_ok=True)
+    # One Redis Pub/Sub connection fans progress out to all SSE clients
+    progress_hub.start()
+    # Spawn extraction workers (which preload yt-dlp) in the background
+    extract_executor.start()
     yield
+    await progress_hub.stop()
+    await node_files.close()
+    extract_executor.shutdown()
 
 
 app = FastAPI(title="Downl4od - Universal Video Downloader", lifespan=lifespan)
@@ -35,3 +47,7 @@ app.add_middleware(
 app.include_router(downloads.router)
 # /api/downloads/{id}/progress (SSE)
 app.include_router(events.router)
+# /api/progress/ws (WebSocket, many downloads per connection)
+app.include_router(progress_ws.router)
+# /metrics (Prometheus)
+app.include_router(metrics.router)
@@ -2,103 +2,725 @@
 REST endpoints for video extraction, download management, and file serving.
 
 Flow: extract video info → start download (Celery task) → poll status → serve file → auto-cleanup.
+/file supports Range requests, so an interrupted transfer can resume; the file is deleted
+once every byte has been delivered or SERVE_GRACE_TTL passes. With NODE_LOCAL_STORAGE the
+file stays on the worker that downloaded it and /file relays it from there.
+Single-stream formats started with `stream: true` can also be fetched from /stream while
+the worker is still downloading.
+
+Batches (/api/batches) fan a list of URLs and/or a playlist out into ordinary download
+jobs, one Celery task each, and deliver the finished files as one streamed ZIP.
+
+With PREFETCH on, /extract starts a low-priority download of the likely format and
+/downloads adopts it when the user picks that format (services/prefetch.py).
 """
 
 import asyncio
-import os
+import logging
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from urllib.parse import quote
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException
+import aiofiles
+import httpx
+from fastapi import APIRouter, HTTPException, Request
 from starlette.background import BackgroundTask
-from starlette.responses import FileResponse
+from starlette.concurrency import iterate_in_threadpool
+from starlette.responses import Response, StreamingResponse
 
 from app.config import settings
 from app.schemas import (
+    BatchResponse,
     DownloadResponse,
     ExtractRequest,
+    StartBatchRequest,
     StartDownloadRequest,
+    TraceResponse,
     VideoInfo,
 )
-from app.services import ytdlp_service
-from app.tasks.download_task import download_video_task
-from app.utils.progress import get_job, set_job, delete_job
+from app.services import disk, node_files, prefetch, scheduler, shared_cache
+from app.services.extract_executor import ExtractionTimeout, ExtractorOverloaded, extract_executor
+from app.services.extract_worker import expand_playlist, extract_and_store
+from app.services.janitor import cleanup_job, job_filepath, job_relpath
+from app.services.metadata_cache import metadata_cache
+from app.utils import metrics
+from app.utils.batch_store import batch_store, sync_batch_store
+from app.utils.formats import JOB_OPTIONS, is_single_stream, is_transformed, job_options
+from app.utils.job_store import ACTIVE_STATUSES, job_store, sync_job_store
+from app.utils.progress_hub import progress_hub
+from app.utils.trace import load_kept, timeline
+from app.utils.urls import normalize_url
+from app.utils.zipstream import stream_zip, unique_names
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api")
 
+# Pending grace-period cleanups (kept referenced so they aren't garbage collected)
+_grace_tasks: set[asyncio.Task] = set()
+# Prefetches being started after an extraction (same reason)
+_prefetch_tasks: set[asyncio.Task] = set()
 
-@router.post("/extract", response_model=VideoInfo)
-async def extract_video_info(req: ExtractRequest):
-    """Call yt-dlp to extract video metadata and available formats from a URL.
-    Runs in a thread because yt-dlp is synchronous (makes network requests)."""
+
+async def _follow_source(job: dict) -> None:
+    """For a job attached to a shared download, copy the owner's state into it."""
+    entry = await asyncio.to_thread(shared_cache.get_entry, job["shared_key"])
+    if entry and entry.get("status") == "completed":
+        if job["status"] != "completed":
+            done = {"status": "completed", "progress": 100.0, "filename": entry["filename"],
+                    "filesize": int(entry["filesize"]) or None}
+            if entry.get("node"):
+                done["node"] = entry["node"]
+            job.update(done)
+            if await job_store.transition(job["id"], ACTIVE_STATUSES, **done):
+                await job_store.set_progress(job["id"], {"status": "completed", "progress": 100.0,
+                                                         "filename": entry["filename"]})
+                if job.get("batch_id"):
+                    await batch_store.record_result(job["batch_id"], "completed")
+    elif not entry or entry.get("status") == "failed":
+        failed = {"status": "failed", "error_message": "Shared download failed"}
+        job.update(failed)
+        if await job_store.transition(job["id"], ACTIVE_STATUSES, **failed) and job.get("batch_id"):
+            await batch_store.record_result(job["batch_id"], "failed")
+    else:
+        snapshot = await job_store.get_progress(job["source_id"]) or {}
+        job["status"] = snapshot.get("status", job["status"])
+        job["progress"] = snapshot.get("progress", job["progress"])
+
+
+@contextmanager
+def _extraction_errors():
+    """Map extraction pool errors to HTTP responses."""
     try:
-        info = await asyncio.to_thread(ytdlp_service.extract_info, str(req.url))
-        return info
+        yield
+    except ExtractorOverloaded as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+    except ExtractionTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=422, detail=str(e)[:500])
 
 
-@router.post("/downloads", response_model=DownloadResponse, status_code=201)
-async def start_download(req: StartDownloadRequest):
-    """Create a new download job in Redis and dispatch a Celery task to do the actual download."""
-    download_id = str(uuid4())
+async def _admit(urls: list[str], format_id: str, options: dict | None = None) -> list[str]:
+    """Ids for new jobs, with disk space reserved for each (all or nothing).
+    507 if the downloads volume can't take them right now."""
+    options = options or {}
+    sizes = await asyncio.to_thread(
+        lambda: {str(uuid4()): disk.estimate(url, format_id, **options) for url in urls}
+    )
+    if not await asyncio.to_thread(disk.reserve, sizes):
+        raise HTTPException(
+            status_code=507, detail="Not enough disk space, try again later",
+            headers={"Retry-After": "60"},
+        )
+    return list(sizes)
+
+
+async def _create_job(download_id: str, url: str, format_id: str, stream: bool = False,
+                      batch_id: str | None = None, options: dict | None = None,
+                      prefetch: bool = False) -> tuple[dict, bool]:
+    """Write a new job record. Returns (job, needs_task): False when the job attached
+    to an existing shared download instead of getting its own Celery task.
+    `options` are clip/audio settings (formats.JOB_OPTIONS) stored with the job.
+    A `prefetch` job is speculative: low priority, and never shared."""
 
-    # Store initial job state in Redis
+    # Initial job state. The Celery task id is the download id, so the record
+    # can be written once, before dispatch.
     job = {
         "id": download_id,
-        "url": str(req.url),
-        "format_id": req.format_id,
+        "url": url,
+        "format_id": format_id,
         "status": "pending",
         "progress": 0.0,
         "title": None,
         "filename": None,
         "filesize": None,
         "error_message": None,
+        "celery_task_id": download_id,
+        "stream": stream,
+        "queued_at": time.time(),
+        **(options or {}),
     }
-    set_job(download_id, job)
+    ttl = {}
+    if batch_id:
+        job["batch_id"] = batch_id
+        ttl["ttl"] = settings.BATCH_TTL
+    if prefetch:
+        job["prefetch"] = True
+        job["directory"] = f"prefetch/{download_id}"  # relative to DOWNLOADS_DIR
+
+    if settings.SHARED_DOWNLOADS and not prefetch:
+        # Identical (video, format) jobs share one download and one file
+        job["shared_key"] = await asyncio.to_thread(shared_cache.shared_key, url, format_id, options)
+        owner = await asyncio.to_thread(shared_cache.attach, job["shared_key"], download_id)
+        if owner is not None:
+            job["source_id"] = owner
+            job["celery_task_id"] = None
+            await job_store.create(download_id, job, **ttl)
+            await asyncio.to_thread(disk.release, download_id)  # the owner's download holds the space
+            return job, False
+
+    await job_store.create(download_id, job, **ttl)
+    return job, True
+
+
+def _client(request: Request) -> str:
+    """Scheduler key for whoever sent the request (nginx passes the real address)."""
+    address = request.headers.get("x-real-ip") or (request.client.host if request.client else "")
+    return scheduler.client_id(address)
+
+
+def _enqueue(jobs: list[dict], client: str) -> None:
+    """Hand new jobs to the fair scheduler and start whatever fits now. Blocking."""
+    for job in jobs:
+        scheduler.submit(job["id"], job["url"], job["format_id"], client,
+                         prefetch=bool(job.get("prefetch")), **job_options(job))
+    scheduler.pump()
+
+
+async def _add_queue_info(job: dict) -> None:
+    """Fill in queue position and estimated start for a job still waiting to be scheduled."""
+    if job.get("status") != "pending" or job.get("source_id"):
+        return
+    position, start = await asyncio.to_thread(scheduler.estimate, job["id"])
+    if position is not None:
+        job["queue_position"] = position
+        job["estimated_start"] = start
+
+
+async def _start_prefetch(url: str, client: str) -> None:
+    """Speculatively download PREFETCH_FORMAT of a video just extracted, if it is
+    small enough and has no prefetch yet (services/prefetch.py)."""
+    try:
+        if not await asyncio.to_thread(prefetch.wanted, url):
+            return
+        [download_id] = await _admit([url], settings.PREFETCH_FORMAT)
+    except HTTPException:
+        return  # no disk space to spare on a guess
+    if not await asyncio.to_thread(prefetch.claim, url, download_id):
+        await asyncio.to_thread(disk.release, download_id)
+        return
+    job, _ = await _create_job(download_id, url, settings.PREFETCH_FORMAT, prefetch=True)
+    await asyncio.to_thread(_enqueue, [job], client)
+    metrics.PREFETCHES.inc(outcome="started")
+
+
+def _spawn_prefetch(url: str, client: str) -> None:
+    async def run():
+        try:
+            await _start_prefetch(url, client)
+        except Exception:
+            logger.exception("Could not start a prefetch of %s", url)
+
+    task = asyncio.create_task(run())
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+
+async def _adopt_prefetch(url: str, format_id: str, options: dict) -> dict | None:
+    """The video's prefetch job, if it is exactly this download and already on a
+    worker. Any other prefetch of the video is cancelled."""
+    prefetch_id = await asyncio.to_thread(prefetch.take, url)
+    job = await job_store.get(prefetch_id) if prefetch_id else None
+    if not job:
+        return None
+    if prefetch.matches(job, format_id, options):
+        if not await asyncio.to_thread(scheduler.is_waiting, prefetch_id):
+            if await job_store.update(prefetch_id, prefetch=False):
+                metrics.PREFETCHES.inc(outcome="hit")
+                metrics.PREFETCH_HEAD_START.observe(time.time() - job["queued_at"])
+                job["prefetch"] = False
+                return job
+            return None
+        outcome = "late"  # still queued behind real jobs; the user's own job goes ahead of it
+    else:
+        outcome = "failed" if job.get("status") == "failed" else "miss"
+    await asyncio.to_thread(prefetch.cancel, prefetch_id, job, outcome)
+    return None
+
+
+def _content_disposition(filename: str) -> str:
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Byte range [start, end) requested by a single-range `Range: bytes=...` header,
+    or None to send the whole file (no header, or multi-range which we don't support)."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        else:
+            start, end = max(size - int(last), 0), size  # suffix range: last N bytes
+    except ValueError:
+        return None
+    if start >= end or start >= size:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _fully_delivered(ranges: list[tuple[int, int]], size: int) -> bool:
+    """True once the union of delivered ranges covers the whole file."""
+    covered = 0
+    for start, end in sorted(ranges):
+        if start > covered:
+            return False
+        covered = max(covered, end)
+    return covered >= size
+
+
+async def _schedule_grace_cleanup(download_id: str, job: dict) -> None:
+    """Push back the deadline after which a partially fetched file is deleted anyway."""
+    deadline = time.time() + settings.SERVE_GRACE_TTL
+    await job_store.update(download_id, serve_deadline=deadline)
+
+    async def expire():
+        await asyncio.sleep(settings.SERVE_GRACE_TTL)
+        current = await job_store.get(download_id)
+        # A later request moved the deadline — its own timer will handle it
+        if current and current.get("serve_deadline", 0) <= time.time():
+            await asyncio.to_thread(cleanup_job, download_id, job)
+
+    task = asyncio.create_task(expire())
+    _grace_tasks.add(task)
+    task.add_done_callback(_grace_tasks.discard)
+
+
+async def _holding_deadline(jobs: list[dict], chunks):
+    """Pass a response's `chunks` through, pushing back the serve deadline of `jobs`
+    while bytes flow, so a transfer longer than SERVE_GRACE_TTL isn't cleaned up under
+    its feet. When it ends (complete, failed or disconnected) the grace period starts
+    over from there, so the client can resume it."""
+    refreshed = time.monotonic()
+    try:
+        async for chunk in chunks:
+            if time.monotonic() - refreshed > settings.SERVE_GRACE_TTL / 3:
+                refreshed = time.monotonic()
+                for job in jobs:
+                    await job_store.update(job["id"], serve_deadline=time.time() + settings.SERVE_GRACE_TTL)
+            yield chunk
+    finally:
+        for job in jobs:
+            await _schedule_grace_cleanup(job["id"], job)
 
-    # Send the download task to the Celery worker
-    task = download_video_task.delay(download_id, str(req.url), req.format_id)
-    job["celery_task_id"] = task.id
-    set_job(download_id, job)
 
+def _record_delivery(download_id: str, job: dict, start: int, end: int, size: int) -> None:
+    """Runs after a (range) response was fully sent. Deletes the file once every byte
+    has been delivered across all requests; otherwise the grace timer takes care of it."""
+    ranges = sync_job_store.add_served_range(download_id, start, end)
+    if _fully_delivered(ranges, size):
+        cleanup_job(download_id, job, served=True)
+
+
+@router.post("/extract", response_model=VideoInfo)
+async def extract_video_info(req: ExtractRequest, request: Request):
+    """Call yt-dlp to extract video metadata and available formats from a URL.
+    Runs on the bounded extraction pool (warm worker processes by default) because
+    yt-dlp is synchronous and CPU-heavy on some sites.
+    Results are cached and concurrent requests for the same URL share one extraction.
+    With PREFETCH, the likely format then starts downloading in the background."""
+    async def extract(url: str):
+        return await extract_executor.run(extract_and_store, url)
+
+    with _extraction_errors():
+        info = await metadata_cache.get_or_extract(str(req.url), extract)
+    if settings.PREFETCH:
+        _spawn_prefetch(str(req.url), _client(request))
+    return info
+
+
+@router.get("/extract/stats")
+async def extract_stats():
+    """Extraction cache counters (hit/miss/coalesced) and executor queue state."""
+    return {"cache": metadata_cache.snapshot(), "executor": extract_executor.snapshot()}
+
+
+@router.post("/downloads", response_model=DownloadResponse, status_code=201)
+async def start_download(req: StartDownloadRequest, request: Request):
+    """Create a new download job in Redis and queue it with the fair scheduler, which
+    dispatches the Celery task that does the actual download once a slot is free.
+    `start_time`/`end_time` download only that section and `audio_only` only the audio.
+    Refused with 507 when the expected file size doesn't fit on the downloads volume.
+    A matching prefetch (see /extract) is adopted instead, when there is one."""
+    options = job_options(req.model_dump(include=set(JOB_OPTIONS)))
+    if settings.PREFETCH:
+        job = await _adopt_prefetch(str(req.url), req.format_id, options)
+        if job:
+            await _add_queue_info(job)
+            return DownloadResponse(**job)
+    [download_id] = await _admit([str(req.url)], req.format_id, options)
+    job, needs_task = await _create_job(
+        download_id, str(req.url), req.format_id, stream=req.stream, options=options
+    )
+    if not needs_task:
+        await _follow_source(job)
+        return DownloadResponse(**job)
+
+    # Publishing to Redis/the broker blocks, so off-loop
+    await asyncio.to_thread(_enqueue, [job], _client(request))
+    job = await job_store.get(job["id"]) or job  # the task may already have picked it up
+    await _add_queue_info(job)
     return DownloadResponse(**job)
 
 
 @router.get("/downloads/{download_id}", response_model=DownloadResponse)
 async def get_download(download_id: str):
     """Get current status of a download job from Redis."""
-    job = get_job(download_id)
+    job = await job_store.get(download_id)
     if not job:
         raise HTTPException(status_code=404, detail="Download not found or expired")
+    if job.get("source_id"):
+        await _follow_source(job)
+    await _add_queue_info(job)
+    if job.get("queue_position") is not None:
+        await job_store.update(download_id)  # keep a waiting job alive while someone polls it
     return DownloadResponse(**job)
 
 
+@router.get("/downloads/{download_id}/trace", response_model=TraceResponse)
+async def get_trace(download_id: str):
+    """Timing trace of a download: queued, picked up, extracted, first byte, fragment
+    progress, downloaded, merge start/end, completed, served (see utils/trace.py).
+    Still available for a while after the file was served and the job deleted."""
+    job = await job_store.get(download_id) or await load_kept(download_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Download not found or expired")
+    return TraceResponse(id=download_id, status=job.get("status"), queued_at=job.get("queued_at"),
+                         events=timeline(job))
+
+
 @router.get("/downloads/{download_id}/file")
-async def serve_file(download_id: str):
-    """Serve the downloaded file to the user's browser.
-    After the file is sent, a BackgroundTask deletes it from disk and removes the job from Redis.
-    This is the privacy guarantee — nothing persists after the user saves the file."""
-    job = get_job(download_id)
+async def serve_file(download_id: str, request: Request):
+    """Serve the downloaded file to the user's browser, honouring Range requests (206).
+    Once every byte has been delivered, a BackgroundTask deletes it from disk and removes
+    the job from Redis; a partially fetched file is kept for SERVE_GRACE_TTL so the
+    transfer can resume. This is the privacy guarantee — nothing persists after the
+    user saves the file. In shared mode the file is only released; shared_cache evicts
+    it once unreferenced.
+    With ACCEL_REDIRECT_PREFIX set, nginx sends the bytes itself (sendfile) and the
+    file is removed when the grace period ends."""
+    job = await job_store.get(download_id)
+    if job and job.get("source_id"):
+        await _follow_source(job)
     if not job or job.get("status") != "completed" or not job.get("filename"):
         raise HTTPException(status_code=404, detail="File not available")
 
-    filepath = Path(settings.DOWNLOADS_DIR) / job["filename"]
+    if job.get("node"):
+        return await _relay_file(download_id, job, request)
+
+    filepath = job_filepath(job)
     if not filepath.exists():
         raise HTTPException(status_code=404, detail="File no longer exists")
 
+    # Every request (re)starts the grace timer, so an abandoned transfer still gets cleaned up
+    await _schedule_grace_cleanup(download_id, job)
+
+    if settings.ACCEL_REDIRECT_PREFIX:
+        relpath = filepath.relative_to(settings.DOWNLOADS_DIR).as_posix()
+        return Response(
+            media_type="application/octet-stream",
+            headers={
+                "X-Accel-Redirect": settings.ACCEL_REDIRECT_PREFIX + quote(relpath),
+                "Content-Disposition": _content_disposition(job["filename"]),
+            },
+        )
+
+    size = filepath.stat().st_size
+    byte_range = _parse_range(request.headers.get("range"), size)
+    start, end = byte_range or (0, size)
+    sent_all = False  # the background task also runs after a client disconnect
+    began = time.monotonic()
+
+    async def send_bytes():
+        nonlocal sent_all
+        async with aiofiles.open(filepath, "rb") as f:
+            await f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = await f.read(min(settings.STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        sent_all = remaining <= 0
+
+    def after_send():
+        if sent_all:
+            metrics.SERVE_TIME.observe(time.monotonic() - began)
+            _record_delivery(download_id, job, start, end, size)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start),
+        "Content-Disposition": _content_disposition(job["filename"]),
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return StreamingResponse(
+        _holding_deadline([job], send_bytes()),
+        status_code=206 if byte_range else 200,
+        media_type="application/octet-stream",
+        headers=headers,
+        background=BackgroundTask(after_send),
+    )
+
+
+async def _relay_file(download_id: str, job: dict, request: Request) -> Response:
+    """serve_file for a file on a worker's own disk (NODE_LOCAL_STORAGE): the worker's
+    response, Range handling included, is passed through chunk by chunk."""
+    try:
+        upstream = await node_files.open_remote(job["node"], job_relpath(job), request.headers.get("range"))
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="The worker holding this file is unreachable")
+    if upstream.status_code not in (200, 206):
+        await upstream.aclose()
+        if upstream.status_code == 416:
+            raise HTTPException(
+                status_code=416, detail="Range not satisfiable",
+                headers={"Content-Range": upstream.headers.get("content-range", "")},
+            )
+        raise HTTPException(status_code=404, detail="File no longer exists")
+
+    await _schedule_grace_cleanup(download_id, job)
+
+    length = int(upstream.headers["content-length"])
+    start, size = 0, length
+    if upstream.status_code == 206:
+        span, _, total = upstream.headers["content-range"].removeprefix("bytes ").partition("/")
+        start, size = int(span.partition("-")[0]), int(total)
+    sent = 0
+    began = time.monotonic()
+
+    async def relay():
+        nonlocal sent
+        async for chunk in upstream.aiter_raw():
+            sent += len(chunk)
+            yield chunk
+
+    async def after_send():
+        await upstream.aclose()
+        if sent >= length:
+            metrics.SERVE_TIME.observe(time.monotonic() - began)
+            await asyncio.to_thread(_record_delivery, download_id, job, start, start + length, size)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(length),
+        "Content-Disposition": _content_disposition(job["filename"]),
+    }
+    if upstream.status_code == 206:
+        headers["Content-Range"] = upstream.headers["content-range"]
+    return StreamingResponse(
+        _holding_deadline([job], relay()),
+        status_code=upstream.status_code,
+        media_type="application/octet-stream",
+        headers=headers,
+        background=BackgroundTask(after_send),
+    )
+
+
+@router.get("/downloads/{download_id}/stream")
+async def stream_file(download_id: str, request: Request):
+    """Send the file while the worker is still writing it ("stream now").
+    Only for single-stream formats started with `stream: true` — the .part file is
+    tailed and chunks are sent as they land until the task completes. Anything else
+    (merge formats, finished jobs) falls back to the regular /file behaviour."""
+    job = await job_store.get(download_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Download not found or expired")
+    if (
+        job.get("status") == "completed"
+        or not job.get("stream")
+        or job.get("source_id")
+        or not is_single_stream(job["format_id"])
+        or is_transformed(job)  # clips/audio are written by ffmpeg at the end
+        or settings.NODE_LOCAL_STORAGE  # the .part file is on the worker's disk
+    ):
+        return await serve_file(download_id, request)
+
+    # Wait for the worker to report which .part file it is writing
+    deadline = time.monotonic() + settings.STREAM_START_TIMEOUT
+    while not job.get("partial_filename"):
+        if job.get("status") in ("completed", "failed") or time.monotonic() > deadline:
+            return await serve_file(download_id, request)
+        await asyncio.sleep(0.2)
+        job = await job_store.get(download_id) or {}
+
+    partial = Path(settings.DOWNLOADS_DIR) / job["partial_filename"]
+    try:
+        f = await aiofiles.open(partial, "rb")
+    except FileNotFoundError:
+        # Already renamed to its final name — the download just finished
+        return await serve_file(download_id, request)
+
+    finished = False
+
+    async def tail():
+        nonlocal finished
+        with progress_hub.subscribe(download_id) as sub:
+            try:
+                done = False
+                while True:
+                    chunk = await f.read(settings.STREAM_CHUNK_SIZE)
+                    if chunk:
+                        yield chunk
+                        continue
+                    if done:
+                        break
+                    # At the end of what's on disk — wait for the worker to write more
+                    await sub.get(timeout=0.5)
+                    status = ((await job_store.get(download_id)) or {}).get("status")
+                    if status == "completed":
+                        done = True  # drain whatever is left, then stop
+                    elif status not in ("pending", "downloading", "processing"):
+                        # Abort the response so the browser marks the download as failed
+                        raise RuntimeError(f"Download {download_id} ended with status {status}")
+                finished = True
+            finally:
+                await f.close()
+
     def cleanup():
-        """Runs after the file response is sent — deletes the file and job data."""
-        try:
-            if os.path.exists(str(filepath)):
-                os.remove(str(filepath))
-            delete_job(download_id)
-        except OSError:
-            pass
-
-    return FileResponse(
-        path=str(filepath),
-        filename=job["filename"],
+        final = sync_job_store.get(download_id) if finished else None
+        if final and final.get("filename"):
+            cleanup_job(download_id, final, served=True)
+
+    name = Path(job["partial_filename"]).name.removesuffix(".part")
+    return StreamingResponse(
+        tail(),
         media_type="application/octet-stream",
+        headers={"Content-Disposition": _content_disposition(name)},
         background=BackgroundTask(cleanup),
     )
+
+
+async def _batch_jobs(batch: dict) -> list[dict]:
+    """Current job records of a batch's items (expired ones are skipped)."""
+    jobs = await asyncio.gather(*(job_store.get(item_id) for item_id in batch["items"]))
+    jobs = [job for job in jobs if job]
+    for job in jobs:
+        if job.get("source_id"):
+            await _follow_source(job)
+    return jobs
+
+
+def _batch_response(batch: dict, jobs: list[dict]) -> BatchResponse:
+    finished = batch["completed"] + batch["failed"] >= batch["total"]
+    return BatchResponse(
+        id=batch["id"],
+        status="completed" if finished else "downloading",
+        total=batch["total"],
+        completed=batch["completed"],
+        failed=batch["failed"],
+        items=[DownloadResponse(**job) for job in jobs],
+    )
+
+
+@router.post("/batches", response_model=BatchResponse, status_code=201)
+async def start_batch(req: StartBatchRequest, request: Request):
+    """Start one download job per URL (a playlist is expanded with flat extraction) and
+    queue them all at once; they run in parallel across the workers, interleaved
+    fairly with other clients' jobs."""
+    urls = [str(url) for url in req.urls]
+    if req.playlist_url:
+        with _extraction_errors():
+            urls += await extract_executor.run(
+                expand_playlist, str(req.playlist_url), settings.MAX_BATCH_ITEMS
+            )
+
+    unique: dict[str, str] = {}
+    for url in urls:
+        unique.setdefault(normalize_url(url), url)  # the same video twice is one item
+    if not unique:
+        raise HTTPException(status_code=422, detail="The playlist has no videos")
+    if len(unique) > settings.MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=422, detail=f"A batch can have at most {settings.MAX_BATCH_ITEMS} videos"
+        )
+
+    batch_id = str(uuid4())
+    ids = await _admit(list(unique.values()), req.format_id)
+    created = [await _create_job(download_id, url, req.format_id, batch_id=batch_id)
+               for download_id, url in zip(ids, unique.values())]
+    jobs = [job for job, _ in created]
+    # The batch record must exist before any item can finish and bump its counters
+    await batch_store.create(batch_id, req.format_id, [job["id"] for job in jobs])
+
+    await asyncio.to_thread(_enqueue, [job for job, needs_task in created if needs_task], _client(request))
+    for job, needs_task in created:
+        if not needs_task:
+            await _follow_source(job)
+
+    return _batch_response(await batch_store.get(batch_id), jobs)
+
+
+@router.get("/batches/{batch_id}", response_model=BatchResponse)
+async def get_batch(batch_id: str):
+    """Aggregate batch state (counters) plus the state of every item."""
+    batch = await batch_store.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    jobs = await _batch_jobs(batch)
+    # Following shared downloads may have just finished some items
+    return _batch_response(await batch_store.get(batch_id) or batch, jobs)
+
+
+@router.get("/batches/{batch_id}/zip")
+async def batch_zip(batch_id: str):
+    """All finished files of a batch as one ZIP, generated while it is sent — no second
+    copy is written to disk. Once the whole archive has been delivered the files and
+    the batch are deleted; an interrupted transfer leaves them for SERVE_GRACE_TTL."""
+    batch = await batch_store.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    if batch["completed"] + batch["failed"] < batch["total"]:
+        raise HTTPException(status_code=409, detail="Batch is still downloading")
+
+    files = []
+    for job in await _batch_jobs(batch):
+        if job.get("status") == "completed" and job.get("filename"):
+            if job.get("node"):
+                # Fetched from its worker while the archive is written
+                files.append((job, node_files.iter_file(job["node"], job_relpath(job), settings.STREAM_CHUNK_SIZE)))
+                continue
+            path = job_filepath(job)
+            if path.exists():
+                files.append((job, path))
+    if not files:
+        raise HTTPException(status_code=404, detail="No files available")
+
+    for job, _ in files:
+        await _schedule_grace_cleanup(job["id"], job)
+
+    names = unique_names(job["filename"] for job, _ in files)
+    sent_all = False
+
+    def archive():
+        # Sync generator: Starlette iterates it in a thread, so file reads don't block the loop
+        nonlocal sent_all
+        for chunk in stream_zip(zip(names, (source for _, source in files)), settings.STREAM_CHUNK_SIZE):
+            if chunk:
+                yield chunk
+        sent_all = True
+
+    def after_send():
+        if sent_all:
+            for job, _ in files:
+                cleanup_job(job["id"], job, served=True)
+            sync_batch_store.delete(batch_id)
+
+    return StreamingResponse(
+        _holding_deadline([job for job, _ in files], iterate_in_threadpool(archive())),
+        media_type="application/zip",
+        headers={"Content-Disposition": _content_disposition(f"batch-{batch_id[:8]}.zip")},
+        background=BackgroundTask(after_send),
+    )
@@ -1,19 +1,20 @@
 """
 SSE (Server-Sent Events) endpoint for real-time download progress.
 
-The frontend opens an EventSource connection to this endpoint. The server subscribes
-to a Redis Pub/Sub channel and forwards progress updates as SSE events. This gives
-the user a live progress bar, download speed, and ETA without polling.
+The frontend opens an EventSource connection to this endpoint. Progress updates
+published by the Celery worker arrive through the process-wide progress hub (one
+shared Redis Pub/Sub connection) and are forwarded as SSE events the moment they
+land. This gives the user a live progress bar, download speed, and ETA without polling.
 """
 
-import asyncio
-import json
-
-import redis.asyncio as aioredis
 from fastapi import APIRouter
 from sse_starlette.sse import EventSourceResponse
 
 from app.config import settings
+from app.utils import metrics
+from app.utils.job_store import job_store, progress_key
+from app.utils.progress_hub import make_frame, progress_hub
+from app.utils.redis_pool import async_redis
 
 router = APIRouter(prefix="/api")
 
@@ -23,35 +24,42 @@ async def download_progress(download_id: str):
     """Stream real-time progress events for a download via SSE."""
 
     async def event_generator():
-        r = aioredis.from_url(settings.REDIS_URL)
-        pubsub = r.pubsub()
-        await pubsub.subscribe(f"dl:progress:{download_id}")
+        # Jobs attached to a shared download follow the owner's progress channel,
+        # unless their own snapshot already says they're done
+        channel_id = download_id
+        job = await job_store.get(download_id)
+        if job and job.get("source_id") and job.get("status") != "completed":
+            channel_id = job["source_id"]
 
-        # Send the latest snapshot immediately so late-connecting clients catch up
-        current = await r.get(f"dl:progress:{download_id}")
-        if current:
-            yield {"event": "progress", "data": current.decode()}
+        # Subscribe before reading the snapshot so no event falls in between
+        with progress_hub.subscribe(channel_id) as sub:
+            # Send the latest snapshot immediately so late-connecting clients catch up
+            current = await async_redis.get(progress_key(channel_id))
+            if current:
+                frame = make_frame(current.decode())
+                yield {"event": "progress", "data": frame.payload}
+                if frame.terminal:
+                    return
 
-        try:
             while True:
-                # Wait for new messages published by the Celery worker
-                message = await pubsub.get_message(
-                    ignore_subscribe_messages=True, timeout=1.0
-                )
-                if message and message["type"] == "message":
-                    data = json.loads(message["data"])
-                    yield {"event": "progress", "data": json.dumps(data)}
-
-                    # Stop streaming once download finishes or fails
-                    if data.get("status") in ("completed", "failed"):
-                        break
-                else:
+                frame = await sub.get(timeout=settings.SSE_HEARTBEAT_INTERVAL)
+                if frame is None:
                     # Send a heartbeat to keep the connection alive
                     yield {"event": "heartbeat", "data": ""}
+                    continue
+
+                yield {"event": "progress", "data": frame.payload}
 
-                await asyncio.sleep(0.5)
+                # Stop streaming once download finishes or fails
+                if frame.terminal:
+                    break
+
+    async def counted():
+        metrics.SSE_STREAMS.inc()
+        try:
+            async for event in event_generator():
+                yield event
         finally:
-            await pubsub.unsubscribe(f"dl:progress:{download_id}")
-            await r.aclose()
+            metrics.SSE_STREAMS.dec()
 
-    return EventSourceResponse(event_generator())
+    return EventSourceResponse(counted())
@@ -0,0 +1,67 @@
+"""
+GET /metrics — Prometheus scrape endpoint.
+
+Stage timings (queue wait, extraction, transfer, merge, serve), bytes per site and
+download outcomes come from utils/metrics.py; worker-side series are summed over
+every worker through Redis. Queue depth, running jobs, extraction backlog, open
+progress streams and the Redis round-trip time are measured when scraped.
+
+Not under /api, so nginx doesn't proxy it, and docker-compose publishes the backend
+port on the loopback interface only. Wherever the port is reachable by others, set
+METRICS_TOKEN: scrapes must then send it as a bearer token.
+"""
+
+import asyncio
+import hmac
+import json
+import time
+
+from fastapi import APIRouter, HTTPException, Request
+from starlette.responses import Response
+
+from app.config import settings
+
+from app.services import scheduler
+from app.services.extract_executor import extract_executor
+from app.utils import metrics
+from app.utils.progress_hub import progress_hub
+from app.utils.redis_pool import sync_redis
+
+router = APIRouter()
+
+
+def _queue_depth() -> dict:
+    waiting = {lane: 0 for lane in scheduler.LANES}
+    for raw in sync_redis.hvals(scheduler.WAITING):
+        waiting[json.loads(raw)["lane"]] += 1
+    return {(("lane", lane),): count for lane, count in waiting.items()}
+
+
+def _running() -> dict:
+    running = sync_redis.hgetall(scheduler.RUNNING)
+    return {(("lane", lane),): int(running.get(lane.encode(), 0)) for lane in scheduler.LANES}
+
+
+def _redis_rtt() -> dict:
+    started = time.perf_counter()
+    sync_redis.ping()
+    return {(): time.perf_counter() - started}
+
+
+metrics.Gauge("dl_queue_depth", "Jobs waiting in the scheduler", collect=_queue_depth)
+metrics.Gauge("dl_running_jobs", "Jobs dispatched to workers and not finished", collect=_running)
+metrics.Gauge("dl_extract_queue_depth", "Extractions waiting for a worker",
+              collect=lambda: {(): extract_executor.queue_length})
+_subscribers = metrics.Gauge("dl_progress_subscribers", "SSE/WebSocket subscriptions on the progress hub")
+metrics.Gauge("dl_redis_rtt_seconds", "Round-trip time of a Redis PING", collect=_redis_rtt)
+
+
+@router.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """All metrics in the Prometheus text format."""
+    token = request.headers.get("authorization", "")
+    if settings.METRICS_TOKEN and not hmac.compare_digest(token, f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    _subscribers.set(progress_hub.subscriber_count)  # read on the event loop, which owns the hub
+    body = await asyncio.to_thread(metrics.render)
+    return Response(body, media_type="text/plain; version=0.0.4")
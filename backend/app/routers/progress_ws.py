@@ -0,0 +1,212 @@
+"""
+WebSocket endpoint for watching the progress of many downloads over one connection.
+
+SSE needs one connection per download, and browsers allow only ~6 per host over
+HTTP/1.1. Here a client opens a single socket and sends JSON commands:
+
+  {"action": "subscribe",   "ids": ["<download id>", ...]}
+  {"action": "unsubscribe", "ids": [...]}
+  {"action": "rate",        "max_per_second": 2}
+
+and receives
+  {"type": "progress", "updates": {"<id>": <snapshot>, ...}}
+plus "subscribed"/"unsubscribed"/"error" replies. Snapshots are the dl:progress:{id}
+JSON, unchanged. Updates arriving between two sends are coalesced (latest snapshot per
+id wins) and sent at most `rate` times per second; completed/failed snapshots are sent
+right away and end that id's subscription.
+
+Like SSE, events come from the process-wide progress hub — no Redis connection per socket.
+"""
+
+import asyncio
+import contextlib
+import json
+import time
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.config import settings
+from app.utils import metrics
+from app.utils.job_store import job_store, progress_key
+from app.utils.progress_hub import Frame, make_frame, progress_hub
+from app.utils.redis_pool import async_redis
+
+router = APIRouter(prefix="/api")
+
+
+class _Tap:
+    """Hub subscriber for one watched download; forwards frames to the socket's watcher."""
+
+    __slots__ = ("download_id", "channel_id", "watcher")
+
+    def __init__(self, download_id: str, channel_id: str, watcher: "_Watcher"):
+        self.download_id = download_id  # the id the client asked for
+        self.channel_id = channel_id    # where its events come from (owner for shared jobs)
+        self.watcher = watcher
+
+    def push(self, frame: Frame) -> None:
+        self.watcher.offer(self.download_id, frame)
+
+
+class _Watcher:
+    """Per-socket state: which downloads are watched and what is waiting to be sent."""
+
+    def __init__(self):
+        self.interval = 1 / settings.WS_MAX_RATE
+        self.taps: dict[str, _Tap] = {}
+        self._updates: dict[str, Frame] = {}  # latest unsent snapshot per download
+        self._replies: list[str] = []
+        self._pending = asyncio.Event()       # something to send
+        self._urgent = asyncio.Event()        # something to send without waiting for the tick
+        self._last_sent = 0.0
+
+    def add(self, download_id: str, channel_id: str) -> None:
+        tap = _Tap(download_id, channel_id, self)
+        self.taps[download_id] = tap
+        progress_hub.watch(channel_id, tap)
+
+    def remove(self, download_id: str) -> None:
+        tap = self.taps.pop(download_id, None)
+        if tap is not None:
+            progress_hub.unwatch(tap.channel_id, tap)
+        self._updates.pop(download_id, None)
+
+    def close(self) -> None:
+        for download_id in list(self.taps):
+            self.remove(download_id)
+
+    def offer(self, download_id: str, frame: Frame) -> None:
+        if download_id not in self.taps:
+            return
+        queued = self._updates.get(download_id)
+        if queued is not None and queued.terminal:
+            return  # nothing comes after completed/failed
+        self._updates[download_id] = frame
+        self._pending.set()
+        if frame.terminal:
+            self._urgent.set()
+
+    def reply(self, message: dict) -> None:
+        self._replies.append(json.dumps(message))
+        self._pending.set()
+        self._urgent.set()
+
+    async def wait(self) -> None:
+        """Block until there is something to send, then until the next tick is due
+        (or right away for terminal states and command replies)."""
+        await self._pending.wait()
+        delay = self.interval - (time.monotonic() - self._last_sent)
+        if delay > 0 and not self._urgent.is_set():
+            try:
+                await asyncio.wait_for(self._urgent.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def drain(self) -> list[str]:
+        """Messages to send now, in order; finished downloads are unsubscribed."""
+        messages, self._replies = self._replies, []
+        if self._updates:
+            updates, self._updates = self._updates, {}
+            # Snapshots are already JSON — splice them in instead of re-encoding
+            body = ",".join(f"{json.dumps(i)}:{frame.payload}" for i, frame in updates.items())
+            messages.append(f'{{"type":"progress","updates":{{{body}}}}}')
+            for download_id, frame in updates.items():
+                if frame.terminal:
+                    self.remove(download_id)
+        self._pending.clear()
+        self._urgent.clear()
+        self._last_sent = time.monotonic()
+        return messages
+
+
+async def _subscribe(watcher: _Watcher, ids: list[str]) -> None:
+    ids = [i for i in dict.fromkeys(ids) if i not in watcher.taps]
+    room = settings.WS_MAX_SUBSCRIPTIONS - len(watcher.taps)
+    if len(ids) > room:
+        watcher.reply({"type": "error", "detail": "Too many subscriptions", "ids": ids[room:]})
+        ids = ids[:room]
+
+    jobs = await asyncio.gather(*(job_store.get(i) for i in ids))
+    found, missing = [], []
+    for download_id, job in zip(ids, jobs):
+        if not job:
+            missing.append(download_id)
+            continue
+        # Jobs attached to a shared download follow the owner's channel until they're done
+        channel_id = download_id
+        if job.get("source_id") and job.get("status") != "completed":
+            channel_id = job["source_id"]
+        watcher.add(download_id, channel_id)  # before reading the snapshot, so nothing falls in between
+        found.append(download_id)
+    if missing:
+        watcher.reply({"type": "error", "detail": "Download not found or expired", "ids": missing})
+    if not found:
+        return
+
+    watcher.reply({"type": "subscribed", "ids": found})
+    snapshots = await async_redis.mget([progress_key(watcher.taps[i].channel_id) for i in found])
+    for download_id, current in zip(found, snapshots):
+        if current:
+            watcher.offer(download_id, make_frame(current.decode()))
+
+
+async def _handle(watcher: _Watcher, text: str) -> None:
+    try:
+        message = json.loads(text)
+        action = message["action"]
+    except (ValueError, TypeError, KeyError):
+        watcher.reply({"type": "error", "detail": "Expected a JSON object with an action"})
+        return
+
+    if action in ("subscribe", "unsubscribe"):
+        ids = message.get("ids")
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            watcher.reply({"type": "error", "detail": "ids must be a list of download ids"})
+        elif action == "subscribe":
+            await _subscribe(watcher, ids)
+        else:
+            for download_id in ids:
+                watcher.remove(download_id)
+            watcher.reply({"type": "unsubscribed", "ids": ids})
+    elif action == "rate":
+        rate = message.get("max_per_second")
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            watcher.reply({"type": "error", "detail": "max_per_second must be a positive number"})
+        else:
+            watcher.interval = 1 / min(rate, settings.WS_MAX_RATE)
+    else:
+        watcher.reply({"type": "error", "detail": f"Unknown action {action!r}"})
+
+
+async def _send_loop(websocket: WebSocket, watcher: _Watcher) -> None:
+    # The only task that writes to the socket — command replies go through the watcher too
+    while True:
+        await watcher.wait()
+        for message in watcher.drain():
+            await websocket.send_text(message)
+
+
+@router.websocket("/progress/ws")
+async def progress_socket(websocket: WebSocket):
+    """Multiplexed progress for any number of downloads on one socket."""
+    await websocket.accept()
+    metrics.WS_CONNECTIONS.inc()
+    watcher = _Watcher()
+    sender = asyncio.create_task(_send_loop(websocket, watcher))
+    try:
+        while True:
+            receive = asyncio.ensure_future(websocket.receive_text())
+            # Stop reading if sending failed (client went away mid-send)
+            done, _ = await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                receive.cancel()
+                break
+            await _handle(watcher, receive.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        watcher.close()
+        metrics.WS_CONNECTIONS.dec()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await sender  # collect a send error, if that's what ended the loop
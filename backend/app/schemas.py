@@ -3,7 +3,7 @@ Pydantic schemas for API request/response validation.
 These define the shape of data flowing between the frontend and backend.
 """
 
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, model_validator
 from typing import Optional
 
 
@@ -18,6 +18,31 @@ class StartDownloadRequest(BaseModel):
     """POST /api/downloads — user picks a format and starts downloading."""
     url: HttpUrl
     format_id: str
+    stream: bool = False                   # Allow GET /stream to send bytes while still downloading
+    start_time: Optional[float] = None     # Clip: only download from here (seconds)...
+    end_time: Optional[float] = None       # ...to here
+    audio_only: bool = False               # Only the audio stream, in its own codec (no re-encode)
+
+    @model_validator(mode="after")
+    def _valid_clip(self):
+        if self.start_time is not None and self.start_time < 0:
+            raise ValueError("start_time can't be negative")
+        if self.end_time is not None and self.end_time <= (self.start_time or 0):
+            raise ValueError("end_time must be after start_time")
+        return self
+
+
+class StartBatchRequest(BaseModel):
+    """POST /api/batches — download several videos (and/or a whole playlist) in one go."""
+    urls: list[HttpUrl] = []
+    playlist_url: Optional[HttpUrl] = None  # Expanded into its videos server-side
+    format_id: str = "bestvideo+bestaudio/best"
+
+    @model_validator(mode="after")
+    def _not_empty(self):
+        if not self.urls and not self.playlist_url:
+            raise ValueError("Give at least one of urls or playlist_url")
+        return self
 
 
 # --- Data schemas ---
@@ -57,3 +82,34 @@ class DownloadResponse(BaseModel):
     status: str                            # pending | downloading | processing | completed | failed
     progress: float                        # 0-100
     error_message: Optional[str] = None
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    audio_only: bool = False
+    queue_position: Optional[int] = None   # Jobs ahead of this one while it waits for a slot
+    estimated_start: Optional[float] = None  # Unix time the job is expected to start (while waiting)
+
+
+class TraceEvent(BaseModel):
+    """One step of a download's timeline (see utils/trace.py)."""
+    event: str                             # queued, picked_up, extracted, first_byte, ..., served
+    at_ms: int                             # Milliseconds since the job was queued
+    delta_ms: int                          # ...since the previous event
+    detail: Optional[dict] = None          # e.g. {"attempt": 2}, {"step": "Merger"}
+
+
+class TraceResponse(BaseModel):
+    """Timing trace of a download — returned by GET /api/downloads/{id}/trace."""
+    id: str
+    status: Optional[str] = None
+    queued_at: Optional[float] = None      # Unix time
+    events: list[TraceEvent]
+
+
+class BatchResponse(BaseModel):
+    """Aggregate state of a batch — returned by POST and GET /api/batches."""
+    id: str
+    status: str                            # downloading | completed (every item finished or failed)
+    total: int
+    completed: int
+    failed: int
+    items: list[DownloadResponse] = []
@@ -0,0 +1,258 @@
+"""
+Bandwidth shaping for a worker's downloads (WORKER_BANDWIDTH / JOB_BANDWIDTH > 0).
+
+Every running download gets a token bucket. The transfer threads pay for the bytes
+they read as they go (yt-dlp's own downloaders through a progress hook, the segmented
+downloader per chunk) and sleep when the bucket is in debt, so a job never runs faster
+than its bucket's rate, averaged over BURST seconds.
+
+With WORKER_BANDWIDTH the rates are rebalanced every REBALANCE_INTERVAL so that the
+downloads of one worker host — all of its processes — share the budget max-min fairly:
+
+  - each job reports its demand: unbounded if it used (nearly) all of its last rate,
+    otherwise a little more than it used (it is held back by the origin, or merging);
+  - jobs asking for less than an equal share get what they ask for, and what they
+    leave is split between the others; whatever is left over after that goes to
+    everybody, so the rates always add up to the budget;
+  - jobs with less than BANDWIDTH_FINISH_BYTES left count BANDWIDTH_FINISH_BOOST
+    times in the split, so small downloads and the tails of big ones finish quickly
+    instead of crawling alongside a 4K job.
+
+The processes of a host coordinate through one Redis hash, each writing its own jobs'
+demands and reading everyone's. An entry not refreshed for STALE_AFTER belongs to a
+process that died, and is dropped. JOB_BANDWIDTH alone is a fixed per-job cap and
+needs no coordination.
+
+Key:
+  dl:bw:{node}  — Hash download id → {"demand": bytes/s or null (unbounded), "weight", "at"}
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app.config import settings
+from app.utils.redis_pool import sync_redis
+
+logger = logging.getLogger(__name__)
+
+REBALANCE_INTERVAL = 1.0  # seconds between rebalances (and demand measurements)
+STALE_AFTER = 5.0         # seconds before another process's unrefreshed entry is ignored
+BURST = 0.5               # seconds of unused rate a bucket may save up
+SATURATED = 0.9           # a job using this much of its rate wants more
+HEADROOM = 1.25           # demand of an unsaturated job, relative to what it used
+MIN_RATE = 64 * 1024      # bytes/s every job keeps, so a stalled one can ramp up again
+READ_SIZE = 64 * 1024     # read size for yt-dlp's downloaders while shaped
+
+
+def shares_key() -> str:
+    return f"dl:bw:{settings.node_url}"
+
+
+class Bucket:
+    """One download's token bucket. Thread-safe; consume() blocks."""
+
+    def __init__(self, download_id: str, rate: float):
+        self.download_id = download_id
+        self.rate = rate
+        self.demand = math.inf  # until measured
+        self._tokens = rate * BURST
+        self._stamp = time.monotonic()
+        self._used = 0
+        self._measured_at = self._stamp
+        self._seen: dict[str, int] = {}  # file → bytes already paid for (progress hook)
+        self._left: dict[str, int] = {}  # file → bytes still to fetch
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._tokens + (now - self._stamp) * self.rate, self.rate * BURST)
+        self._stamp = now
+
+    def consume(self, n: int, key: str = "", left: int | None = None) -> None:
+        """Pay for `n` bytes of file `key` (with `left` bytes to go), sleeping off any debt."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= n
+            self._used += n
+            if left is not None:
+                self._left[key] = max(left, 0)
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def hook(self, d: dict) -> None:
+        """yt-dlp progress hook: pays for the bytes read since the file's last report.
+        Called on the thread doing the transfer, so sleeping here slows it down."""
+        if d.get("status") != "downloading":
+            return
+        key = d.get("tmpfilename") or d.get("filename") or ""
+        downloaded = d.get("downloaded_bytes") or 0
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        with self._lock:
+            previous = self._seen.get(key)
+            self._seen[key] = max(previous or 0, downloaded)
+        # The first report may include bytes resumed from disk — start counting there
+        n = max(downloaded - previous, 0) if previous is not None else 0
+        self.consume(n, key, int(total - downloaded) if total else None)
+
+    def remaining(self) -> int | None:
+        """Bytes the download still has to fetch, if known."""
+        with self._lock:
+            return sum(self._left.values()) if self._left else None
+
+    def measure(self) -> None:
+        """Update the demand from what was used since the last measurement."""
+        now = time.monotonic()
+        elapsed = now - self._measured_at
+        if elapsed < REBALANCE_INTERVAL / 2:
+            return  # too short to tell (a rebalance right after a job started or ended)
+        with self._lock:
+            used, self._used = self._used, 0
+        self._measured_at = now
+        speed = used / elapsed
+        self.demand = math.inf if speed >= SATURATED * self.rate else max(speed * HEADROOM, MIN_RATE)
+
+    def weight(self) -> float:
+        left = self.remaining()
+        return settings.BANDWIDTH_FINISH_BOOST if left is not None and left <= settings.BANDWIDTH_FINISH_BYTES else 1.0
+
+
+def fair_shares(capacity: float, jobs: dict[str, tuple[float, float]]) -> dict[str, float]:
+    """Weighted max-min fair split of `capacity` between jobs (id → (demand, weight)).
+    Capacity no job asks for is split by weight too, so the shares add up to it."""
+    if not jobs:
+        return {}
+    shares: dict[str, float] = {}
+    left = dict(jobs)
+    remaining = capacity
+    while left:
+        unit = remaining / sum(weight for _, weight in left.values())
+        satisfied = {i: demand for i, (demand, weight) in left.items() if demand <= unit * weight}
+        if not satisfied:
+            break
+        for download_id, demand in satisfied.items():
+            shares[download_id] = demand
+            remaining -= demand
+            del left[download_id]
+    rest = left or jobs  # the unsatisfied jobs, or everybody if there is capacity to spare
+    total_weight = sum(weight for _, weight in rest.values())
+    for download_id, (_, weight) in rest.items():
+        shares[download_id] = shares.get(download_id, 0) + max(remaining, 0) * weight / total_weight
+    return shares
+
+
+class _Shaper:
+    """This process's buckets, and the thread that rebalances them."""
+
+    def __init__(self):
+        self._buckets: dict[str, Bucket] = {}
+        self._ended: list[str] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid: int | None = None  # the thread doesn't survive a fork — restart it in children
+
+    def add(self, download_id: str) -> Bucket:
+        cap = settings.JOB_BANDWIDTH or math.inf
+        if settings.WORKER_BANDWIDTH:
+            # Safe until the first rebalance: an equal split between as many jobs as the worker runs
+            cap = min(cap, settings.WORKER_BANDWIDTH / max(settings.worker_concurrency, 1))
+        bucket = Bucket(download_id, cap)
+        if settings.WORKER_BANDWIDTH:
+            with self._lock:
+                self._buckets[download_id] = bucket
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name="bandwidth", daemon=True).start()
+            self._wake.set()
+        return bucket
+
+    def remove(self, download_id: str) -> None:
+        with self._lock:
+            if self._buckets.pop(download_id, None) is not None:
+                self._ended.append(download_id)
+                self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(REBALANCE_INTERVAL)
+            self._wake.clear()
+            try:
+                self.rebalance()
+            except Exception:
+                logger.exception("Could not rebalance download bandwidth")
+
+    def rebalance(self) -> None:
+        """Publish this process's demands, read the host's, and set our buckets' rates."""
+        with self._lock:
+            buckets = dict(self._buckets)
+            ended, self._ended = self._ended, []
+        if not buckets and not ended:
+            return
+        now = time.time()
+        key = shares_key()
+        pipe = sync_redis.pipeline(transaction=False)
+        if buckets:
+            for bucket in buckets.values():
+                bucket.measure()
+            pipe.hset(key, mapping={
+                download_id: json.dumps({
+                    "demand": None if math.isinf(bucket.demand) else bucket.demand,
+                    "weight": bucket.weight(),
+                    "at": now,
+                })
+                for download_id, bucket in buckets.items()
+            })
+        if ended:
+            pipe.hdel(key, *ended)
+        pipe.expire(key, int(STALE_AFTER * 4))
+        pipe.hgetall(key)
+        try:
+            entries = pipe.execute()[-1]
+        except Exception:
+            with self._lock:
+                self._ended.extend(ended)  # try again next time
+            raise
+        if not buckets:
+            return
+
+        jobs, stale = {}, []
+        for raw_id, raw in entries.items():
+            entry = json.loads(raw)
+            if now - entry["at"] > STALE_AFTER:
+                stale.append(raw_id)
+                continue
+            demand = math.inf if entry["demand"] is None else entry["demand"]
+            jobs[raw_id.decode()] = (min(demand, settings.JOB_BANDWIDTH or math.inf), entry["weight"])
+        if stale:
+            sync_redis.hdel(key, *stale)
+
+        shares = fair_shares(settings.WORKER_BANDWIDTH, jobs)
+        floor = min(MIN_RATE, settings.WORKER_BANDWIDTH / max(len(jobs), 1))
+        for download_id, bucket in buckets.items():
+            share = shares.get(download_id, settings.WORKER_BANDWIDTH / max(len(jobs), 1))
+            bucket.set_rate(max(min(share, settings.JOB_BANDWIDTH or math.inf), floor))
+
+
+_shaper = _Shaper()
+
+
+@contextmanager
+def shaped(download_id: str):
+    """The download's bucket while the block runs, or None if shaping is off."""
+    if not settings.WORKER_BANDWIDTH and not settings.JOB_BANDWIDTH:
+        yield None
+        return
+    bucket = _shaper.add(download_id)
+    try:
+        yield bucket
+    finally:
+        _shaper.remove(download_id)
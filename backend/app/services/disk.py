@@ -0,0 +1,97 @@
+"""
+Disk-space admission control for DOWNLOADS_DIR.
+
+Without it every accepted job runs until the volume is full, and then all of them
+fail at once (ENOSPC halfway through, or worse, during the ffmpeg merge). So:
+
+  - POST /downloads and /batches reserve each new job's expected size (the
+    extraction's filesize / filesize_approx) against the free space, keeping
+    MIN_FREE_BYTES spare. If the reservations don't fit, the request gets 507.
+  - A reservation lasts until the task ends — by then the bytes are on disk (and
+    counted by the filesystem) or the job failed.
+  - The scheduler holds waiting jobs back while free space is below MIN_FREE_BYTES
+    (sizes are estimates, and unknown sizes reserve nothing), so the queue drains
+    again once the janitor or served downloads have freed space.
+
+With NODE_LOCAL_STORAGE the files are on the workers' disks, so each worker reports
+its own usable space and the budget is their sum (a job may land on any node).
+
+Keys:
+  dl:disk:reserved     — Hash download id → reserved bytes
+  dl:disk:node:{node}  — usable bytes on one worker (worker-local storage; expires if it stops reporting)
+"""
+
+import shutil
+
+from app.config import settings
+from app.utils.formats import expected_download
+from app.utils.info_store import load_info
+from app.utils.redis_pool import sync_redis
+
+RESERVED = "dl:disk:reserved"
+NODE_PREFIX = "dl:disk:node:"
+REPORT_INTERVAL = 15  # seconds between a node's free-space reports
+
+# KEYS: reserved; ARGV: available bytes, then id/bytes pairs.
+# All-or-nothing, so a batch is either admitted whole or not at all.
+_RESERVE_LUA = """
+local total = 0
+for _, v in ipairs(redis.call('HVALS', KEYS[1])) do total = total + tonumber(v) end
+for i = 3, #ARGV, 2 do total = total + tonumber(ARGV[i]) end
+if total > tonumber(ARGV[1]) then return 0 end
+if #ARGV > 1 then redis.call('HSET', KEYS[1], unpack(ARGV, 2)) end
+return 1
+"""
+
+_reserve = sync_redis.register_script(_RESERVE_LUA)
+
+
+def free_bytes() -> int:
+    return shutil.disk_usage(settings.DOWNLOADS_DIR).free
+
+
+def report_free_space() -> None:
+    """Worker-local storage: publish this node's usable space (called every REPORT_INTERVAL)."""
+    sync_redis.set(NODE_PREFIX + settings.node_url, free_bytes() - settings.MIN_FREE_BYTES,
+                   ex=REPORT_INTERVAL * 4)
+
+
+def available_bytes() -> int:
+    """Space new downloads may use: above MIN_FREE_BYTES on the shared volume, or summed
+    over the nodes that reported recently with worker-local storage."""
+    if not settings.NODE_LOCAL_STORAGE:
+        return free_bytes() - settings.MIN_FREE_BYTES
+    keys = list(sync_redis.scan_iter(match=NODE_PREFIX + "*", count=100))
+    return sum(max(int(v), 0) for v in sync_redis.mget(keys) if v) if keys else 0
+
+
+def has_room() -> bool:
+    """Whether new downloads may start (the free-space floor isn't reached)."""
+    return available_bytes() > 0
+
+
+def estimate(url: str, format_id: str, **options) -> int:
+    """Expected size of a download (with its clip/audio options), from the info_dict
+    /api/extract stored (0 if unknown)."""
+    info = load_info(url, require_fresh=False)
+    return expected_download(info, format_id, **options)[1] if info else 0
+
+
+def reserve(sizes: dict[str, int]) -> bool:
+    """Reserve space for new jobs (download id → bytes). False if they don't all fit."""
+    available = available_bytes()
+    if available <= 0:
+        return False
+    args = [available]
+    for download_id, size in sizes.items():
+        args += [download_id, int(size)]
+    return bool(_reserve(keys=[RESERVED], args=args))
+
+
+def release(*download_ids: str) -> None:
+    if download_ids:
+        sync_redis.hdel(RESERVED, *download_ids)
+
+
+def reserved() -> dict[str, int]:
+    return {k.decode(): int(v) for k, v in sync_redis.hgetall(RESERVED).items()}
@@ -0,0 +1,190 @@
+"""
+Dedicated, bounded executor for yt-dlp extractions.
+
+asyncio.to_thread() shares the default executor with everything else and has no
+limit, so a burst of slow sites could tie up every thread and hang the API. This
+executor has its own EXTRACT_WORKERS workers and accepts at most EXTRACT_QUEUE_DEPTH
+waiting extractions on top of that — beyond that callers get ExtractorOverloaded
+(→ 503 + Retry-After) immediately instead of queueing forever.
+
+With EXTRACT_POOL="process" the workers are long-lived processes (real multi-core
+extraction instead of GIL-bound threads). Each one preloads yt-dlp when it starts (the
+pool's initializer) and is replaced after EXTRACT_RECYCLE_AFTER extractions; start()
+creates the pool when the API boots. "thread" keeps everything in the API process.
+
+Each call has a deadline (EXTRACT_TIMEOUT). A call that misses it is cancelled if it
+hasn't started yet, or abandoned if it has — the worker finishes on its own (yt-dlp's
+socket timeout bounds it) and keeps counting against the limit until it does.
+
+If a worker process dies (OOM kill, a crash in a native dependency) the process pool
+is broken for good; it is replaced by a fresh one, and the calls that were on it get
+ExtractorOverloaded so clients retry shortly instead of seeing an extraction error.
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, TypeVar
+
+from app.config import settings
+from app.services.extract_worker import warm_up
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ExtractorOverloaded(Exception):
+    """Too many extractions queued — try again after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Extraction queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ExtractionTimeout(Exception):
+    """The extraction didn't finish within EXTRACT_TIMEOUT."""
+
+
+def _timed(fn: Callable[..., T], args: tuple) -> tuple[float, T]:
+    """Runs in the pool: call fn and report (wall-clock) when it actually started."""
+    return time.time(), fn(*args)
+
+
+def _make_pool(mode: str, workers: int, recycle_after: int) -> Executor:
+    if mode == "process":
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),  # don't fork the event loop
+            initializer=warm_up,
+            max_tasks_per_child=recycle_after,
+        )
+    if mode == "thread":
+        return ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="extract", initializer=warm_up
+        )
+    raise ValueError(f"EXTRACT_POOL must be 'process' or 'thread', not {mode!r}")
+
+
+class ExtractExecutor:
+    def __init__(self, workers: int, queue_depth: int, timeout: float,
+                 mode: str = "thread", recycle_after: int = 100):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.mode = mode
+        self._recycle_after = recycle_after
+        self._pool: Executor | None = None  # created lazily, so importing this spawns nothing
+        self._lock = threading.Lock()
+        self._outstanding = 0  # queued + running, including abandoned ones still running
+        self._avg_wait = 0.0   # exponential moving averages, seconds
+        self._avg_run = 1.0
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            self._pool = _make_pool(self.mode, self.workers, self._recycle_after)
+        return self._pool
+
+    def start(self) -> None:
+        """Create the pool now instead of on the first request. Workers start as work
+        arrives and preload yt-dlp in the initializer — submitting warm-ups here would
+        only count against EXTRACT_RECYCLE_AFTER and recycle them early."""
+        if self._pool is None:
+            self._pool = _make_pool(self.mode, self.workers, self._recycle_after)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run `fn(*args)` on the extraction pool, bounded by queue depth and deadline.
+        In process mode `fn` and its arguments must be picklable (module-level function)."""
+        with self._lock:
+            if self._outstanding >= self.workers + self.queue_depth:
+                self.stats["rejected"] += 1
+                raise ExtractorOverloaded(self._retry_after())
+            self._outstanding += 1
+
+        enqueued = time.time()
+        pool = self.pool
+        try:
+            future = pool.submit(_timed, fn, args)
+        except BrokenProcessPool:
+            with self._lock:
+                self._outstanding -= 1
+            self._replace(pool)
+            raise ExtractorOverloaded(1)
+        future.add_done_callback(self._on_done)
+        try:
+            started, result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()  # only succeeds if it never started; otherwise it's abandoned
+            self.stats["timed_out"] += 1
+            raise ExtractionTimeout(f"Extraction took longer than {self.timeout:.0f}s")
+        except BrokenProcessPool:
+            self._replace(pool)
+            raise ExtractorOverloaded(1)
+        run_time = time.time() - started
+        with self._lock:
+            self._avg_wait += 0.1 * ((started - enqueued) - self._avg_wait)
+            self._avg_run += 0.1 * (run_time - self._avg_run)
+        metrics.EXTRACT_TIME.observe(run_time)
+        return result
+
+    def _replace(self, broken: Executor) -> None:
+        """Drop a pool a dead worker broke; the next call creates a fresh one.
+        Only the first caller that notices does it."""
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        logger.warning("An extraction worker died; replacing the pool")
+
+    def _on_done(self, future) -> None:
+        with self._lock:
+            self._outstanding -= 1
+            if not future.cancelled():
+                self.stats["failed" if future.exception() else "completed"] += 1
+
+    def _retry_after(self) -> int:
+        """Rough time until a slot frees up: the queue ahead of us drained by all workers."""
+        return max(1, math.ceil(self._avg_run * (self.queue_length + 1) / self.workers))
+
+    @property
+    def running(self) -> int:
+        return min(self._outstanding, self.workers)
+
+    @property
+    def queue_length(self) -> int:
+        return max(0, self._outstanding - self.workers)
+
+    def snapshot(self) -> dict:
+        """Queue state and timing, for the stats endpoint."""
+        return {
+            **self.stats,
+            "pool": self.mode,
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queue_length,
+            "avg_wait_seconds": round(self._avg_wait, 3),
+            "avg_run_seconds": round(self._avg_run, 3),
+        }
+
+
+extract_executor = ExtractExecutor(
+    settings.EXTRACT_WORKERS,
+    settings.EXTRACT_QUEUE_DEPTH,
+    settings.EXTRACT_TIMEOUT,
+    mode=settings.EXTRACT_POOL,
+    recycle_after=settings.EXTRACT_RECYCLE_AFTER,
+)
@@ -0,0 +1,50 @@
+"""
+Code that runs inside the extraction pool (a worker thread or a worker process).
+
+Everything here is importable without yt-dlp: ytdlp_service is only imported inside
+the pool, so the API process doesn't pay for it at startup. Functions are module-level
+so a process pool can pickle them by reference.
+"""
+
+import hashlib
+
+from app.schemas import VideoInfo
+from app.utils.profiler import profiled
+
+
+class ExtractionFailed(Exception):
+    """yt-dlp couldn't extract the URL. A plain exception with just the message, so it
+    survives the trip back from a worker process (yt-dlp's own errors may not pickle)."""
+
+
+def warm_up() -> None:
+    """Pool initializer: import yt-dlp and build the extraction YoutubeDL up front,
+    so the first request a worker handles doesn't pay for it."""
+    from app.services import ytdlp_service
+
+    ytdlp_service.extractor_ydl()
+
+
+def extract_and_store(url: str) -> VideoInfo:
+    """Extract `url` and keep the raw info_dict for the download task.
+    Profiled when the sampling profiler is on (named by a hash of the URL)."""
+    from app.services import ytdlp_service
+    from app.utils.info_store import save_info
+
+    try:
+        with profiled("extract", hashlib.sha1(url.encode()).hexdigest()[:12]):
+            info = ytdlp_service.extract_raw(url)
+    except Exception as e:
+        raise ExtractionFailed(str(e)) from None
+    save_info(url, info)
+    return ytdlp_service.to_video_info(url, info)
+
+
+def expand_playlist(url: str, limit: int) -> list[str]:
+    """Video URLs of a playlist (flat extraction), at most `limit` + 1."""
+    from app.services import ytdlp_service
+
+    try:
+        return ytdlp_service.playlist_entries(url, limit)
+    except Exception as e:
+        raise ExtractionFailed(str(e)) from None
@@ -0,0 +1,196 @@
+"""
+Background janitor for DOWNLOADS_DIR.
+
+Files are normally deleted right after they have been served, but some always slip
+through: the job record expired before anyone fetched the file, the API restarted and
+lost a grace-period timer, a worker died and its job was never retried, a download
+failed before yt-dlp could clean up. Every JANITOR_INTERVAL seconds one worker (a
+Redis lock keeps it to one per interval across the cluster) reconciles the directory
+against the live job records:
+
+  - completed jobs whose serve deadline has passed are cleaned up like a served file;
+  - speculative prefetches nobody claimed within PREFETCH_TTL are cancelled, and
+    prefetch directories no job refers to are deleted once untouched for STALE_PARTIAL_AGE;
+  - finished files no job refers to are deleted once older than ORPHAN_FILE_AGE;
+  - partial files (.part, segment checkpoints, per-stream files, merge temps) are
+    deleted once untouched for STALE_PARTIAL_AGE, unless they belong to a job that is
+    still active or holds a scheduler slot (by the output stem the worker records).
+    A finished stream file can sit untouched for hours while its sibling downloads;
+  - disk reservations of jobs that no longer exist are dropped;
+  - the records of jobs waiting in the scheduler are kept alive, and scheduler slots
+    whose job is gone, finished, or was never picked up (LOST_DISPATCH_AGE) are freed.
+
+Then the shared cache is evicted and the scheduler pumped, since the queue may have
+been held back for lack of space (see services/disk.py).
+
+With NODE_LOCAL_STORAGE each worker sweeps its own disk (one lock per node) and,
+every REPORT_INTERVAL, tells the API how much space it has left.
+"""
+
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from app.config import settings
+from app.services import disk, node_files, scheduler, shared_cache
+from app.utils.job_store import ACTIVE_STATUSES, job_key, sync_job_store
+from app.utils.redis_pool import sync_redis
+from app.utils.trace import keep as keep_trace
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "dl:janitor:lock"
+LOST_DISPATCH_AGE = 3600  # seconds a dispatched job may stay pending before its slot is reclaimed
+
+# yt-dlp's temporaries (.part, .ytdl, .temp, per-format "name.f137.mp4") plus our own
+# segment checkpoints and merge outputs
+_PARTIAL_RE = re.compile(r"(\.part|\.ytdl|\.temp|\.part\.segments|\.merging\.\w+|\.f[\w-]+\.\w+)$")
+
+
+def job_relpath(job: dict) -> str:
+    """Where a finished job's file is, relative to DOWNLOADS_DIR (on its node, if any)."""
+    if job.get("shared_key"):
+        return f"shared/{job['shared_key']}/{job['filename']}"
+    if job.get("directory"):
+        return f"{job['directory']}/{job['filename']}"
+    return job["filename"]
+
+
+def job_filepath(job: dict) -> Path:
+    return Path(settings.DOWNLOADS_DIR) / job_relpath(job)
+
+
+def cleanup_job(download_id: str, job: dict, served: bool = False) -> bool:
+    """Delete a finished job's record and its file (or release its shared file).
+    Whoever deletes the record does the cleanup, so it happens exactly once.
+    The job's timing trace is kept a little longer (utils/trace.py)."""
+    if not sync_job_store.delete(download_id):
+        return False
+    keep_trace(download_id, job, served)
+    try:
+        if job.get("shared_key"):
+            shared_cache.release(job["shared_key"])
+            shared_cache.evict()
+        elif job.get("node") and job.get("filename"):
+            node_files.remove(job["node"], job_relpath(job))
+        elif job.get("directory"):
+            shutil.rmtree(Path(settings.DOWNLOADS_DIR) / job["directory"], ignore_errors=True)
+        elif job.get("filename"):
+            os.remove(job_filepath(job))
+    except (OSError, httpx.HTTPError):
+        pass  # the owning worker's janitor removes it later
+    return True
+
+
+def _live_jobs() -> dict[str, dict]:
+    jobs = {}
+    for key in sync_redis.scan_iter(match=job_key("*"), count=500):
+        download_id = key.decode().removeprefix(job_key(""))
+        job = sync_job_store.get(download_id)
+        if job:
+            jobs[download_id] = job
+    return jobs
+
+
+def sweep() -> dict[str, int]:
+    """One reconciliation pass. Returns what was removed, for logging."""
+    now = time.time()
+    from app.services import prefetch  # imports this module
+
+    removed = {"expired_jobs": 0, "prefetches": 0, "orphans": 0, "partials": 0, "reservations": 0, "slots": 0}
+
+    keep = set()
+    stems = set()  # output paths (sans extension) of running jobs, whose temporaries must stay
+    jobs = _live_jobs()
+    dispatched = {i.decode() for i in sync_redis.hkeys(scheduler.ACTIVE)}
+    for download_id, job in jobs.items():
+        deadline = job.get("serve_deadline")
+        if job.get("status") == "completed" and deadline and deadline < now:
+            if cleanup_job(download_id, job):
+                removed["expired_jobs"] += 1
+            continue
+        if job.get("prefetch") and job.get("queued_at", now) < now - settings.PREFETCH_TTL:
+            current = sync_job_store.get(download_id)
+            if current and current.get("prefetch"):  # not adopted since we listed it
+                prefetch.cancel(download_id, current, "expired")
+                removed["prefetches"] += 1
+            continue
+        if not job.get("shared_key") and not job.get("directory"):
+            keep.update(filter(None, (job.get("filename"), job.get("partial_filename"))))
+            if job.get("output_stem") and (job.get("status") in ACTIVE_STATUSES or download_id in dispatched):
+                stems.add(job["output_stem"] + ".")
+
+    # Only top-level files — shared/ is the shared cache's own business
+    with os.scandir(settings.DOWNLOADS_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False) or entry.name in keep:
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            # ctime too: yt-dlp sets mtime from the server's Last-Modified header
+            age = now - max(st.st_mtime, st.st_ctime)
+            if _PARTIAL_RE.search(entry.name):
+                if age < settings.STALE_PARTIAL_AGE or entry.name.startswith(tuple(stems)):
+                    continue
+                kind = "partials"
+            elif age < settings.ORPHAN_FILE_AGE:
+                continue  # may be a download that finished a moment ago
+            else:
+                kind = "orphans"
+            try:
+                os.remove(entry.path)
+                removed[kind] += 1
+            except FileNotFoundError:
+                pass
+
+    # Prefetch directories of jobs that are gone (cancelled before the worker noticed, or expired)
+    prefetched = Path(settings.DOWNLOADS_DIR) / "prefetch"
+    if prefetched.is_dir():
+        for path in prefetched.iterdir():
+            if path.name not in jobs and now - path.stat().st_mtime >= settings.STALE_PARTIAL_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+                removed["partials"] += 1
+
+    stale = [i for i in disk.reserved() if i not in jobs]
+    disk.release(*stale)
+    removed["reservations"] = len(stale)
+
+    scheduler.keep_waiting_alive()
+    removed["slots"] = scheduler.reconcile(LOST_DISPATCH_AGE)
+
+    shared_cache.evict()
+    scheduler.pump()
+    return removed
+
+
+def _loop() -> None:
+    # With worker-local storage every node sweeps its own disk; otherwise one sweep covers all
+    lock = f"{LOCK_KEY}:{settings.node_url}" if settings.NODE_LOCAL_STORAGE else LOCK_KEY
+    while True:
+        try:
+            if settings.NODE_LOCAL_STORAGE:
+                disk.report_free_space()
+            # The lock outlives the sweep, so the next one runs an interval later on any worker
+            if settings.JANITOR_INTERVAL > 0 and sync_redis.set(
+                lock, os.getpid(), nx=True, ex=max(settings.JANITOR_INTERVAL - 1, 1)
+            ):
+                removed = sweep()
+                if any(removed.values()):
+                    logger.info("Janitor removed %s", removed)
+        except Exception:
+            logger.exception("Janitor sweep failed")
+        time.sleep(disk.REPORT_INTERVAL if settings.NODE_LOCAL_STORAGE else settings.JANITOR_INTERVAL)
+
+
+def start() -> None:
+    """Run the janitor in a daemon thread of this process."""
+    if settings.JANITOR_INTERVAL > 0 or settings.NODE_LOCAL_STORAGE:
+        threading.Thread(target=_loop, name="janitor", daemon=True).start()
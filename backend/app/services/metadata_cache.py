@@ -0,0 +1,127 @@
+"""
+Two-tier cache for POST /api/extract results.
+
+  1. In-process LRU   — answers repeat lookups without touching the network (EXTRACT_CACHE_LOCAL_TTL)
+  2. Redis            — shared between API processes (EXTRACT_CACHE_REDIS_TTL)
+
+Entries are keyed by the normalized URL. Concurrent misses for the same key are
+collapsed into a single in-flight extraction ("single-flight"), so a viral link
+costs one yt-dlp call instead of dozens.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.schemas import VideoInfo
+from app.utils.redis_pool import async_redis
+from app.utils.urls import normalize_url
+
+
+class LRUCache:
+    """Small in-process LRU with per-entry expiry. Not thread-safe — only touched
+    from the event loop."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, VideoInfo]] = OrderedDict()
+
+    def get(self, key: str) -> VideoInfo | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: VideoInfo) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class MetadataCache:
+    def __init__(self):
+        self.local = LRUCache(settings.EXTRACT_CACHE_SIZE, settings.EXTRACT_CACHE_LOCAL_TTL)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "coalesced": 0}
+
+    async def get_or_extract(
+        self, url: str, extract: Callable[[str], Awaitable[VideoInfo]]
+    ) -> VideoInfo:
+        """Return cached info for `url`, or run `extract(url)` exactly once even if
+        many requests for the same URL arrive at the same time."""
+        key = normalize_url(url)
+
+        info = self.local.get(key)
+        if info is not None:
+            self.stats["local_hits"] += 1
+            return info.model_copy(update={"url": url})
+
+        task = self._inflight.get(key)
+        if task is not None:
+            # Someone is already fetching this URL — wait for their result
+            self.stats["coalesced"] += 1
+        else:
+            # Run the fetch as its own task so it survives the first caller disconnecting
+            task = asyncio.create_task(self._fill(key, url, extract))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        info = await asyncio.shield(task)
+        return info.model_copy(update={"url": url})
+
+    async def _fill(
+        self, key: str, url: str, extract: Callable[[str], Awaitable[VideoInfo]]
+    ) -> VideoInfo:
+        info = await self._load(key, url, extract)
+        self.local.put(key, info)
+        return info
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark as retrieved so asyncio doesn't warn when every waiter left
+
+    async def _load(
+        self, key: str, url: str, extract: Callable[[str], Awaitable[VideoInfo]]
+    ) -> VideoInfo:
+        """Redis tier, then the real extraction. Redis errors are treated as misses
+        so a Redis hiccup never fails an extraction."""
+        redis_key = f"dl:meta:{key}"
+        try:
+            raw = await async_redis.get(redis_key)
+        except RedisError:
+            raw = None
+        if raw:
+            self.stats["redis_hits"] += 1
+            return VideoInfo.model_validate_json(raw).model_copy(update={"url": url})
+
+        self.stats["misses"] += 1
+        info = await extract(url)
+        try:
+            await async_redis.set(
+                redis_key, info.model_dump_json(), ex=settings.EXTRACT_CACHE_REDIS_TTL
+            )
+        except RedisError:
+            pass
+        return info
+
+    def snapshot(self) -> dict:
+        """Counters plus current sizes, for the stats endpoint."""
+        return {**self.stats, "local_entries": len(self.local), "inflight": len(self._inflight)}
+
+
+metadata_cache = MetadataCache()
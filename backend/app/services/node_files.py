@@ -0,0 +1,164 @@
+"""
+Worker-local storage (opt-in via NODE_LOCAL_STORAGE).
+
+By default the API and the workers share one downloads volume, which ties every worker
+to the API's host (or to NFS). With NODE_LOCAL_STORAGE each worker keeps its files on
+its own disk and records where they are (`node` in the job record: the base URL of
+that worker's file server). The API then relays the bytes — it never stores them.
+
+Worker side: a small threaded HTTP server on NODE_FILE_PORT, started with the worker.
+  GET    /files/{path}  — the file under DOWNLOADS_DIR, single Range requests honoured;
+                          the body is sent with sendfile(), so it isn't copied in userspace
+  DELETE /files/{path}  — remove it once it has been served
+Every request must carry `Authorization: Bearer <NODE_TOKEN>`; the port is meant for
+the internal network only.
+
+API side: open_remote() streams a file (passing Range through) on one pooled HTTP
+client; remove()/iter_file() are the blocking equivalents for cleanup and ZIPs.
+"""
+
+import hmac
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+from urllib.parse import quote, unquote
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "/files/"
+
+_async_client: httpx.AsyncClient | None = None
+
+
+def _headers(extra: dict | None = None) -> dict:
+    return {"Authorization": f"Bearer {settings.NODE_TOKEN}", **(extra or {})}
+
+
+def file_url(node: str, relpath: str) -> str:
+    return node.rstrip("/") + PREFIX + quote(relpath)
+
+
+# --- worker side ----------------------------------------------------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # requests are logged by the API, not here
+        pass
+
+    def _resolve(self) -> str | None:
+        """Absolute path for the request, or None (after replying) if it isn't allowed."""
+        token = self.headers.get("Authorization", "")
+        if not settings.NODE_TOKEN or not hmac.compare_digest(token, f"Bearer {settings.NODE_TOKEN}"):
+            self._reply(403)
+            return None
+        if not self.path.startswith(PREFIX):
+            self._reply(404)
+            return None
+        root = os.path.realpath(settings.DOWNLOADS_DIR)
+        path = os.path.realpath(os.path.join(root, unquote(self.path[len(PREFIX):])))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            self._reply(404)
+            return None
+        return path
+
+    def _reply(self, status: int, headers: dict | None = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        path = self._resolve()
+        if path is None:
+            return
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size
+            ranged = False  # a Range header we can honour; anything else gets the whole file
+            header = self.headers.get("Range", "")
+            if header.startswith("bytes=") and "," not in header:
+                first, _, last = header[len("bytes="):].strip().partition("-")
+                try:
+                    if first:
+                        start, end = int(first), min(int(last) + 1, size) if last else size
+                    else:
+                        start = max(size - int(last), 0)
+                    ranged = True
+                except ValueError:
+                    start, end = 0, size
+            if ranged:
+                if start >= end:
+                    self._reply(416, {"Content-Range": f"bytes */{size}"})
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            self.wfile.flush()
+            self.connection.sendfile(f, start, end - start)
+
+    def do_DELETE(self):
+        path = self._resolve()
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._reply(204)
+
+
+def start_server() -> None:
+    """Serve this worker's DOWNLOADS_DIR to the API from a daemon thread."""
+    if not settings.NODE_TOKEN:
+        raise RuntimeError("NODE_LOCAL_STORAGE needs NODE_TOKEN set on the API and every worker")
+    server = ThreadingHTTPServer(("0.0.0.0", settings.NODE_FILE_PORT), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="node-files", daemon=True).start()
+    logger.info("Serving %s to the API as %s", settings.DOWNLOADS_DIR, settings.node_url)
+
+
+# --- API side -------------------------------------------------------------------------
+
+def _client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(timeout=30.0)
+    return _async_client
+
+
+async def open_remote(node: str, relpath: str, range_header: str | None) -> httpx.Response:
+    """Start fetching a file from its worker. The caller streams the body and closes it."""
+    headers = {"Range": range_header} if range_header else {}
+    request = _client().build_request("GET", file_url(node, relpath), headers=_headers(headers))
+    return await _client().send(request, stream=True)
+
+
+async def close() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def iter_file(node: str, relpath: str, chunk_size: int) -> Iterator[bytes]:
+    """A whole remote file in chunks. Blocking."""
+    with httpx.stream("GET", file_url(node, relpath), headers=_headers(), timeout=30.0) as response:
+        response.raise_for_status()
+        yield from response.iter_bytes(chunk_size)
+
+
+def remove(node: str, relpath: str) -> None:
+    """Delete a file on its worker. Blocking."""
+    httpx.delete(file_url(node, relpath), headers=_headers(), timeout=10.0).raise_for_status()
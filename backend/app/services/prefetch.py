@@ -0,0 +1,79 @@
+"""
+Speculative prefetch of the likely format (opt-in via PREFETCH).
+
+Between /api/extract returning and the user picking a format there are usually a few
+idle seconds, and most users pick the top entry ("Best quality"). So right after
+extracting a video no longer than PREFETCH_MAX_DURATION and no bigger than
+PREFETCH_MAX_BYTES (at least one of the two known), the API creates an ordinary
+download job of PREFETCH_FORMAT for it, flagged `prefetch`, in the scheduler's
+lowest-priority lane. It downloads into its own directory (DOWNLOADS_DIR/prefetch/{id}),
+so it never trips over the files of a real job for the same video.
+
+When the user then starts a download of the same video:
+  - same format, no clip/audio options, and the prefetch already dispatched to a
+    worker (running or finished) → the prefetch job is adopted: its id is returned
+    and it simply carries on as the user's download ("hit");
+  - same choice, but the prefetch is still waiting for a slot → it is cancelled and
+    the request is queued normally, with its real priority ("late");
+  - anything else → the prefetch is cancelled ("miss", or "failed" if it had).
+A prefetch nobody claims within PREFETCH_TTL is cancelled by the janitor ("expired").
+
+Cancelling deletes the job record, its file and its disk reservation, and marks the id
+cancelled (utils/job_store.py), so a worker still downloading it stops. Outcomes are
+counted in dl_prefetches_total next to "started": hit / started is the hit rate to
+tune the thresholds with, and dl_prefetch_head_start_seconds shows what a hit saved.
+
+Key:
+  dl:prefetch:{video} — download id of the video's prefetch (expires after PREFETCH_TTL)
+"""
+
+import hashlib
+
+from app.config import settings
+from app.services import disk
+from app.services.janitor import cleanup_job
+from app.utils import metrics
+from app.utils.formats import expected_download
+from app.utils.info_store import canonical_video_id, load_info
+from app.utils.job_store import sync_job_store
+from app.utils.redis_pool import sync_redis
+
+
+def prefetch_key(url: str) -> str:
+    ident = canonical_video_id(url)
+    return "dl:prefetch:" + hashlib.sha256(ident.encode()).hexdigest()[:24]
+
+
+def wanted(url: str) -> bool:
+    """Whether a video just extracted is short (and small) enough to prefetch."""
+    info = load_info(url)
+    if not info or info.get("_type", "video") != "video":
+        return False
+    duration, size = expected_download(info, settings.PREFETCH_FORMAT)
+    if not duration and not size:
+        return False  # could be anything
+    return duration <= settings.PREFETCH_MAX_DURATION and size <= settings.PREFETCH_MAX_BYTES
+
+
+def claim(url: str, download_id: str) -> bool:
+    """Record `download_id` as the video's prefetch. False if it already has one."""
+    return bool(sync_redis.set(prefetch_key(url), download_id, nx=True, ex=settings.PREFETCH_TTL))
+
+
+def take(url: str) -> str | None:
+    """The video's prefetch, if any, which from now on is the caller's to adopt or cancel."""
+    download_id = sync_redis.getdel(prefetch_key(url))
+    return download_id.decode() if download_id else None
+
+
+def matches(job: dict, format_id: str, options: dict) -> bool:
+    """Whether the prefetch job is exactly the download the user asked for."""
+    return job.get("format_id") == format_id and not options and job.get("status") != "failed"
+
+
+def cancel(download_id: str, job: dict, outcome: str) -> None:
+    """Stop a prefetch nobody is going to adopt and delete what it left behind."""
+    sync_job_store.cancel(download_id)  # first, so the worker can't miss it
+    cleanup_job(download_id, job)
+    disk.release(download_id)
+    metrics.PREFETCHES.inc(outcome=outcome)
@@ -0,0 +1,295 @@
+"""
+Fair scheduling of download jobs in front of Celery.
+
+Sending every job straight to one Celery queue runs them in arrival order: one client
+with 50 long jobs starves everyone behind them, and many jobs for one site at once
+get rate-limited (429) and slow each other down. So jobs wait here instead, and are
+handed to Celery only when a slot is free:
+
+  - Two lanes. Jobs are "short" or "long" by the duration/size estimate from extraction
+    (unknown → long). Short jobs go first, but at least one long job runs whenever long
+    jobs are waiting, and at most LONG_JOB_SLOTS of the SCHEDULER_SLOTS are long. Each
+    lane is also its own Celery queue, so workers can be dedicated to one.
+  - A third, lowest-priority lane for speculative prefetches (services/prefetch.py): they
+    only take a slot no short or long job can use, at most PREFETCH_SLOTS of them, and
+    run on the short Celery queue.
+  - Round-robin between clients within a lane (one FIFO per client, hashed IP).
+  - At most MAX_JOBS_PER_DOMAIN running jobs per site; a client's blocked job is
+    skipped in favour of its next one for another site.
+  - Nothing starts while the downloads volume is below MIN_FREE_BYTES (services/disk.py).
+
+pump() dispatches as many jobs as there are free slots; it runs after every submit,
+whenever a task finishes, and after each janitor sweep. Every decision is one server-side script, so any number of
+API processes and workers can pump at once.
+
+Jobs can wait here much longer than JOB_TTL, so the janitor keeps the records of
+waiting jobs alive (as does every SSE/WebSocket watcher). One whose record is gone all
+the same is dropped when its turn comes, with a final "failed" progress event. The
+janitor also frees the slots of dispatched jobs that are gone, final, or were never
+picked up, in case the process that should have called finish() died.
+
+Keys (no TTL — entries are removed when dispatched/finished):
+  dl:sched:{lane}:ring            — List of clients with waiting jobs, rotated per pick
+  dl:sched:{lane}:client:{client} — List of that client's waiting download ids
+  dl:sched:waiting / dl:sched:active — Hash id → JSON (url, format, lane, domain, ...)
+  dl:sched:running / dl:sched:domains — Hash lane/domain → running job count
+  dl:sched:avg                    — Hash lane → moving average job duration (s), for ETAs
+"""
+
+import hashlib
+import json
+import time
+from urllib.parse import urlsplit
+
+from app.config import settings
+from app.services import disk
+from app.utils.formats import expected_download
+from app.utils.info_store import load_info
+from app.utils import metrics
+from app.utils.job_store import ACTIVE_STATUSES, job_key, sync_job_store
+from app.utils.redis_pool import sync_redis
+
+SHORT = "short"
+LONG = "long"
+PREFETCH = "prefetch"
+LANES = (SHORT, LONG, PREFETCH)
+QUEUES = (SHORT, LONG)                     # Celery queues (prefetches go to the short one)
+PREFIX = "dl:sched:"
+SCAN_DEPTH = 10                            # jobs per client looked at when its first ones are domain-blocked
+DEFAULT_AVG = {SHORT: 60.0, LONG: 600.0, PREFETCH: 60.0}  # assumed job duration before we've measured any
+
+WAITING = PREFIX + "waiting"
+ACTIVE = PREFIX + "active"
+RUNNING = PREFIX + "running"
+DOMAINS = PREFIX + "domains"
+AVERAGES = PREFIX + "avg"
+
+
+def ring_key(lane: str) -> str:
+    return f"{PREFIX}{lane}:ring"
+
+
+def client_key(lane: str, client: str) -> str:
+    return f"{PREFIX}{lane}:client:{client}"
+
+
+# KEYS: waiting, ring, client list; ARGV: id, meta JSON, client
+_SUBMIT_LUA = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('RPUSH', KEYS[3], ARGV[1])
+if not redis.call('LPOS', KEYS[2], ARGV[3]) then redis.call('RPUSH', KEYS[2], ARGV[3]) end
+return 1
+"""
+
+# KEYS: running, domains, waiting, active, short ring, long ring, prefetch ring
+# ARGV: slots, long slots, per-domain cap, scan depth, now, key prefix, prefetch slots
+# Returns the picked job's meta JSON, or false if nothing can start.
+_PICK_LUA = """
+local running = {
+    short = tonumber(redis.call('HGET', KEYS[1], 'short') or '0'),
+    long = tonumber(redis.call('HGET', KEYS[1], 'long') or '0'),
+    prefetch = tonumber(redis.call('HGET', KEYS[1], 'prefetch') or '0'),
+}
+if running.short + running.long + running.prefetch >= tonumber(ARGV[1]) then return false end
+local caps = {short = math.huge, long = tonumber(ARGV[2]), prefetch = tonumber(ARGV[7])}
+local rings = {short = KEYS[5], long = KEYS[6], prefetch = KEYS[7]}
+local order = {'short', 'long', 'prefetch'}
+if running.long == 0 and redis.call('LLEN', KEYS[6]) > 0 then order = {'long', 'short', 'prefetch'} end
+for _, lane in ipairs(order) do
+    if running[lane] < caps[lane] then
+        local ring = rings[lane]
+        for _ = 1, redis.call('LLEN', ring) do
+            local client = redis.call('LMOVE', ring, ring, 'LEFT', 'RIGHT')
+            local list = ARGV[6] .. lane .. ':client:' .. client
+            for _, id in ipairs(redis.call('LRANGE', list, 0, tonumber(ARGV[4]) - 1)) do
+                local raw = redis.call('HGET', KEYS[3], id)
+                local meta = raw and cjson.decode(raw)
+                if not meta or tonumber(redis.call('HGET', KEYS[2], meta.domain) or '0') < tonumber(ARGV[3]) then
+                    redis.call('LREM', list, 1, id)
+                    redis.call('HDEL', KEYS[3], id)
+                    if redis.call('LLEN', list) == 0 then redis.call('LREM', ring, 1, client) end
+                    if meta then
+                        redis.call('HINCRBY', KEYS[1], lane, 1)
+                        redis.call('HINCRBY', KEYS[2], meta.domain, 1)
+                        meta.started = tonumber(ARGV[5])
+                        raw = cjson.encode(meta)
+                        redis.call('HSET', KEYS[4], id, raw)
+                        return raw
+                    end
+                end
+            end
+        end
+    end
+end
+return false
+"""
+
+# KEYS: active, running, domains, averages; ARGV: id, now, "1" to fold the duration into the average
+_FINISH_LUA = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then return 0 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+local meta = cjson.decode(raw)
+if tonumber(redis.call('HGET', KEYS[2], meta.lane) or '0') > 0 then
+    redis.call('HINCRBY', KEYS[2], meta.lane, -1)
+end
+if redis.call('HINCRBY', KEYS[3], meta.domain, -1) <= 0 then redis.call('HDEL', KEYS[3], meta.domain) end
+if ARGV[3] ~= '1' then return 1 end
+local elapsed = tonumber(ARGV[2]) - meta.started
+local avg = tonumber(redis.call('HGET', KEYS[4], meta.lane) or tostring(elapsed))
+redis.call('HSET', KEYS[4], meta.lane, tostring(avg + 0.2 * (elapsed - avg)))
+return 1
+"""
+
+_submit = sync_redis.register_script(_SUBMIT_LUA)
+_pick = sync_redis.register_script(_PICK_LUA)
+_finish = sync_redis.register_script(_FINISH_LUA)
+
+
+def client_id(address: str) -> str:
+    """Opaque per-client key (the IP itself is never stored)."""
+    return hashlib.sha256(address.encode()).hexdigest()[:16]
+
+
+def domain_of(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host.removeprefix("www.")
+
+
+def classify(url: str, format_id: str, **options) -> str:
+    """Lane for a job, from the info_dict /api/extract stored (any age is fine here).
+    `options` are the job's clip/audio options — a short clip of a long video is short."""
+    info = load_info(url, require_fresh=False)
+    if not info:
+        return LONG
+    duration, size = expected_download(info, format_id, **options)
+    if not duration and not size:
+        return LONG
+    if duration > settings.LONG_JOB_DURATION or size > settings.LONG_JOB_BYTES:
+        return LONG
+    return SHORT
+
+
+def submit(download_id: str, url: str, format_id: str, client: str, prefetch: bool = False, **options) -> str:
+    """Queue a job behind its client's earlier ones. Returns its lane. Call pump() after."""
+    lane = PREFETCH if prefetch else classify(url, format_id, **options)
+    meta = {"id": download_id, "url": url, "format_id": format_id, "lane": lane,
+            "client": client, "domain": domain_of(url), "queued": time.time()}
+    _submit(keys=[WAITING, ring_key(lane), client_key(lane, client)],
+            args=[download_id, json.dumps(meta), client])
+    return lane
+
+
+def pump() -> int:
+    """Send waiting jobs to Celery while slots are free. Returns how many were sent."""
+    from app.tasks.dispatch import send_download
+
+    sent = 0
+    while disk.has_room():  # otherwise jobs wait until space is freed
+        raw = _pick(
+            keys=[RUNNING, DOMAINS, WAITING, ACTIVE, ring_key(SHORT), ring_key(LONG), ring_key(PREFETCH)],
+            args=[settings.SCHEDULER_SLOTS, settings.LONG_JOB_SLOTS,
+                  settings.MAX_JOBS_PER_DOMAIN, SCAN_DEPTH, time.time(), PREFIX, settings.PREFETCH_SLOTS],
+        )
+        if not raw:
+            break
+        meta = json.loads(raw)
+        if not sync_redis.exists(job_key(meta["id"])):
+            # The record expired while the job waited: nobody can fetch the result
+            _reclaim(meta["id"])
+            sync_job_store.set_progress(meta["id"], {
+                "status": "failed", "progress": 0, "error": "Download expired while waiting in the queue",
+            })
+            continue
+        if meta.get("queued"):
+            metrics.QUEUE_WAIT.observe(meta["started"] - meta["queued"], lane=meta["lane"])
+        try:
+            send_download(meta["id"], meta["url"], meta["format_id"],
+                          queue=SHORT if meta["lane"] == PREFETCH else meta["lane"])
+        except Exception as e:
+            _reclaim(meta["id"])  # give the slot (and disk space) back
+            sync_job_store.transition(meta["id"], ("pending",), status="failed",
+                                      error_message=f"Could not queue download: {e}"[:500])
+            raise
+        sent += 1
+    return sent
+
+
+def finish(download_id: str, measured: bool = True) -> bool:
+    """Free a running job's slot (idempotent) and fold its duration into the lane average,
+    unless the job never really ran (`measured=False`). False if it held no slot."""
+    return bool(_finish(keys=[ACTIVE, RUNNING, DOMAINS, AVERAGES],
+                        args=[download_id, time.time(), int(measured)]))
+
+
+def _reclaim(download_id: str) -> bool:
+    """finish() for a job that never ran (or won't say so itself): frees its slot
+    without counting it in the lane average, and drops its disk reservation."""
+    disk.release(download_id)
+    return finish(download_id, measured=False)
+
+
+def keep_waiting_alive() -> int:
+    """Extend the job records of everything waiting here, so a job that waits longer
+    than JOB_TTL isn't lost just because nobody polled it. Returns how many there are."""
+    waiting = [i.decode() for i in sync_redis.hkeys(WAITING)]
+    sync_job_store.touch(waiting)
+    return len(waiting)
+
+
+def reconcile(stuck_after: float) -> int:
+    """Free the slots of dispatched jobs that will never call finish(): their record is
+    gone or already final, or they are still pending `stuck_after` seconds after being
+    dispatched (the API died before sending them, or the task message was lost).
+    Returns how many slots were freed."""
+    now = time.time()
+    freed = 0
+    for raw_id, raw in sync_redis.hgetall(ACTIVE).items():
+        download_id = raw_id.decode()
+        job = sync_job_store.get(download_id)
+        status = job and job.get("status")
+        if status in ACTIVE_STATUSES:
+            if status != "pending" or now - json.loads(raw)["started"] < stuck_after:
+                continue
+            if sync_job_store.transition(download_id, ("pending",), status="failed",
+                                         error_message="Download was lost before it started"):
+                sync_job_store.set_progress(download_id, {
+                    "status": "failed", "progress": 0, "error": "Download was lost before it started",
+                })
+        if _reclaim(download_id):
+            freed += 1
+    return freed
+
+
+def is_waiting(download_id: str) -> bool:
+    """True while the job is queued here, i.e. not yet dispatched to a worker."""
+    return bool(sync_redis.hexists(WAITING, download_id))
+
+
+def estimate(download_id: str) -> tuple[int | None, float | None]:
+    """(jobs ahead of this one, estimated start as a unix time) while it waits here,
+    (None, None) once it has been dispatched."""
+    raw = sync_redis.hget(WAITING, download_id)
+    if not raw:
+        return None, None
+    meta = json.loads(raw)
+    lane, client = meta["lane"], meta["client"]
+    index = sync_redis.lpos(client_key(lane, client), download_id) or 0
+
+    # Round-robin: every other client gets about as many turns as we need
+    ring = [c.decode() for c in sync_redis.lrange(ring_key(lane), 0, -1)]
+    pipe = sync_redis.pipeline(transaction=False)
+    for other in ring:
+        pipe.llen(client_key(lane, other))
+    pipe.hget(AVERAGES, lane)
+    *lengths, avg = pipe.execute()
+    mine = ring.index(client) if client in ring else len(ring)
+    ahead = index
+    for i, (other, length) in enumerate(zip(ring, lengths)):
+        if other != client:
+            ahead += min(length, index + 1 if i < mine else index)
+
+    slots = {LONG: settings.LONG_JOB_SLOTS, PREFETCH: settings.PREFETCH_SLOTS}.get(lane, settings.SCHEDULER_SLOTS)
+    avg = float(avg) if avg else DEFAULT_AVG[lane]
+    return ahead, time.time() + (ahead + 1) * avg / max(slots, 1)
+
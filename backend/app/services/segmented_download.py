@@ -0,0 +1,240 @@
+"""
+Multi-connection downloader for large progressive (single HTTP file) formats.
+
+Origin CDNs often throttle each connection, so one connection per job caps
+throughput. For files bigger than SEGMENTED_MIN_SIZE we split the byte range into
+one segment per connection, fetch the segments in parallel with Range requests
+(through yt-dlp's own networking stack, so cookies/proxies/headers still apply) and
+write each straight into its place in a preallocated .part file.
+
+Progress is reported through the same yt-dlp style hook dicts as a normal download,
+with aggregate bytes, speed and ETA across all segments. With bandwidth shaping on,
+every chunk is paid for from the job's bucket (services/bandwidth.py) as it lands.
+
+Every segment's position is checkpointed to a small sidecar file (<name>.part.segments)
+at most every CHECKPOINT_INTERVAL, after the bytes before it are flushed to disk. A
+retried or redelivered job picks up each segment exactly where the checkpoint says,
+so a crash costs at most a few seconds of transfer.
+
+Network failures surface as yt-dlp's DownloadError (wrapping the cause), like its own
+downloaders report them, so callers handle both the same way — e.g. re-extracting
+when a 403 says the format URL has expired.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, RequestError
+
+from app.config import settings
+
+READ_SIZE = 64 * 1024
+SEGMENT_RETRIES = 3
+CHECKPOINT_INTERVAL = 2.0  # seconds
+
+
+class RangeNotSupported(Exception):
+    """The server ignored our Range header — fall back to a plain download."""
+
+
+def is_segmentable(fmt: dict, connections: int) -> bool:
+    """A format can be split if it is one plain HTTP(S) file of known, large enough size."""
+    return (
+        connections > 1
+        and fmt.get("protocol") in ("http", "https")
+        and (fmt.get("filesize") or 0) >= settings.SEGMENTED_MIN_SIZE
+    )
+
+
+def checkpoint_path(path: str) -> str:
+    return path + ".part.segments"
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard(path: str) -> None:
+    """Remove a segmented download's .part and checkpoint, so a plain (single
+    connection) download doesn't mistake the preallocated file for progress."""
+    if os.path.exists(checkpoint_path(path)):
+        _remove(path + ".part")
+        _remove(checkpoint_path(path))
+
+
+class _Checkpoint:
+    """Periodically persists every segment's cursor next to the .part file."""
+
+    def __init__(self, path: str, fd: int, total: int, segments: list[tuple[int, int]], cursors: list[list[int]]):
+        self._path = checkpoint_path(path)
+        self._fd = fd
+        self._total = total
+        self._segments = segments
+        self._cursors = cursors
+        self._lock = threading.Lock()
+        self._saved = time.monotonic()
+
+    @staticmethod
+    def load(path: str, total: int, segments: list[tuple[int, int]]) -> list[int] | None:
+        """Saved cursors, if the checkpoint belongs to this exact file and split."""
+        try:
+            with open(checkpoint_path(path)) as f:
+                saved = json.load(f)
+            if os.path.getsize(path + ".part") != total:
+                return None
+        except (OSError, ValueError):
+            return None
+        if saved.get("total") != total or saved.get("segments") != [list(s) for s in segments]:
+            return None
+        return saved["cursors"]
+
+    def maybe_save(self) -> None:
+        if time.monotonic() - self._saved >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            positions = [c[0] for c in self._cursors]  # read before flushing: all of it is on disk
+            os.fdatasync(self._fd)
+            tmp = self._path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"total": self._total, "segments": self._segments, "cursors": positions}, f)
+            os.replace(tmp, self._path)
+            self._saved = time.monotonic()
+
+
+class _Progress:
+    """Thread-safe byte counter that emits aggregate yt-dlp style progress dicts."""
+
+    def __init__(self, hook, total: int, tmpfilename: str, resumed: int = 0, throttle=None):
+        self._hook = hook
+        self._throttle = throttle
+        self._total = total
+        self._tmpfilename = tmpfilename
+        self._resumed = resumed  # bytes already on disk from an earlier attempt
+        self._downloaded = resumed
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def add(self, n: int) -> None:
+        with self._lock:
+            self._downloaded += n
+            elapsed = max(time.monotonic() - self._started, 1e-3)
+            speed = (self._downloaded - self._resumed) / elapsed
+            self._hook({
+                "status": "downloading",
+                "downloaded_bytes": self._downloaded,
+                "total_bytes": self._total,
+                "resumed_bytes": self._resumed,
+                "speed": speed,
+                "eta": int((self._total - self._downloaded) / speed) if speed else None,
+                "tmpfilename": self._tmpfilename,
+            })
+            left = self._total - self._downloaded
+        if self._throttle:
+            self._throttle.consume(n, self._tmpfilename, left)  # outside the lock: it may sleep
+
+
+def download_segmented(ydl, fmt: dict, path: str, connections: int, hook, throttle=None) -> None:
+    """Download `fmt` (a resolved single-file format dict) to `path` over
+    `connections` parallel Range requests, resuming from a checkpoint if one matches.
+    `throttle` is the job's bandwidth bucket, if shaping is on."""
+    total = fmt["filesize"]
+    headers = fmt.get("http_headers") or {}
+    tmp = path + ".part"
+
+    if os.path.exists(path) and os.path.getsize(path) == total:
+        # Finished by an earlier attempt that died before reporting it
+        hook({"status": "finished", "downloaded_bytes": total, "total_bytes": total, "filename": path})
+        return
+
+    bounds = [total * i // connections for i in range(connections + 1)]
+    segments = list(zip(bounds[:-1], bounds[1:]))
+    saved = _Checkpoint.load(path, total, segments)
+    fresh = saved is None
+    if fresh:
+        with open(tmp, "wb") as f:
+            f.truncate(total)  # preallocate so every segment can write at its own offset
+        saved = [start for start, _ in segments]
+
+    # One mutable cursor per segment, advanced by _fetch_range as data lands
+    cursors = [[position] for position in saved]
+    resumed = sum(position - start for position, (start, _) in zip(saved, segments))
+    progress = _Progress(hook, total, tmp, resumed, throttle)
+    abort = threading.Event()
+
+    fd = os.open(tmp, os.O_WRONLY)
+    checkpoint = _Checkpoint(path, fd, total, segments, cursors)
+    if fresh:
+        checkpoint.save()  # marks the .part as ours from the start (see discard())
+    try:
+        def fetch(cursor: list[int], end: int) -> None:
+            try:
+                for attempt in range(SEGMENT_RETRIES + 1):
+                    try:
+                        _fetch_range(ydl, fmt["url"], headers, fd, cursor, end, progress, abort, checkpoint)
+                        return
+                    except RequestError as e:
+                        refused = isinstance(e, HTTPError) and e.status < 500 and e.status != 429
+                        if refused or attempt == SEGMENT_RETRIES or abort.is_set():
+                            raise  # asking again won't help (e.g. 403: the URL expired)
+                        time.sleep(2 ** attempt)  # resume this segment from where it stopped
+            except BaseException:
+                abort.set()  # whatever went wrong (cancelled, disk full...), stop the other segments
+                raise
+
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            futures = [pool.submit(fetch, cursor, end) for cursor, (_, end) in zip(cursors, segments)]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if any(isinstance(e, RangeNotSupported) for e in errors):
+            os.close(fd)
+            fd = -1
+            _remove(tmp)  # the caller falls back to a plain download
+            _remove(checkpoint_path(path))
+        elif errors:
+            checkpoint.save()  # keep what we have for the retry
+        if errors:
+            # Report the segment that actually failed, not the ones we cancelled
+            real = [e for e in errors if not isinstance(e, yt_dlp.utils.DownloadCancelled)]
+            error = (real or errors)[0]
+            if isinstance(error, RequestError):
+                raise yt_dlp.utils.DownloadError(
+                    f"Segment download failed: {error}", (type(error), error, error.__traceback__)
+                ) from error
+            raise error
+    finally:
+        if fd >= 0:
+            os.close(fd)
+
+    os.replace(tmp, path)
+    _remove(checkpoint_path(path))
+    hook({"status": "finished", "downloaded_bytes": total, "total_bytes": total, "filename": path})
+
+
+def _fetch_range(ydl, url: str, headers: dict, fd: int, cursor: list[int], end: int, progress, abort, checkpoint) -> None:
+    """Fetch bytes [cursor[0], end) into the file, advancing cursor[0] as data lands."""
+    if cursor[0] >= end:
+        return
+    request = Request(url, headers={**headers, "Range": f"bytes={cursor[0]}-{end - 1}"})
+    with ydl.urlopen(request) as response:
+        if response.status != 206:
+            abort.set()
+            raise RangeNotSupported(url)
+        while cursor[0] < end:
+            if abort.is_set():
+                raise yt_dlp.utils.DownloadCancelled("Another segment failed")
+            chunk = response.read(min(READ_SIZE, end - cursor[0]))
+            if not chunk:
+                raise RequestError(f"Connection closed at byte {cursor[0]} (segment ends at {end})")
+            os.pwrite(fd, chunk, cursor[0])
+            cursor[0] += len(chunk)
+            progress.add(len(chunk))
+            checkpoint.maybe_save()
@@ -0,0 +1,135 @@
+"""
+Content-addressed download cache (opt-in via SHARED_DOWNLOADS).
+
+Jobs asking for the same (canonical video id, format_id) share one download and one
+file instead of each running their own. The first job becomes the "owner" and runs the
+Celery task; later jobs attach to it and follow its progress.
+
+Redis keys:
+  - dl:shared:{key}   — hash: owner, status, filename, filesize, refs, last_access
+  - dl:shared:index   — sorted set of keys scored by last access (for LRU eviction)
+
+Files live in DOWNLOADS_DIR/shared/{key}/. A file is only evicted once no job
+references it (refs == 0) and it is either older than SHARED_CACHE_TTL or the shared
+directory is over SHARED_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.utils.info_store import canonical_video_id
+from app.utils.redis_pool import sync_redis
+
+INDEX_KEY = "dl:shared:index"
+
+# Attach to an existing entry (bumping its refcount) or claim it for a new owner.
+# Returns the existing owner's download id, or nil if the caller is the new owner.
+_ATTACH = sync_redis.register_script("""
+local owner = redis.call('HGET', KEYS[1], 'owner')
+local status = redis.call('HGET', KEYS[1], 'status')
+if owner and status ~= 'failed' then
+    redis.call('HINCRBY', KEYS[1], 'refs', 1)
+    redis.call('HSET', KEYS[1], 'last_access', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[4])
+    return owner
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'owner', ARGV[1], 'status', 'pending', 'refs', 1, 'last_access', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[4])
+return false
+""")
+
+
+def shared_key(url: str, format_id: str, options: dict | None = None) -> str:
+    """Cache key for a (video, format) pair, plus clip/audio options if any."""
+    ident = f"{canonical_video_id(url)}|{format_id}"
+    if options:
+        ident += "|" + ",".join(f"{k}={options[k]}" for k in sorted(options))
+    return hashlib.sha256(ident.encode()).hexdigest()[:24]
+
+
+def shared_dir(key: str) -> str:
+    return os.path.join(settings.DOWNLOADS_DIR, "shared", key)
+
+
+def _entry_key(key: str) -> str:
+    return f"dl:shared:{key}"
+
+
+def attach(key: str, download_id: str) -> str | None:
+    """Reference the shared entry for `key`. Returns the owning download id if the
+    file is already being (or has been) produced, or None if `download_id` is now
+    the owner and must run the download itself."""
+    owner = _ATTACH(
+        keys=[_entry_key(key), INDEX_KEY],
+        args=[download_id, time.time(), settings.SHARED_CACHE_TTL, key],
+    )
+    return owner.decode() if owner else None
+
+
+def get_entry(key: str) -> dict | None:
+    raw = sync_redis.hgetall(_entry_key(key))
+    if not raw:
+        return None
+    return {k.decode(): v.decode() for k, v in raw.items()}
+
+
+def complete(key: str, filename: str, filesize: int | None, node: str | None = None) -> None:
+    """Called by the owner's worker once the file is ready (on `node`, with worker-local storage)."""
+    fields = {"status": "completed", "filename": filename, "filesize": filesize or 0}
+    if node:
+        fields["node"] = node
+    pipe = sync_redis.pipeline()
+    pipe.hset(_entry_key(key), mapping=fields)
+    pipe.expire(_entry_key(key), settings.SHARED_CACHE_TTL)
+    pipe.execute()
+
+
+def fail(key: str) -> None:
+    """Called by the owner's worker on failure — the next request starts a fresh download."""
+    sync_redis.hset(_entry_key(key), "status", "failed")
+
+
+def release(key: str) -> None:
+    """Drop one reference (a job served its file or went away)."""
+    now = time.time()
+    pipe = sync_redis.pipeline()
+    pipe.hincrby(_entry_key(key), "refs", -1)
+    pipe.hset(_entry_key(key), "last_access", now)
+    pipe.expire(_entry_key(key), settings.SHARED_CACHE_TTL)
+    pipe.zadd(INDEX_KEY, {key: now})
+    pipe.execute()
+
+
+def evict() -> None:
+    """Delete unreferenced files, least recently used first, until the shared
+    directory is back under budget. Entries past their TTL always go."""
+    root = Path(settings.DOWNLOADS_DIR) / "shared"
+    if not root.exists():
+        return
+    used = sum(f.stat().st_size for f in root.rglob("*") if f.is_file())
+    cutoff = time.time() - settings.SHARED_CACHE_TTL
+
+    for raw_key, last_access in sync_redis.zrange(INDEX_KEY, 0, -1, withscores=True):
+        key = raw_key.decode()
+        entry = get_entry(key)
+        expired = entry is None or last_access < cutoff
+        if not expired and used <= settings.SHARED_CACHE_MAX_BYTES:
+            break  # everything newer is kept too
+        if entry is not None and (int(entry.get("refs", 0)) > 0 or entry.get("status") == "pending"):
+            continue  # still in use
+        if settings.NODE_LOCAL_STORAGE and entry is not None and entry.get("node") != settings.node_url:
+            continue  # another worker's file — its own janitor evicts it
+
+        path = Path(shared_dir(key))
+        if path.exists():
+            used -= sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+            shutil.rmtree(path, ignore_errors=True)
+        sync_redis.delete(_entry_key(key))
+        sync_redis.zrem(INDEX_KEY, key)
@@ -1,29 +1,102 @@
 """
 yt-dlp wrapper — the core video engine.
 
-Two functions:
+Main functions:
   1. extract_info(url)  — fetches video metadata + available formats without downloading
   2. download_video()   — downloads a video in the chosen format, calling progress_callback as it goes
+
+extract_raw() / to_video_info() split extract_info() in two so callers can keep the raw
+info_dict and hand it to download_video() later, skipping a second extraction.
+
+Extractions reuse one long-lived YoutubeDL per thread (extractor classes and compiled
+URL patterns stay warm) and replace it every EXTRACT_RECYCLE_AFTER extractions.
 """
 
+import copy
 import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yt_dlp
+from yt_dlp.networking.exceptions import HTTPError, RequestError
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
 
+from app.config import settings
 from app.schemas import FormatInfo, VideoInfo
+from app.services import bandwidth, segmented_download
+from app.utils import metrics
+from app.utils.formats import audio_format
+
+EXTRACT_OPTS = {
+    "quiet": True,
+    "no_warnings": True,
+    "extract_flat": False,
+    "socket_timeout": settings.EXTRACT_TIMEOUT,  # bounds how long an abandoned extraction can linger
+}
+
+_extractor = threading.local()
+
+# ffmpeg muxing is CPU/disk-heavy; with many downloads per worker process (threads pool)
+# they would otherwise all merge at once and starve the network-bound downloads.
+# Held by our own merges and by every ffmpeg postprocessor yt-dlp runs (_YoutubeDL);
+# ffmpeg as the downloader of a clip's section is network-bound and doesn't count.
+_merge_slots = threading.BoundedSemaphore(settings.MAX_CONCURRENT_MERGES)
+
+# Merged clips go into the first of these that holds all their codecs without re-encoding;
+# full downloads are always mp4, as the "Best quality" option advertises
+MERGE_CONTAINERS = ("mp4", "webm", "mkv")
+# Audio-only downloads already in one of these are kept as they are
+AUDIO_EXTS = ("m4a", "mp3", "opus", "ogg", "oga", "aac", "flac", "wav")
 
 
 def extract_info(url: str) -> VideoInfo:
     """Extract video metadata and available formats from a URL using yt-dlp.
     Does NOT download the video — just reads what's available."""
-    ydl_opts = {
-        "quiet": True,
-        "no_warnings": True,
-        "extract_flat": False,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    return to_video_info(url, extract_raw(url))
+
+
+def extract_raw(url: str) -> dict:
+    """Run yt-dlp's extraction and return the sanitized (JSON-safe) info_dict."""
+    ydl = extractor_ydl()
+    info = ydl.extract_info(url, download=False)
+    return ydl.sanitize_info(info, remove_private_keys=True)
+
+
+def extractor_ydl() -> yt_dlp.YoutubeDL:
+    """This thread's extraction YoutubeDL, created on first use and replaced after
+    EXTRACT_RECYCLE_AFTER extractions so per-instance state can't grow forever."""
+    ydl = getattr(_extractor, "ydl", None)
+    if ydl is None or _extractor.uses >= settings.EXTRACT_RECYCLE_AFTER:
+        if ydl is not None:
+            ydl.close()
+        ydl = _extractor.ydl = yt_dlp.YoutubeDL(EXTRACT_OPTS)
+        _extractor.uses = 0
+    _extractor.uses += 1
+    return ydl
+
+
+def playlist_entries(url: str, limit: int) -> list[str]:
+    """URLs of the videos in a playlist, via flat extraction (one request for the list,
+    none per video). At most `limit` + 1 are returned, so callers can tell the list
+    was cut off. A URL that isn't a playlist comes back as itself."""
+    opts = {**EXTRACT_OPTS, "extract_flat": "in_playlist", "playlistend": limit + 1}
+    with yt_dlp.YoutubeDL(opts) as ydl:
         info = ydl.extract_info(url, download=False)
+    if info.get("_type") not in ("playlist", "multi_video"):
+        return [info.get("webpage_url") or url]
+    urls = []
+    for entry in info.get("entries") or []:
+        entry_url = (entry or {}).get("url") or (entry or {}).get("webpage_url")
+        if entry_url and entry_url.startswith(("http://", "https://")):
+            urls.append(entry_url)
+    return urls
 
+
+def to_video_info(url: str, info: dict) -> VideoInfo:
+    """Turn a raw info_dict into the VideoInfo shown to the user."""
     # Parse yt-dlp's raw format list into our simplified FormatInfo objects.
     # Deduplicate by (quality, extension, video/audio) to avoid showing redundant options.
     formats = []
@@ -92,30 +165,338 @@ def extract_info(url: str) -> VideoInfo:
     )
 
 
+def is_transient(error: BaseException) -> bool:
+    """True for failures worth retrying later: network errors, timeouts, truncated
+    transfers, and 429/5xx from the origin. Follows yt-dlp's wrapped causes."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, HTTPError):
+            return error.status == 429 or error.status >= 500
+        if isinstance(error, (RequestError, yt_dlp.utils.ContentTooShortError, TimeoutError, ConnectionError)):
+            return True
+        wrapped = getattr(error, "exc_info", None)
+        error = (wrapped[1] if wrapped else None) or getattr(error, "cause", None) \
+            or error.__cause__ or error.__context__
+    return False
+
+
+def job_connections() -> int:
+    """Connections one job may open. Bounded so that a worker's concurrent jobs
+    together never exceed MAX_WORKER_CONNECTIONS."""
+    fair_share = settings.MAX_WORKER_CONNECTIONS // max(settings.worker_concurrency, 1)
+    return max(1, min(settings.CONNECTIONS_PER_JOB, fair_share))
+
+
 def download_video(
-    url: str, format_id: str, output_dir: str, progress_callback
+    url: str,
+    format_id: str,
+    output_dir: str,
+    progress_callback,
+    info: dict | None = None,
+    streamable: bool = False,
+    start_time: float | None = None,
+    end_time: float | None = None,
+    audio_only: bool = False,
+    on_event=None,
+    on_output=None,
+    throttle=None,
 ) -> dict:
     """Download a video using yt-dlp. The progress_callback is called by yt-dlp
     during download with status updates (bytes downloaded, speed, ETA).
+    If `info` (an info_dict from extract_raw) is given, it is reused instead of
+    extracting again; on failure we fall back to a fresh extraction in case the
+    format URLs have expired.
+    Merge formats ("bestvideo+bestaudio") have their component streams fetched in
+    parallel and merged with ffmpeg afterwards. HLS/DASH fragments are fetched over
+    several connections, and large progressive files in parallel byte-range segments.
+    With `streamable`, post-download fixups that would rewrite the file are disabled
+    so a client tailing the .part file receives exactly the final bytes.
+    `start_time`/`end_time` (seconds) download only that section — ffmpeg fetches just
+    the needed bytes/fragments and copies them, cutting at keyframes. `audio_only` fetches
+    only the audio stream and keeps its codec; it is only remuxed (never re-encoded) when
+    the stream's container isn't an audio file already.
+    `on_event(name, **detail)` is told when formats are resolved and when ffmpeg steps
+    start and end (the job's trace, see utils/trace.py). `on_output(stem)` is told the
+    output path without its extension once the formats are resolved, before any file
+    is written — all of the job's temporaries start with it.
+    `throttle` is the job's bandwidth bucket (services/bandwidth.py), if shaping is on.
     Returns the filename, title, and file size of the downloaded file."""
-    ydl_opts = {
-        "format": format_id,
-        "outtmpl": os.path.join(output_dir, "%(title)s [%(id)s].%(ext)s"),
-        "progress_hooks": [progress_callback],       # yt-dlp calls this with download progress
-        "merge_output_format": "mp4",                 # ffmpeg merges video+audio into mp4
+    connections = job_connections()
+    base_opts = {
         "quiet": True,
         "no_warnings": True,
         "noplaylist": True,                           # only download single video, not playlists
+        "concurrent_fragment_downloads": connections, # parallel HLS/DASH fragment fetching
+    }
+    if throttle:
+        # Small fixed reads, so the bucket paces the transfer evenly
+        base_opts.update(buffersize=bandwidth.READ_SIZE, noresizebuffer=True)
+    clip = start_time is not None or end_time is not None
+    outtmpl = "%(title)s [%(id)s].%(ext)s"
+    if clip:
+        # Distinct name per section, so clips of one video don't overwrite each other
+        outtmpl = f"%(title)s [%(id)s] {start_time or 0:g}-{'end' if end_time is None else f'{end_time:g}'}.%(ext)s"
+    ydl_opts = {
+        **base_opts,
+        "format": audio_format(format_id) if audio_only else format_id,
+        "outtmpl": os.path.join(output_dir, outtmpl),
+        "progress_hooks": [progress_callback, *_throttle_hooks(throttle)],  # yt-dlp calls these with download progress
+        # A clip keeps the streams' own container when it can (ffmpeg cuts it anyway)
+        "merge_output_format": "/".join(MERGE_CONTAINERS) if clip else "mp4",
     }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        filename = ydl.prepare_filename(info)
-        # After merging, the extension might change to .mp4
-        if not os.path.exists(filename):
-            base, _ = os.path.splitext(filename)
-            filename = base + ".mp4"
+    if clip:
+        ydl_opts["download_ranges"] = yt_dlp.utils.download_range_func(
+            None, [(start_time or 0, float("inf") if end_time is None else end_time)]
+        )
+    if streamable:
+        ydl_opts["fixup"] = "never"                   # file is being streamed as it lands — don't rewrite it
+    if on_event:
+        ydl_opts["postprocessor_hooks"] = [_ffmpeg_step_hook(on_event)]
+    with _YoutubeDL(ydl_opts) as ydl:
+        # Resolve the format selection up front so we can pick how to fetch it.
+        # Reused info first, then (if its URLs turn out stale) a fresh extraction.
+        extract_audio = False
+        for candidate in ([info] if info is not None else []) + [None]:
+            resolved = _resolve_formats(ydl, url, candidate)
+            if on_event:
+                on_event("extracted", reused=candidate is not None)
+            if on_output:
+                on_output(os.path.splitext(ydl.prepare_filename(resolved))[0])
+            if audio_only and not extract_audio and not _is_audio_file(resolved):
+                ydl.add_post_processor(FFmpegExtractAudioPP(ydl, preferredcodec="best"), when="post_process")
+                extract_audio = True
+            try:
+                return _download_resolved(
+                    ydl, resolved, base_opts, progress_callback, connections, streamable,
+                    fast_paths=not (clip or extract_audio), throttle=throttle,
+                )
+            except (yt_dlp.utils.DownloadError, RequestError):
+                # Our fast paths let network errors through unwrapped (a 403 from an
+                # expired format URL, say) — those deserve a fresh extraction too
+                if candidate is None:
+                    raise
+
+
+def _throttle_hooks(throttle) -> list:
+    """Progress hooks that make yt-dlp's own downloaders pay into the job's bucket."""
+    return [throttle.hook] if throttle else []
+
+
+def _is_audio_file(info: dict) -> bool:
+    """True if the selected format is a single audio stream in an audio container,
+    i.e. the download is already the final file."""
+    return (
+        not info.get("requested_formats")
+        and info.get("vcodec", "none") == "none"
+        and info.get("ext") in AUDIO_EXTS
+    )
+
+
+class _YoutubeDL(yt_dlp.YoutubeDL):
+    """A YoutubeDL whose ffmpeg postprocessors (merger, fixups, audio extraction) each
+    hold a merge slot while they run."""
+
+    def run_pp(self, pp, infodict):
+        if not isinstance(pp, FFmpegPostProcessor):
+            return super().run_pp(pp, infodict)
+        with _merge_slots:
+            started = time.monotonic()
+            try:
+                return super().run_pp(pp, infodict)
+            finally:
+                metrics.MERGE_TIME.observe(time.monotonic() - started)
+
+
+def _ffmpeg_step_hook(on_event):
+    """A postprocessor hook reporting the ffmpeg steps (merge, audio extraction, fixups)."""
+    def hook(d):
+        name = d.get("postprocessor") or ""
+        if name in ("Merger", "ExtractAudio") or name.startswith("Fixup"):
+            on_event("merge_start" if d["status"] == "started" else "merge_end", step=name)
+    return hook
+
+
+def _postprocessor_hooks(ydl, status: str, name: str, info: dict) -> None:
+    """Report a step we run ourselves to the postprocessor hooks, like yt-dlp's own."""
+    for hook in ydl.params.get("postprocessor_hooks") or []:
+        hook({"status": status, "postprocessor": name, "info_dict": info})
+
+
+def _download_resolved(
+    ydl, info: dict, base_opts: dict, progress_callback, connections: int, streamable: bool,
+    fast_paths: bool = True, throttle=None,
+) -> dict:
+    # Clips and audio extraction are left to yt-dlp (ffmpeg section download, postprocessor)
+    streams = info.get("requested_formats") or []
+    if fast_paths and len(streams) > 1:
+        return _download_parallel(info, base_opts, ydl, progress_callback, connections, throttle)
+
+    filename = ydl.prepare_filename(info)
+    if fast_paths and not streamable and segmented_download.is_segmentable(info, connections):
+        try:
+            segmented_download.download_segmented(ydl, info, filename, connections, progress_callback, throttle)
+            return _result(filename, info)
+        except segmented_download.RangeNotSupported:
+            pass  # server ignores Range — plain download below
+    segmented_download.discard(filename)  # an earlier segmented attempt's .part isn't resumable here
+
+    # Let yt-dlp download (and post-process) the already-selected format, resuming
+    # the .part file an earlier attempt left behind
+    info = ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+    return _result(_downloaded_path(ydl, info), info)
+
+
+def _downloaded_path(ydl, info: dict) -> str:
+    """Where process_ie_result() left the file, after merging and post-processing."""
+    for download in info.get("requested_downloads") or []:
+        if download.get("filepath") and os.path.exists(download["filepath"]):
+            return download["filepath"]
+    filename = ydl.prepare_filename(info)
+    # After merging, the extension might have changed to the merge container's
+    if not os.path.exists(filename):
+        base, _ = os.path.splitext(filename)
+        for ext in MERGE_CONTAINERS:
+            if os.path.exists(f"{base}.{ext}"):
+                return f"{base}.{ext}"
+    return filename
+
+
+def _result(filename: str, info: dict) -> dict:
+    return {
+        "filename": os.path.basename(filename),
+        "title": info.get("title"),
+        "filesize": os.path.getsize(filename) if os.path.exists(filename) else None,
+    }
+
+
+def _resolve_formats(ydl, url: str, info: dict | None) -> dict:
+    """Run format selection without downloading; the result lists the chosen
+    component streams in `requested_formats` when a merge is needed."""
+    if info is not None:
+        try:
+            return ydl.process_ie_result(copy.deepcopy(info), download=False)
+        except yt_dlp.utils.DownloadError:
+            pass
+    return ydl.extract_info(url, download=False)
+
+
+class _CombinedProgress:
+    """Folds the progress hooks of several parallel streams into single
+    progress_callback calls, as if it were one download."""
+
+    def __init__(self, callback, count: int):
+        self._callback = callback
+        self._streams: list[dict] = [{} for _ in range(count)]
+        self._lock = threading.Lock()
+        self.abort = threading.Event()  # set when a sibling stream failed
+
+    def hook(self, index: int):
+        def on_progress(d):
+            if self.abort.is_set():
+                raise yt_dlp.utils.DownloadCancelled("Another stream of this download failed")
+            with self._lock:
+                self._streams[index] = d
+                self._callback(self._combined())
+        return on_progress
+
+    def _combined(self) -> dict:
+        downloaded = total = speed = 0
+        for d in self._streams:
+            size = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+            total += size
+            if d.get("status") == "finished":
+                downloaded += d.get("downloaded_bytes") or size
+            else:
+                downloaded += d.get("downloaded_bytes") or 0
+                speed += d.get("speed") or 0
+        if all(d.get("status") == "finished" for d in self._streams):
+            return {"status": "finished", "downloaded_bytes": downloaded, "total_bytes": total}
         return {
-            "filename": os.path.basename(filename),
-            "title": info.get("title"),
-            "filesize": os.path.getsize(filename) if os.path.exists(filename) else None,
+            "status": "downloading",
+            "downloaded_bytes": downloaded,
+            "total_bytes": total,
+            "speed": speed,
+            "eta": int((total - downloaded) / speed) if speed and total > downloaded else None,
         }
+
+
+def _download_parallel(info: dict, base_opts: dict, ydl, progress_callback, connections: int, throttle=None) -> dict:
+    """Fetch every requested stream of a merge format concurrently (one thread and
+    one YoutubeDL each), then merge them into one file, in the container format
+    selection picked (info["ext"], mp4), copying the streams as they are. The job's connection budget is split between the streams, and
+    they share its bandwidth bucket."""
+    streams = info["requested_formats"]
+    final = ydl.prepare_filename(info)
+    base, _ = os.path.splitext(final)
+    progress = _CombinedProgress(progress_callback, len(streams))
+    per_stream = max(1, connections // len(streams))
+
+    def fetch(index: int, fmt: dict) -> str:
+        stream_info = {k: v for k, v in info.items() if k != "requested_formats"}
+        stream_info.update(fmt)
+        path = f"{base}.f{fmt['format_id']}.{fmt['ext']}"
+        opts = {
+            **base_opts,
+            "concurrent_fragment_downloads": per_stream,
+            "progress_hooks": [progress.hook(index), *_throttle_hooks(throttle)],
+        }
+        try:
+            with yt_dlp.YoutubeDL(opts) as stream_ydl:
+                if segmented_download.is_segmentable(stream_info, per_stream):
+                    try:
+                        segmented_download.download_segmented(
+                            stream_ydl, stream_info, path, per_stream, progress.hook(index), throttle
+                        )
+                        return path
+                    except segmented_download.RangeNotSupported:
+                        pass
+                segmented_download.discard(path)
+                ok, _ = stream_ydl.dl(path, stream_info)  # resumes an earlier attempt's .part
+            if not ok:
+                raise yt_dlp.utils.DownloadError(f"Stream {fmt['format_id']} failed to download")
+        except BaseException:
+            progress.abort.set()  # make the sibling stream give up too
+            raise
+        return path
+
+    with ThreadPoolExecutor(max_workers=len(streams)) as pool:
+        futures = [pool.submit(fetch, i, fmt) for i, fmt in enumerate(streams)]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        # Report the stream that actually failed, not the sibling we cancelled
+        real = [e for e in errors if not isinstance(e, yt_dlp.utils.DownloadCancelled)]
+        raise (real or errors)[0]
+    paths = [f.result() for f in futures]
+
+    _postprocessor_hooks(ydl, "started", "Merger", info)
+    _merge_streams(paths, streams, final)
+    _postprocessor_hooks(ydl, "finished", "Merger", info)
+    for path in paths:
+        os.remove(path)
+    return _result(final, info)
+
+
+def _merge_streams(paths: list[str], streams: list[dict], output: str) -> None:
+    """Mux the downloaded streams into one file with ffmpeg, copying (not re-encoding)."""
+    cmd = ["ffmpeg", "-y", "-loglevel", "error"]
+    for path in paths:
+        cmd += ["-i", path]
+    have_video = have_audio = False
+    for i, fmt in enumerate(streams):
+        if fmt.get("vcodec", "none") != "none" and not have_video:
+            cmd += ["-map", f"{i}:v:0"]
+            have_video = True
+        if fmt.get("acodec", "none") != "none" and not have_audio:
+            cmd += ["-map", f"{i}:a:0"]
+            have_audio = True
+    base, ext = os.path.splitext(output)
+    tmp = base + ".merging" + ext  # ffmpeg picks the muxer from the extension
+    cmd += ["-c", "copy", tmp]
+    with _merge_slots:
+        started = time.monotonic()
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        metrics.MERGE_TIME.observe(time.monotonic() - started)
+    if proc.returncode != 0:
+        raise yt_dlp.utils.PostProcessingError(f"ffmpeg merge failed: {proc.stderr[-500:]}")
+    os.replace(tmp, output)
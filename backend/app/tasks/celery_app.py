@@ -4,11 +4,27 @@ Celery instance configuration.
 Celery is the task queue that runs video downloads in a separate worker process.
 This keeps the FastAPI server responsive — downloads happen in the background.
 Redis is used as both the message broker (task queue) and result backend.
+
+Downloads are routed to one of two queues, "short" and "long", chosen per job by the
+fair scheduler (services/scheduler.py), which also decides when each job is sent.
+Run workers with `-Q short,long`, or dedicate workers to one queue.
+
+Downloads are network-bound, so besides the default prefork pool (one process, and
+one copy of yt-dlp, per concurrent download) a worker can run WORKER_POOL=threads:
+WORKER_THREADS downloads in one process. The task and the Redis progress protocol
+are the same either way; ffmpeg merges are capped per process (MAX_CONCURRENT_MERGES).
+
+Every worker also runs the downloads-directory janitor (services/janitor.py) and, with
+NODE_LOCAL_STORAGE, the internal file server the API fetches finished files from
+(services/node_files.py).
 """
 
 from celery import Celery
+from celery.signals import worker_ready
+from kombu import Queue
 
 from app.config import settings
+from app.services.scheduler import QUEUES, SHORT
 
 celery_app = Celery(
     "dl_worker",
@@ -22,6 +38,20 @@ celery_app.conf.update(
     result_serializer="json",
     accept_content=["json"],
     task_track_started=True,
-    worker_concurrency=settings.MAX_CONCURRENT_DOWNLOADS,  # max simultaneous downloads
+    worker_pool=settings.WORKER_POOL,
+    worker_concurrency=settings.worker_concurrency,  # max simultaneous downloads per worker
     task_acks_late=True,  # only acknowledge task after it completes (prevents losing tasks on crash)
+    task_reject_on_worker_lost=True,  # ...including when the worker process itself dies mid-download
+    task_queues=[Queue(queue) for queue in QUEUES],
+    task_default_queue=SHORT,
+    worker_prefetch_multiplier=1,  # the scheduler decides the order — don't let a worker hoard tasks
 )
+
+
+@worker_ready.connect
+def _start_background_services(**_):
+    from app.services import janitor, node_files
+
+    if settings.NODE_LOCAL_STORAGE:
+        node_files.start_server()
+    janitor.start()
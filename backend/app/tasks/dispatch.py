@@ -0,0 +1,19 @@
+"""
+Sending tasks from the API process.
+
+The API publishes tasks by name instead of importing download_task, which would pull
+yt-dlp and the whole download stack into the web server. Celery itself is imported on
+the first dispatch, not at startup.
+"""
+
+DOWNLOAD_TASK = "download_video"  # must match the name in @celery_app.task(...)
+
+
+def send_download(download_id: str, url: str, format_id: str, queue: str = "short") -> None:
+    """Queue the download task on a Celery queue ("short"/"long", see services/scheduler.py);
+    the Celery task id is the download id. Blocking."""
+    from app.tasks.celery_app import celery_app
+
+    celery_app.send_task(
+        DOWNLOAD_TASK, args=(download_id, url, format_id), task_id=download_id, queue=queue
+    )
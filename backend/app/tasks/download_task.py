@@ -2,78 +2,184 @@
 Celery task that downloads a video using yt-dlp.
 
 This runs in the Celery worker process (not the API server). It:
-  1. Calls yt-dlp to download the video
-  2. Publishes real-time progress updates to Redis (which the SSE endpoint streams to the browser)
+  1. Calls yt-dlp to download the video, reusing the info_dict from /api/extract when still fresh
+  2. Publishes real-time progress updates to Redis (which the SSE endpoint streams to the browser),
+     through the process's background publisher so the download thread never waits on Redis
   3. Updates the job state in Redis when done (or on failure)
+  4. Frees its scheduler slot and lets the next waiting job start
+
+Along the way it records the job's timing trace (utils/trace.py) and, with the sampling
+profiler on, keeps the stacks of the slowest downloads (utils/profiler.py). With bandwidth
+shaping on, the transfer is paced by the job's share of the worker's budget
+(services/bandwidth.py).
+
+Transient failures (network errors, 429/5xx) are retried with exponential backoff. The
+.part file (and for segmented downloads, its checkpoint) is kept, so the retry — or a
+redelivery after a worker crash (acks_late) — resumes where the last attempt stopped.
+
+A cancelled download (a speculative prefetch nobody claimed, see services/prefetch.py)
+stops at the progress publisher's next flush and deletes its directory.
 """
 
+import logging
+import os
+import random
+import shutil
 import time
 
+from yt_dlp.utils import DownloadCancelled
+
+from app.services import bandwidth, disk, scheduler, shared_cache
 from app.tasks.celery_app import celery_app
-from app.services.ytdlp_service import download_video
-from app.utils.progress import set_progress, get_job, set_job
+from app.services.ytdlp_service import download_video, is_transient
+from app.utils.formats import is_single_stream, job_options
+from app.utils import metrics
+from app.utils.batch_store import sync_batch_store
+from app.utils.info_store import load_info
+from app.utils.job_store import ACTIVE_STATUSES, sync_job_store as store
+from app.utils.profiler import profiled
+from app.utils.progress_publisher import progress_publisher
+from app.utils.trace import Trace
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 
-@celery_app.task(bind=True, name="download_video")
+@celery_app.task(bind=True, name="download_video", max_retries=settings.DOWNLOAD_RETRIES)
 def download_video_task(self, download_id: str, url: str, format_id: str):
-    last_update = 0  # timestamp of last progress push — used for throttling
+    partial_recorded = False
+    streamable = False
+    shared_key = None
+    batch_id = None
+    retrying = False
+    options = {}
+    last_progress = 0.0
+    output_dir = settings.DOWNLOADS_DIR
+    # With worker-local storage, the job records which node has its files
+    node = {"node": settings.node_url} if settings.NODE_LOCAL_STORAGE else {}
+    domain = scheduler.domain_of(url)
+    started = time.monotonic()
+    transferred_at = None  # when the last byte arrived (merging/post-processing comes after)
+    counted_bytes = 0      # already added to the per-site byte counter
+    first_byte = False
+    trace = Trace(download_id, {})
 
     try:
         # Mark the job as actively downloading
-        job = get_job(download_id)
+        job = store.get(download_id)
+        if job is None and store.is_cancelled(download_id):
+            metrics.DOWNLOADS.inc(status="cancelled")
+            return None
         if job:
-            job["status"] = "downloading"
-            set_job(download_id, job)
+            trace = Trace(download_id, job)
+            trace.mark("picked_up", attempt=self.request.retries + 1)
+            store.transition(download_id, ("pending",), status="downloading", **node)
+            shared_key = job.get("shared_key")
+            batch_id = job.get("batch_id")
+            options = job_options(job)
+            streamable = bool(job.get("stream")) and is_single_stream(format_id) and not options
+            if job.get("directory"):
+                # A prefetch's own directory, so it never shares a name with a real job's files
+                output_dir = os.path.join(settings.DOWNLOADS_DIR, job["directory"])
+                os.makedirs(output_dir, exist_ok=True)
+
+        if shared_key:
+            # Shared mode — write into the content-addressed directory other jobs attach to
+            output_dir = shared_cache.shared_dir(shared_key)
+            os.makedirs(output_dir, exist_ok=True)
 
         def progress_callback(d):
-            """Called by yt-dlp during download with status updates.
-            Throttled to every 500ms to avoid flooding Redis/SSE."""
-            nonlocal last_update
-            now = time.time()
+            """Called by yt-dlp during download with status updates. Only hands them to
+            the progress publisher, which coalesces them (see utils/progress_publisher.py)."""
+            nonlocal partial_recorded, last_progress, transferred_at, counted_bytes, first_byte
+
+            if progress_publisher.is_cancelled(download_id):
+                raise DownloadCancelled("Download cancelled")
+            if d["status"] == "downloading" and streamable and not partial_recorded and d.get("tmpfilename"):
+                # Tell GET /stream which file to tail (relative to DOWNLOADS_DIR)
+                partial_recorded = True
+                store.update(download_id, partial_filename=os.path.relpath(
+                    d["tmpfilename"], settings.DOWNLOADS_DIR
+                ))
 
             if d["status"] == "downloading":
-                if now - last_update < 0.5:
-                    return  # skip — too soon since last update
-                last_update = now
+                if not first_byte and d.get("downloaded_bytes"):
+                    first_byte = True
+                    trace.mark("first_byte")
+                if d.get("fragment_count"):
+                    trace.fragment(d.get("fragment_index") or 0, d["fragment_count"])
 
                 total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
                 downloaded = d.get("downloaded_bytes", 0)
                 pct = (downloaded / total * 100) if total > 0 else 0
+                last_progress = round(pct, 1)
 
-                set_progress(download_id, {
+                # Bytes resumed from an earlier attempt weren't fetched this time
+                counted_bytes = max(counted_bytes, d.get("resumed_bytes") or 0)
+                metrics.DOWNLOAD_BYTES.inc(downloaded - counted_bytes, domain=domain)
+                counted_bytes = max(counted_bytes, downloaded)
+
+                progress_publisher.publish(download_id, {
                     "status": "downloading",
-                    "progress": round(pct, 1),
-                    "downloaded_bytes": downloaded,
+                    "progress": last_progress,
+                    "downloaded_bytes": downloaded,  # includes bytes resumed from an earlier attempt
+                    "resumed_bytes": d.get("resumed_bytes", 0),
                     "total_bytes": total,
                     "speed": d.get("speed", 0),
                     "eta": d.get("eta", 0),
+                    "attempt": self.request.retries + 1,
                 })
 
             elif d["status"] == "finished":
+                transferred_at = time.monotonic()
+                trace.mark("downloaded")
+                metrics.DOWNLOAD_BYTES.inc(
+                    (d.get("downloaded_bytes") or d.get("total_bytes") or 0) - counted_bytes, domain=domain
+                )
+                counted_bytes = 0  # the next file (if any) counts from zero
                 # yt-dlp finished downloading — now ffmpeg is merging video+audio
-                set_progress(download_id, {
+                progress_publisher.publish(download_id, {
                     "status": "processing",
                     "progress": 99.0,
                 })
 
-        # Actually download the video
-        result = download_video(
-            url, format_id, settings.DOWNLOADS_DIR, progress_callback
-        )
-
-        # Update job state to completed
-        job = get_job(download_id)
-        if job:
-            job["status"] = "completed"
-            job["filename"] = result["filename"]
-            job["title"] = result.get("title") or job.get("title")
-            job["filesize"] = result.get("filesize")
-            job["progress"] = 100.0
-            set_job(download_id, job)
+        # Actually download the video (skipping extraction if /api/extract left us a fresh info_dict)
+        with profiled("download", download_id), bandwidth.shaped(download_id) as throttle:
+            result = download_video(
+                url, format_id, output_dir, progress_callback, info=load_info(url),
+                streamable=streamable, on_event=trace.mark, throttle=throttle,
+                on_output=lambda stem: store.update(
+                    download_id, output_stem=os.path.relpath(stem, settings.DOWNLOADS_DIR)
+                ),  # so the janitor leaves this job's partial files alone however long it runs
+                **options,
+            )
+        metrics.TRANSFER_TIME.observe((transferred_at or time.monotonic()) - started)
+        if store.is_cancelled(download_id):
+            # Cancelled too late for the progress hook to notice (e.g. while merging)
+            _discard(output_dir)
+            metrics.DOWNLOADS.inc(status="cancelled")
+            return None
+        metrics.DOWNLOADS.inc(status="completed")
+        if shared_key:
+            shared_cache.complete(shared_key, result["filename"], result.get("filesize"), **node)
+            shared_cache.evict()  # keep the shared directory under its disk budget
+
+        # Update job state to completed (no-op if the job expired or was deleted meanwhile)
+        completed = {
+            "status": "completed",
+            "filename": result["filename"],
+            "filesize": result.get("filesize"),
+            "progress": 100.0,
+            **node,
+        }
+        if result.get("title"):
+            completed["title"] = result["title"]
+        if store.transition(download_id, ACTIVE_STATUSES, **completed) and batch_id:
+            sync_batch_store.record_result(batch_id, "completed")
+        trace.mark("completed")
 
         # Push final "completed" event so the frontend knows the download is ready
-        set_progress(download_id, {
+        progress_publisher.publish(download_id, {
             "status": "completed",
             "progress": 100.0,
             "filename": result["filename"],
@@ -82,16 +188,61 @@ def download_video_task(self, download_id: str, url: str, format_id: str):
         return {"download_id": download_id, "filename": result["filename"]}
 
     except Exception as e:
+        if progress_publisher.is_cancelled(download_id):
+            _discard(output_dir)
+            metrics.DOWNLOADS.inc(status="cancelled")
+            return None
+
+        if is_transient(e) and self.request.retries < settings.DOWNLOAD_RETRIES:
+            # Keep the slot and the partial file; the retry resumes from it
+            retrying = True
+            delay = min(settings.RETRY_BACKOFF * 2 ** self.request.retries, settings.RETRY_BACKOFF_MAX)
+            delay *= random.uniform(0.8, 1.2)  # jitter, so jobs that failed together don't retry together
+            progress_publisher.publish(download_id, {
+                "status": "downloading",
+                "progress": last_progress,
+                "retrying_in": round(delay),
+                "attempt": self.request.retries + 1,
+                "error": str(e)[:500],
+            })
+            metrics.DOWNLOADS.inc(status="retried")
+            trace.mark("retrying", delay=round(delay))
+            raise self.retry(exc=e, countdown=delay)
+
+        metrics.DOWNLOADS.inc(status="failed")
+        if shared_key:
+            shared_cache.fail(shared_key)
+
         # Mark job as failed and push error to the frontend
-        job = get_job(download_id)
-        if job:
-            job["status"] = "failed"
-            job["error_message"] = str(e)[:500]
-            set_job(download_id, job)
+        if store.transition(
+            download_id, ACTIVE_STATUSES, status="failed", error_message=str(e)[:500]
+        ) and batch_id:
+            sync_batch_store.record_result(batch_id, "failed")
+        trace.mark("failed")
 
-        set_progress(download_id, {
+        progress_publisher.publish(download_id, {
             "status": "failed",
             "progress": 0,
             "error": str(e)[:500],
         })
         raise
+
+    finally:
+        if not retrying:
+            _release_slot(download_id)
+
+
+def _discard(output_dir: str) -> None:
+    """Delete a cancelled download's files: its whole directory, if it has its own."""
+    if output_dir != settings.DOWNLOADS_DIR:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def _release_slot(download_id: str) -> None:
+    """Free the job's scheduler slot and disk reservation, and start the next waiting job."""
+    scheduler.finish(download_id)
+    disk.release(download_id)
+    try:
+        scheduler.pump()
+    except Exception:
+        logger.exception("Could not dispatch the next waiting download")
@@ -0,0 +1,92 @@
+"""
+Redis state for batch downloads (POST /api/batches).
+
+  - dl:batch:{id} — Hash with the batch's format, its item download ids (JSON list) and
+                    three counters: total, completed, failed.
+
+Each item is an ordinary download job (dl:job:{id}) with a batch_id field. Whoever
+moves an item into a terminal status — the Celery task, or the API for items attached
+to a shared download — bumps the matching counter with HINCRBY, so reading the
+aggregate state is a single HGETALL no matter how many items there are.
+
+Batches live for BATCH_TTL, and so do their items' job records.
+"""
+
+import json
+
+from app.config import settings
+from app.utils.redis_pool import async_redis, sync_redis
+
+COUNTERS = ("total", "completed", "failed")
+
+# HINCRBY that doesn't recreate (without a TTL) a batch that already expired
+_RECORD_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+return redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+"""
+
+
+def batch_key(batch_id: str) -> str:
+    return f"dl:batch:{batch_id}"
+
+
+def _decode(raw: dict) -> dict | None:
+    if not raw:
+        return None
+    batch = {k.decode(): v.decode() for k, v in raw.items()}
+    for field in COUNTERS:
+        batch[field] = int(batch.get(field, 0))
+    batch["items"] = json.loads(batch.get("items", "[]"))
+    return batch
+
+
+class BatchStore:
+    """Blocking batch store — used by the Celery worker."""
+
+    def __init__(self, client):
+        self.redis = client
+        self._record = client.register_script(_RECORD_LUA)
+
+    def get(self, batch_id: str) -> dict | None:
+        return _decode(self.redis.hgetall(batch_key(batch_id)))
+
+    def record_result(self, batch_id: str, status: str) -> None:
+        """Count one item as completed or failed. Call once per item, on the transition."""
+        self._record(keys=[batch_key(batch_id)], args=[status])
+
+    def delete(self, batch_id: str) -> None:
+        self.redis.delete(batch_key(batch_id))
+
+
+class AsyncBatchStore:
+    """Non-blocking batch store — used by FastAPI routes."""
+
+    def __init__(self, client):
+        self.redis = client
+        self._record = client.register_script(_RECORD_LUA)
+
+    async def create(self, batch_id: str, format_id: str, item_ids: list[str]) -> None:
+        pipe = self.redis.pipeline()
+        pipe.hset(batch_key(batch_id), mapping={
+            "id": batch_id,
+            "format_id": format_id,
+            "items": json.dumps(item_ids),
+            "total": len(item_ids),
+            "completed": 0,
+            "failed": 0,
+        })
+        pipe.expire(batch_key(batch_id), settings.BATCH_TTL)
+        await pipe.execute()
+
+    async def get(self, batch_id: str) -> dict | None:
+        return _decode(await self.redis.hgetall(batch_key(batch_id)))
+
+    async def record_result(self, batch_id: str, status: str) -> None:
+        await self._record(keys=[batch_key(batch_id)], args=[status])
+
+    async def delete(self, batch_id: str) -> None:
+        await self.redis.delete(batch_key(batch_id))
+
+
+batch_store = AsyncBatchStore(async_redis)
+sync_batch_store = BatchStore(sync_redis)
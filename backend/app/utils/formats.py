@@ -0,0 +1,63 @@
+"""
+Format-id helpers that don't need yt-dlp, so the API can use them without importing it.
+"""
+
+# Job fields that make a download a clip and/or audio-only (see StartDownloadRequest)
+JOB_OPTIONS = ("start_time", "end_time", "audio_only")
+
+
+def is_single_stream(format_id: str) -> bool:
+    """True if the format is fetched as one file with no ffmpeg merge, so the
+    bytes on disk are already the final file and can be streamed while downloading."""
+    return "+" not in format_id
+
+
+def audio_format(format_id: str) -> str:
+    """Format selector for an audio-only download of `format_id`: its audio part for a
+    merge format ("137+140" → "140"), otherwise the best audio-only stream."""
+    first = format_id.split("/")[0]
+    if "+" in first:
+        return first.split("+")[-1]
+    return f"bestaudio/{format_id}"
+
+
+def job_options(job: dict) -> dict:
+    """The clip/audio options set on a job record, as keyword arguments."""
+    return {k: job[k] for k in JOB_OPTIONS if job.get(k) not in (None, False)}
+
+
+def is_transformed(job: dict) -> bool:
+    """True for clip and audio-only jobs: ffmpeg writes their output at the end, so
+    there is no growing file to stream."""
+    return bool(job_options(job))
+
+
+def estimate_filesize(info: dict, format_id: str) -> int:
+    """Expected download size in bytes from an info_dict (0 if unknown).
+    "137+140" → sum of the parts; selectors like "bestvideo+bestaudio/best" → largest format."""
+    sizes = {f.get("format_id"): f.get("filesize") or f.get("filesize_approx") or 0
+             for f in info.get("formats") or []}
+    wanted = format_id.split("/")[0].split("+")
+    if all(part in sizes for part in wanted):
+        return sum(sizes[part] for part in wanted)
+    return max(sizes.values(), default=0)
+
+
+def expected_download(info: dict, format_id: str, start_time: float | None = None,
+                      end_time: float | None = None, audio_only: bool = False) -> tuple[float, int]:
+    """(seconds, bytes) a job will actually fetch: the format's size, cut down to the
+    audio stream and/or the clip's share of the video."""
+    duration = info.get("duration") or 0
+    selector = audio_format(format_id) if audio_only else format_id
+    if selector.split("/")[0] == "bestaudio":
+        size = max((f.get("filesize") or f.get("filesize_approx") or 0 for f in info.get("formats") or []
+                    if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")), default=0)
+    else:
+        size = estimate_filesize(info, selector)
+    if start_time is not None or end_time is not None:
+        end = duration if end_time is None else min(end_time, duration or end_time)
+        seconds = max(end - (start_time or 0), 0)
+        if duration:
+            size = int(size * seconds / duration)
+        duration = seconds
+    return duration, size
@@ -0,0 +1,91 @@
+"""
+Hand-off of raw yt-dlp info_dicts from the extract step to the download worker.
+
+POST /api/extract already did the slow page/API extraction. The sanitized info_dict
+is stored here (zlib-compressed JSON, keyed by normalized URL) so download_video_task
+can go straight to fetching media instead of extracting a second time.
+
+  - dl:info:{normalized_url} — compressed info_dict, expires with the metadata cache
+"""
+
+import json
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+from app.config import settings
+from app.utils.redis_pool import sync_redis
+from app.utils.urls import normalize_url
+
+# Keys that are large and never needed to download the media
+BULKY_KEYS = ("thumbnails", "subtitles", "automatic_captions", "heatmap", "description")
+
+# Re-extract if any format URL expires within this many seconds
+EXPIRY_MARGIN = 120
+
+
+def compact_info(info: dict) -> dict:
+    """Drop the bulky metadata and stamp the extraction time."""
+    compact = {k: v for k, v in info.items() if k not in BULKY_KEYS}
+    compact["_dl_extracted_at"] = time.time()
+    return compact
+
+
+def save_info(url: str, info: dict) -> None:
+    """Store a (sanitized) info_dict for the worker to pick up."""
+    payload = zlib.compress(json.dumps(compact_info(info)).encode(), 6)
+    sync_redis.set(
+        f"dl:info:{normalize_url(url)}", payload, ex=settings.EXTRACT_CACHE_REDIS_TTL
+    )
+
+
+def load_info(url: str, require_fresh: bool = True) -> dict | None:
+    """Return the stored info_dict for `url`. By default only if it is still fresh
+    enough to download from."""
+    raw = sync_redis.get(f"dl:info:{normalize_url(url)}")
+    if not raw:
+        return None
+    info = json.loads(zlib.decompress(raw))
+    if require_fresh and not is_fresh(info):
+        return None
+    return info
+
+
+def canonical_video_id(url: str) -> str:
+    """Site-independent identity of the video behind `url` ("Youtube:dQw4w9WgXcQ"),
+    so different links to the same video compare equal. Falls back to the
+    normalized URL when no extraction result is stored."""
+    info = load_info(url, require_fresh=False)
+    if info and info.get("id") and info.get("extractor_key"):
+        return f"{info['extractor_key']}:{info['id']}"
+    return normalize_url(url)
+
+
+def is_fresh(info: dict) -> bool:
+    """An info_dict is reusable if it is a single video, recent, and none of its signed
+    format URLs are about to expire (e.g. googlevideo's `expire=` parameter)."""
+    if info.get("_type", "video") != "video":
+        return False  # playlists are re-extracted so noplaylist still applies
+    if time.time() - info.get("_dl_extracted_at", 0) > settings.INFO_REUSE_MAX_AGE:
+        return False
+    deadline = time.time() + EXPIRY_MARGIN
+    for f in info.get("formats") or []:
+        expires = _url_expiry(f.get("url") or "")
+        if expires is not None and expires < deadline:
+            return False
+    return True
+
+
+def _url_expiry(url: str) -> int | None:
+    """Unix expiry timestamp embedded in a signed URL, as a query param or path segment."""
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    for name in ("expire", "expires", "Expires"):
+        if name in query and query[name][0].isdigit():
+            return int(query[name][0])
+    segments = parts.path.split("/")
+    if "expire" in segments:
+        idx = segments.index("expire") + 1
+        if idx < len(segments) and segments[idx].isdigit():
+            return int(segments[idx])
+    return None
@@ -0,0 +1,268 @@
+"""
+Redis job store for ephemeral job state and real-time progress.
+
+Three key types are stored in Redis:
+  - dl:job:{id}      — Hash of job fields (status, filename, error, etc.). Used by REST endpoints.
+  - dl:progress:{id} — Latest progress snapshot. Also published via Pub/Sub for SSE streaming.
+  - dl:served:{id}   — Set of "start-end" byte ranges already delivered by /file (Range requests).
+
+Plus two shared keys:
+  - dl:watched   — Sorted set of download ids some client is watching (SSE/WebSocket),
+                   scored with when that expires unless the API refreshes it. Workers
+                   publish progress of unwatched downloads less often (see progress_publisher.py).
+  - dl:cancelled — Sorted set of cancelled download ids (speculative prefetches nobody
+                   claimed, see services/prefetch.py), scored with when the entry lapses.
+                   The worker running one stops at its next progress flush.
+
+All auto-expire after 10 minutes (JOB_TTL) so nothing persists. Jobs that belong to a
+batch are created with the batch's longer TTL, which later updates never shorten; their
+served ranges live as long as they do.
+
+Each job field is stored JSON-encoded in its own hash field, so updates touch only the
+fields they change instead of rewriting the whole record. Status changes go through a
+server-side script that checks the current status first, which makes them atomic
+(e.g. a late "downloading" update can't overwrite "failed").
+
+Two stores sharing the core API (create/get/update/transition/delete, served ranges,
+progress snapshots), each with the extras only its side needs:
+  - job_store       — async, for FastAPI routes (shared connection pool); also mark_watched()
+  - sync_job_store  — blocking, for the Celery worker and code run off the event loop;
+                      also touch(), publish_many(), cancel() and is_cancelled()
+"""
+
+import json
+import time
+
+from app.utils.redis_pool import async_redis, sync_redis
+
+JOB_TTL = 600  # 10 minutes
+WATCHED_KEY = "dl:watched"
+CANCELLED_KEY = "dl:cancelled"
+
+ACTIVE_STATUSES = ("pending", "downloading", "processing")
+
+# KEYS[1] = job hash; ARGV[1] = ttl; ARGV[2] = JSON list of allowed current statuses
+# (already JSON-encoded, empty = any); ARGV[3..] = field/value pairs.
+# Only touches jobs that still exist, so a late update can't resurrect a deleted job,
+# and only ever extends the TTL.
+_TRANSITION_LUA = """
+local current = redis.call('HGET', KEYS[1], 'status')
+if not current then return 0 end
+local allowed = cjson.decode(ARGV[2])
+if #allowed > 0 then
+    local ok = false
+    for _, status in ipairs(allowed) do
+        if status == current then ok = true break end
+    end
+    if not ok then return 0 end
+end
+if #ARGV > 2 then redis.call('HSET', KEYS[1], unpack(ARGV, 3)) end
+if redis.call('TTL', KEYS[1]) < tonumber(ARGV[1]) then redis.call('EXPIRE', KEYS[1], ARGV[1]) end
+return 1
+"""
+
+# KEYS[1] = job hash, KEYS[2] = served set; ARGV[1] = range, ARGV[2] = minimum ttl.
+# The set lives as long as the job (a batch item's BATCH_TTL, say), at least the minimum.
+_SERVED_LUA = """
+redis.call('SADD', KEYS[2], ARGV[1])
+local ttl = math.max(redis.call('TTL', KEYS[1]), tonumber(ARGV[2]))
+redis.call('EXPIRE', KEYS[2], ttl)
+return redis.call('SMEMBERS', KEYS[2])
+"""
+
+
+def job_key(download_id: str) -> str:
+    return f"dl:job:{download_id}"
+
+
+def progress_key(download_id: str) -> str:
+    return f"dl:progress:{download_id}"
+
+
+def served_key(download_id: str) -> str:
+    return f"dl:served:{download_id}"
+
+
+def _decode_ranges(members) -> list[tuple[int, int]]:
+    ranges = []
+    for m in members:
+        start, _, end = m.decode().partition("-")
+        ranges.append((int(start), int(end)))
+    return ranges
+
+
+def _encode(fields: dict) -> dict[str, str]:
+    return {k: json.dumps(v) for k, v in fields.items()}
+
+
+def _decode(raw: dict) -> dict | None:
+    if not raw:
+        return None
+    return {k.decode(): json.loads(v) for k, v in raw.items()}
+
+
+def _transition_args(allowed_from: tuple[str, ...] | None, fields: dict) -> list:
+    allowed = json.dumps([json.dumps(s) for s in allowed_from or ()])
+    flat = [item for pair in _encode(fields).items() for item in pair]
+    return [JOB_TTL, allowed, *flat]
+
+
+class JobStore:
+    """Blocking job store — used by the Celery worker."""
+
+    def __init__(self, client):
+        self.redis = client
+        self._transition = client.register_script(_TRANSITION_LUA)
+        self._add_served = client.register_script(_SERVED_LUA)
+
+    def create(self, download_id: str, job: dict, ttl: int = JOB_TTL) -> None:
+        """Write a brand-new job record in one round trip."""
+        pipe = self.redis.pipeline()
+        pipe.hset(job_key(download_id), mapping=_encode(job))
+        pipe.expire(job_key(download_id), ttl)
+        pipe.execute()
+
+    def get(self, download_id: str) -> dict | None:
+        """Retrieve the full job state."""
+        return _decode(self.redis.hgetall(job_key(download_id)))
+
+    def update(self, download_id: str, **fields) -> bool:
+        """Set some fields of an existing job. Returns False if the job is gone."""
+        return self.transition(download_id, None, **fields)
+
+    def transition(self, download_id: str, allowed_from: tuple[str, ...] | None, **fields) -> bool:
+        """Atomically set fields only if the job's current status is in `allowed_from`."""
+        return bool(self._transition(
+            keys=[job_key(download_id)], args=_transition_args(allowed_from, fields)
+        ))
+
+    def delete(self, download_id: str) -> bool:
+        """Immediately remove all data for a job (called after the user downloads the file).
+        Returns False if the job was already gone, so concurrent cleanups run only once."""
+        pipe = self.redis.pipeline()
+        pipe.delete(job_key(download_id))
+        pipe.delete(progress_key(download_id), served_key(download_id))
+        return pipe.execute()[0] > 0
+
+    def touch(self, download_ids: list[str]) -> None:
+        """Extend the TTL of existing jobs back to JOB_TTL (never shortening it), in one round trip."""
+        pipe = self.redis.pipeline(transaction=False)
+        for download_id in download_ids:
+            self._transition(keys=[job_key(download_id)], args=_transition_args(None, {}), client=pipe)
+        pipe.execute()
+
+    def add_served_range(self, download_id: str, start: int, end: int) -> list[tuple[int, int]]:
+        """Record that bytes [start, end) were delivered; returns every range delivered so far."""
+        return _decode_ranges(self._add_served(
+            keys=[job_key(download_id), served_key(download_id)], args=[f"{start}-{end}", JOB_TTL]
+        ))
+
+    def set_progress(self, download_id: str, data: dict) -> None:
+        """Save a progress snapshot AND publish it to Pub/Sub, in one round trip."""
+        payload = json.dumps(data)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(progress_key(download_id), payload, ex=JOB_TTL)
+        pipe.publish(progress_key(download_id), payload)
+        pipe.execute()
+
+    def publish_many(self, progress: list[tuple[str, dict]], job_updates: list[tuple[str, dict]] = (),
+                     running: list[str] = ()) -> tuple[set[str], set[str]]:
+        """In one round trip: update() several jobs, then set_progress() several (in
+        order). Also returns which of the `running` ids a client is watching right now,
+        and which have been cancelled."""
+        pipe = self.redis.pipeline(transaction=False)
+        for download_id, fields in job_updates:
+            self._transition(keys=[job_key(download_id)], args=_transition_args(None, fields), client=pipe)
+        for download_id, data in progress:
+            payload = json.dumps(data)
+            pipe.set(progress_key(download_id), payload, ex=JOB_TTL)
+            pipe.publish(progress_key(download_id), payload)
+        if running:
+            pipe.zmscore(WATCHED_KEY, running)
+            pipe.zmscore(CANCELLED_KEY, running)
+        results = pipe.execute()
+        if not running:
+            return set(), set()
+        now = time.time()
+        watched = {i for i, until in zip(running, results[-2]) if until and until > now}
+        return watched, {i for i, until in zip(running, results[-1]) if until}
+
+    def cancel(self, download_id: str) -> None:
+        """Tell the worker running this download to stop (see is_cancelled)."""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(CANCELLED_KEY, {download_id: now + JOB_TTL})
+        pipe.zremrangebyscore(CANCELLED_KEY, "-inf", now)
+        pipe.execute()
+
+    def is_cancelled(self, download_id: str) -> bool:
+        return bool(self.redis.zscore(CANCELLED_KEY, download_id))
+
+    def get_progress(self, download_id: str) -> dict | None:
+        """Get the latest progress snapshot (for clients that connect late)."""
+        raw = self.redis.get(progress_key(download_id))
+        return json.loads(raw) if raw else None
+
+
+class AsyncJobStore:
+    """Non-blocking job store with the core API of JobStore, plus mark_watched() — used by FastAPI routes."""
+
+    def __init__(self, client):
+        self.redis = client
+        self._transition = client.register_script(_TRANSITION_LUA)
+        self._add_served = client.register_script(_SERVED_LUA)
+
+    async def create(self, download_id: str, job: dict, ttl: int = JOB_TTL) -> None:
+        pipe = self.redis.pipeline()
+        pipe.hset(job_key(download_id), mapping=_encode(job))
+        pipe.expire(job_key(download_id), ttl)
+        await pipe.execute()
+
+    async def get(self, download_id: str) -> dict | None:
+        return _decode(await self.redis.hgetall(job_key(download_id)))
+
+    async def update(self, download_id: str, **fields) -> bool:
+        return await self.transition(download_id, None, **fields)
+
+    async def transition(self, download_id: str, allowed_from: tuple[str, ...] | None, **fields) -> bool:
+        return bool(await self._transition(
+            keys=[job_key(download_id)], args=_transition_args(allowed_from, fields)
+        ))
+
+    async def delete(self, download_id: str) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.delete(job_key(download_id))
+        pipe.delete(progress_key(download_id), served_key(download_id))
+        return (await pipe.execute())[0] > 0
+
+    async def add_served_range(self, download_id: str, start: int, end: int) -> list[tuple[int, int]]:
+        return _decode_ranges(await self._add_served(
+            keys=[job_key(download_id), served_key(download_id)], args=[f"{start}-{end}", JOB_TTL]
+        ))
+
+    async def set_progress(self, download_id: str, data: dict) -> None:
+        payload = json.dumps(data)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(progress_key(download_id), payload, ex=JOB_TTL)
+        pipe.publish(progress_key(download_id), payload)
+        await pipe.execute()
+
+    async def mark_watched(self, download_ids: list[str], ttl: float) -> None:
+        """Record that clients are watching these downloads, for the next `ttl` seconds.
+        Also keeps their job records alive, like polling does (a queued job can wait long)."""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        if download_ids:
+            pipe.zadd(WATCHED_KEY, {download_id: now + ttl for download_id in download_ids})
+            for download_id in download_ids:
+                await self._transition(keys=[job_key(download_id)], args=_transition_args(None, {}), client=pipe)
+        pipe.zremrangebyscore(WATCHED_KEY, "-inf", now)
+        await pipe.execute()
+
+    async def get_progress(self, download_id: str) -> dict | None:
+        raw = await self.redis.get(progress_key(download_id))
+        return json.loads(raw) if raw else None
+
+
+job_store = AsyncJobStore(async_redis)
+sync_job_store = JobStore(sync_redis)
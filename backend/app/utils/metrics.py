@@ -0,0 +1,220 @@
+"""
+Prometheus metrics, in the text exposition format, without a client library.
+
+Two kinds of metric, same API:
+  - local  — kept in this process's memory (the API: extraction, serving, SSE streams).
+             Updating one is a dict update under a lock.
+  - shared — kept in Redis, so every worker process (prefork children, other hosts)
+             adds to the same series and GET /metrics on the API sees the total.
+             Updates are summed in memory and written by a background thread once
+             per FLUSH_INTERVAL in one pipeline, so the download threads never wait
+             on Redis for them.
+
+Histogram buckets are stored per bucket and made cumulative when rendered.
+
+Keys (no TTL — counters only ever grow, like Prometheus expects):
+  dl:metrics:{name} — Hash "{labels}|{le}" / "{labels}|sum" / "{labels}|count" → value
+"""
+
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from app.utils.redis_pool import sync_redis
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "dl:metrics:"
+FLUSH_INTERVAL = 1.0  # seconds between writes of shared metrics to Redis
+
+# Seconds; covers everything from a cached extraction to a multi-hour download
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+_registry: list["_Metric"] = []
+
+# Shared-metric increments not yet written to Redis: key → field → amount
+_pending: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+_pending_lock = threading.Lock()
+_flusher_pid: int | None = None  # the flusher thread doesn't survive a fork — restart it in children
+
+
+def _queue(key: str, fields: dict[str, float]) -> None:
+    global _flusher_pid
+    with _pending_lock:
+        for field, amount in fields.items():
+            _pending[key][field] += amount
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+            atexit.register(flush)
+
+
+def flush() -> None:
+    """Write pending shared-metric increments to Redis. Blocking."""
+    global _pending
+    with _pending_lock:
+        batch, _pending = _pending, defaultdict(lambda: defaultdict(float))
+    if not batch:
+        return
+    pipe = sync_redis.pipeline(transaction=False)
+    for key, fields in batch.items():
+        for field, amount in fields.items():
+            pipe.hincrbyfloat(key, field, amount)
+    pipe.execute()
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Could not write metrics to Redis")
+
+
+def _labelstr(labels: dict) -> str:
+    return ",".join(f'{k}="{_escape(str(v))}"' for k, v in sorted(labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _series(name: str, labels: str, extra: str = "") -> str:
+    inner = ",".join(filter(None, (labels, extra)))
+    return f"{name}{{{inner}}}" if inner else name
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, shared: bool = False):
+        self.name = name
+        self.help = help
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._values: dict[str, float] = defaultdict(float)  # local only
+        _registry.append(self)
+
+    @property
+    def key(self) -> str:
+        return PREFIX + self.name
+
+    def _add(self, fields: dict[str, float]) -> None:
+        if self.shared:
+            _queue(self.key, fields)
+        else:
+            with self._lock:
+                for field, amount in fields.items():
+                    self._values[field] += amount
+
+    def _snapshot(self) -> dict[str, float]:
+        if self.shared:
+            return {k.decode(): float(v) for k, v in sync_redis.hgetall(self.key).items()}
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._lines(self._snapshot())
+
+    def _lines(self, values: dict[str, float]) -> Iterable[str]:
+        for labels, value in sorted(values.items()):
+            yield f"{_series(self.name, labels)} {_number(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount > 0:
+            self._add({_labelstr(labels): amount})
+
+
+class Gauge(_Metric):
+    """A value kept by this process, or computed when scraped: `collect` returns
+    {((label, value), ...): gauge value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], dict] | None = None):
+        super().__init__(name, help)
+        self._collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_labelstr(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self._add({_labelstr(labels): amount})
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self._add({_labelstr(labels): -amount})
+
+    def _snapshot(self) -> dict[str, float]:
+        if self._collect is None:
+            return super()._snapshot()
+        return {_labelstr(dict(labels)): value for labels, value in self._collect().items()}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS, shared: bool = False):
+        super().__init__(name, help, shared)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        labelstr = _labelstr(labels)
+        le = next(b for b in self.buckets if value <= b)
+        self._add({f"{labelstr}|{_number(le)}": 1, f"{labelstr}|sum": value, f"{labelstr}|count": 1})
+
+    def _lines(self, values: dict[str, float]) -> Iterable[str]:
+        by_labels: dict[str, dict[str, float]] = defaultdict(dict)
+        for field, value in values.items():
+            labels, _, part = field.rpartition("|")
+            by_labels[labels][part] = value
+        for labels, parts in sorted(by_labels.items()):
+            total = 0.0
+            for le in self.buckets:
+                total += parts.get(_number(le), 0)
+                le_label = 'le="' + _number(le) + '"'
+                yield f"{_series(self.name + '_bucket', labels, le_label)} {_number(total)}"
+            yield f"{_series(self.name + '_sum', labels)} {_number(parts.get('sum', 0))}"
+            yield f"{_series(self.name + '_count', labels)} {_number(parts.get('count', 0))}"
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format. Blocking (reads Redis)."""
+    flush()  # include this process's own shared updates
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Pipeline stages ------------------------------------------------------------------
+
+QUEUE_WAIT = Histogram("dl_queue_wait_seconds", "Time a job waited in the scheduler before dispatch", shared=True)
+EXTRACT_TIME = Histogram("dl_extract_seconds", "yt-dlp extraction time on the extraction pool")
+TRANSFER_TIME = Histogram("dl_transfer_seconds", "Time spent fetching a job's bytes from the origin", shared=True)
+MERGE_TIME = Histogram("dl_merge_seconds", "ffmpeg merge / audio extraction time", shared=True)
+SERVE_TIME = Histogram("dl_serve_seconds", "Time to deliver a finished file to the client")
+DOWNLOAD_BYTES = Counter("dl_download_bytes_total", "Bytes fetched from origins, by site", shared=True)
+DOWNLOADS = Counter("dl_downloads_total", "Finished download tasks, by outcome", shared=True)
+PREFETCHES = Counter("dl_prefetches_total", "Speculative prefetches, by outcome (hit rate = hit / started)", shared=True)
+PREFETCH_HEAD_START = Histogram("dl_prefetch_head_start_seconds", "How long an adopted prefetch had been queued when the user picked its format")
+SSE_STREAMS = Gauge("dl_sse_streams", "Open SSE progress streams")
+WS_CONNECTIONS = Gauge("dl_websocket_connections", "Open progress WebSockets")
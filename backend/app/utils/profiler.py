@@ -0,0 +1,112 @@
+"""
+Opt-in sampling profiler for download tasks and extractions (PROFILE_SLOWEST_PCT > 0).
+
+While a profiled block runs, one sampler thread per process reads the block's thread
+stack every PROFILE_INTERVAL (sys._current_frames() — nothing is traced, so the code
+being profiled runs at full speed). When the block ends, its duration is compared
+with the last PROFILE_HISTORY blocks of the same kind in this process: if it is among
+the slowest PROFILE_SLOWEST_PCT percent, its samples are written to
+PROFILE_DIR/{kind}-{ms}ms-{name}.folded, in the folded-stack format flamegraph.pl,
+speedscope and inferno read ("outer;inner;leaf count" per line). The samples of
+every other block are dropped.
+
+Only the thread running the block is sampled. Work a download hands to helper
+threads (parallel fragments, byte-range segments) shows up as the wait for it.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HISTORY = 200  # durations per kind the "slowest N%" is judged against
+MIN_HISTORY = 20       # no profiles are kept until this many blocks have finished
+
+_lock = threading.Lock()
+_active: dict[int, Counter] = {}  # thread id → folded stack → samples
+_history: dict[str, deque] = defaultdict(lambda: deque(maxlen=PROFILE_HISTORY))
+_sampler_pid: int | None = None   # the sampler doesn't survive a fork — restart it in children
+
+
+def _folded(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_loop() -> None:
+    while True:
+        time.sleep(settings.PROFILE_INTERVAL)
+        if not _active:
+            continue
+        frames = sys._current_frames()
+        with _lock:
+            for thread_id, stacks in _active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_folded(frame)] += 1
+        del frames
+
+
+def _ensure_sampler() -> None:
+    global _sampler_pid
+    with _lock:
+        if _sampler_pid != os.getpid():
+            _sampler_pid = os.getpid()
+            threading.Thread(target=_sample_loop, name="profiler", daemon=True).start()
+
+
+def _among_slowest(kind: str, seconds: float) -> bool:
+    with _lock:
+        history = _history[kind]
+        slowest = False
+        if len(history) >= MIN_HISTORY:
+            ordered = sorted(history)
+            cutoff = ordered[min(int(len(ordered) * (1 - settings.PROFILE_SLOWEST_PCT / 100)), len(ordered) - 1)]
+            slowest = seconds >= cutoff
+        history.append(seconds)
+    return slowest
+
+
+def _write(kind: str, name: str, stacks: Counter, seconds: float) -> None:
+    path = os.path.join(settings.PROFILE_DIR, f"{kind}-{round(seconds * 1000)}ms-{name}.folded")
+    try:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    except OSError:
+        logger.exception("Could not write profile %s", path)
+
+
+@contextmanager
+def profiled(kind: str, name: str):
+    """Sample the block if the profiler is on; keep the samples if it was one of the
+    slowest of its kind. `name` identifies it in the file name."""
+    thread_id = threading.get_ident()
+    if settings.PROFILE_SLOWEST_PCT <= 0 or thread_id in _active:
+        yield
+        return
+    _ensure_sampler()
+    stacks = Counter()
+    with _lock:
+        _active[thread_id] = stacks
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        with _lock:
+            del _active[thread_id]
+        seconds = time.monotonic() - started
+        if _among_slowest(kind, seconds) and stacks:
+            _write(kind, name, stacks, seconds)
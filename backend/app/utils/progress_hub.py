@@ -0,0 +1,189 @@
+"""
+Per-process fan-out of progress events to SSE clients.
+
+Instead of one Redis connection + subscription per browser, the API process keeps a
+single pooled Pub/Sub connection pattern-subscribed to dl:progress:* and hands each
+message to in-memory per-download subscriber buffers. Events are pushed the moment
+they arrive — no polling.
+
+Each subscriber buffer is bounded. Progress events are full snapshots, so a new
+"downloading" frame replaces an undelivered one instead of queueing behind it;
+terminal frames (completed/failed) are never dropped.
+
+The hub also tells the workers which downloads have someone watching (dl:watched,
+refreshed every WATCH_REFRESH seconds and as soon as a download gets its first
+subscriber here), so they don't publish the others at full rate.
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from redis.exceptions import RedisError
+
+from app.utils.job_store import job_store
+from app.utils.redis_pool import async_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PATTERN = "dl:progress:*"
+CHANNEL_PREFIX = "dl:progress:"
+TERMINAL_STATUSES = ("completed", "failed")
+MAX_BUFFERED_FRAMES = 8  # per subscriber
+WATCH_REFRESH = 5.0      # seconds between refreshes of dl:watched
+
+
+@dataclass(slots=True)
+class Frame:
+    payload: str    # raw JSON, forwarded to the client untouched
+    terminal: bool  # completed/failed — last frame of the stream
+
+
+class Subscription:
+    """One SSE client's view of one download's progress."""
+
+    def __init__(self, maxsize: int = MAX_BUFFERED_FRAMES):
+        self._frames: deque[Frame] = deque()
+        self._maxsize = maxsize
+        self._ready = asyncio.Event()
+
+    def push(self, frame: Frame) -> None:
+        if self._frames and not self._frames[-1].terminal and not frame.terminal:
+            self._frames[-1] = frame  # newer snapshot supersedes the undelivered one
+        else:
+            if len(self._frames) >= self._maxsize:
+                self._drop_oldest_intermediate()
+            self._frames.append(frame)
+        self._ready.set()
+
+    def _drop_oldest_intermediate(self) -> None:
+        for i, queued in enumerate(self._frames):
+            if not queued.terminal:
+                del self._frames[i]
+                return
+
+    async def get(self, timeout: float) -> Frame | None:
+        """Next frame, or None if nothing arrived within `timeout` seconds."""
+        if not self._frames:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._frames.popleft()
+
+
+def make_frame(payload: str) -> Frame:
+    try:
+        status = json.loads(payload).get("status")
+    except (ValueError, AttributeError):
+        status = None
+    return Frame(payload=payload, terminal=status in TERMINAL_STATUSES)
+
+
+class ProgressHub:
+    def __init__(self):
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+        self._task: asyncio.Task | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._marking: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._refresh_task = asyncio.create_task(self._refresh_watched())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._refresh_task = None
+
+    @contextmanager
+    def subscribe(self, download_id: str):
+        """Register a subscriber for one download for the duration of the `with` block."""
+        sub = Subscription()
+        self.watch(download_id, sub)
+        try:
+            yield sub
+        finally:
+            self.unwatch(download_id, sub)
+
+    def watch(self, download_id: str, sub) -> None:
+        """Low-level registration: `sub.push(frame)` is called for every event of the
+        download until unwatch(). Used by the WebSocket endpoint's per-id taps."""
+        if download_id not in self._subscribers:
+            # Let the worker speed up now rather than at the next refresh
+            task = asyncio.get_running_loop().create_task(self._mark_watched([download_id]))
+            self._marking.add(task)
+            task.add_done_callback(self._marking.discard)
+        self._subscribers[download_id].add(sub)
+
+    def unwatch(self, download_id: str, sub) -> None:
+        subs = self._subscribers.get(download_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[download_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def _dispatch(self, channel: bytes, data: bytes) -> None:
+        download_id = channel.decode()[len(CHANNEL_PREFIX):]
+        subs = self._subscribers.get(download_id)
+        if not subs:
+            return
+        frame = make_frame(data.decode())  # parsed once, shared by every subscriber
+        for sub in subs:
+            sub.push(frame)
+
+    async def _mark_watched(self, download_ids: list[str]) -> None:
+        try:
+            await job_store.mark_watched(download_ids, ttl=WATCH_REFRESH * 3)
+        except (RedisError, OSError) as e:
+            logger.warning("Could not update watched downloads (%s)", e)
+
+    async def _refresh_watched(self) -> None:
+        while True:
+            await self._mark_watched(list(self._subscribers))
+            await asyncio.sleep(WATCH_REFRESH)
+
+    async def _resync(self) -> None:
+        """After a reconnect, re-send the latest snapshot of every watched download
+        so nothing published while we were disconnected is lost for good."""
+        for download_id in list(self._subscribers):
+            current = await async_redis.get(f"{CHANNEL_PREFIX}{download_id}")
+            if current:
+                self._dispatch(f"{CHANNEL_PREFIX}{download_id}".encode(), current)
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            pubsub = async_redis.pubsub()
+            try:
+                await pubsub.psubscribe(CHANNEL_PATTERN)
+                await self._resync()
+                backoff = 0.5
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                logger.warning("Progress hub lost Redis connection (%s), retrying", e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+            finally:
+                await pubsub.aclose()
+
+
+progress_hub = ProgressHub()
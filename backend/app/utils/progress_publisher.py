@@ -0,0 +1,144 @@
+"""
+Worker-side progress publishing, off the download threads.
+
+yt-dlp calls the task's progress hook on the thread that is transferring the bytes,
+many times a second. Writing to Redis there stalls the transfer whenever Redis is slow,
+so the hook only hands the update over (a deque append: no lock, no I/O) and one
+background thread per worker process publishes:
+
+  - every tick it drains the hand-off, keeps only the latest state of each job and
+    writes all of them in one pipeline (snapshot SET + PUBLISH per job);
+  - a tick is PROGRESS_INTERVAL, longer when a worker runs so many jobs that it would
+    publish more than PROGRESS_MAX_RATE updates a second; downloads no client is
+    watching (dl:watched, kept by the API's progress hub) are only written every
+    PROGRESS_IDLE_INTERVAL — their snapshot is still there for whoever connects;
+  - terminal states (completed/failed) are written by the caller before publish()
+    returns, after everything handed over earlier, so nobody ever sees a job go back
+    to "downloading" and a task never ends with its result unpublished.
+
+update_job() hands over job-record fields the same way (the job's trace, see
+utils/trace.py); they go out with the next flush, whatever the job's interval.
+
+Each flush also reads which of the running downloads have been cancelled (dl:cancelled),
+so the download threads can ask is_cancelled() without a round trip.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from app.config import settings
+from app.utils.job_store import JOB_TTL, sync_job_store
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class ProgressPublisher:
+    def __init__(self):
+        self._handoff: deque[tuple[str, dict]] = deque()
+        self._job_handoff: deque[tuple[str, dict]] = deque()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid: int | None = None  # the thread doesn't survive a fork — restart it in children
+        # Owned by whoever holds _flush_lock:
+        self._pending: dict[str, dict] = {}    # download id → latest unpublished state
+        self._sent_at: dict[str, float] = {}   # download id → last write (running jobs only)
+        self._watched: set[str] = set()
+        self._cancelled: set[str] = set()      # replaced whole, so readable from any thread
+
+    def publish(self, download_id: str, data: dict) -> None:
+        """Queue a progress update. Terminal states are written before this returns (blocking)."""
+        self._handoff.append((download_id, data))
+        if data.get("status") in TERMINAL_STATUSES:
+            self.flush()
+        elif self._pid != os.getpid():
+            self._start()
+
+    def update_job(self, download_id: str, **fields) -> None:
+        """Queue an update of the job record (see JobStore.update)."""
+        self._job_handoff.append((download_id, fields))
+        if self._pid != os.getpid():
+            self._start()
+
+    def is_cancelled(self, download_id: str) -> bool:
+        """Whether the download was cancelled, as of the last flush."""
+        return download_id in self._cancelled
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="progress-publisher", daemon=True).start()
+            atexit.register(self.flush, everything=True)
+
+    def interval(self) -> float:
+        """Seconds until the next tick."""
+        return max(settings.PROGRESS_INTERVAL, len(self._sent_at) / settings.PROGRESS_MAX_RATE)
+
+    def flush(self, everything: bool = False) -> None:
+        """Write what's pending in one round trip; unless `everything`, unwatched downloads
+        wait for their PROGRESS_IDLE_INTERVAL. Terminal states always go. Blocking."""
+        with self._flush_lock:
+            terminal = []
+            while self._handoff:
+                download_id, data = self._handoff.popleft()
+                if data.get("status") in TERMINAL_STATUSES:
+                    self._pending.pop(download_id, None)  # superseded
+                    terminal.append((download_id, data))
+                else:
+                    self._pending[download_id] = data
+            job_updates: dict[str, dict] = {}
+            while self._job_handoff:
+                download_id, fields = self._job_handoff.popleft()
+                job_updates.setdefault(download_id, {}).update(fields)
+
+            now = time.monotonic()
+            due = [
+                (download_id, data) for download_id, data in self._pending.items()
+                if everything or download_id in self._watched or download_id not in self._sent_at
+                or now - self._sent_at[download_id] >= settings.PROGRESS_IDLE_INTERVAL
+            ]
+            if not due and not terminal and not job_updates:
+                return
+            for download_id, _ in due:
+                del self._pending[download_id]
+            finished = {download_id for download_id, _ in terminal}
+            running = [download_id for download_id in {*self._sent_at, *self._pending, *dict(due)}
+                       if download_id not in finished]
+
+            try:
+                self._watched, self._cancelled = sync_job_store.publish_many(
+                    due + terminal, list(job_updates.items()), running=running
+                )
+            except Exception:
+                # Nothing is lost: put it all back (newer states of the same jobs win)
+                for download_id, data in due:
+                    self._pending.setdefault(download_id, data)
+                self._handoff.extendleft(reversed(terminal))
+                self._job_handoff.extendleft(reversed(job_updates.items()))
+                raise
+
+            for download_id, _ in due:
+                self._sent_at[download_id] = now
+            for download_id, _ in terminal:
+                self._sent_at.pop(download_id, None)
+            # Jobs whose task died without a terminal state
+            for download_id in [i for i, sent in self._sent_at.items() if now - sent > JOB_TTL]:
+                del self._sent_at[download_id]
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval())
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not publish download progress")
+
+
+progress_publisher = ProgressPublisher()
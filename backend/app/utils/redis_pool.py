@@ -0,0 +1,21 @@
+"""
+Shared Redis connection pools.
+
+Opening a client per request costs a TCP handshake each time. Each process goes
+through one pooled client instead:
+  - async_redis — for the FastAPI side (never blocks the event loop)
+  - sync_redis  — for the Celery worker and code running in worker threads
+"""
+
+import redis
+import redis.asyncio as aioredis
+
+from app.config import settings
+
+async_redis = aioredis.from_url(
+    settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS
+)
+
+sync_redis = redis.Redis.from_url(
+    settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS
+)
@@ -0,0 +1,86 @@
+"""
+Per-job timing trace, for finding out why one particular download was slow.
+
+Every job record carries `queued_at` (Unix time, set by the API) and `trace`: a list
+of [event, ms since queued_at] or [event, ms, {detail}] entries, appended by the
+worker as the job moves along:
+
+  picked_up          a worker started the task      {"attempt": n}
+  extracted          formats resolved               {"reused": true if /api/extract's info_dict was used}
+  first_byte         the first bytes arrived from the origin
+  fragments          every tenth of an HLS/DASH download's fragments  {"done": i, "of": n}
+  downloaded         the last byte arrived
+  merge_start/_end   ffmpeg merge, audio extraction or fixup          {"step": "Merger", ...}
+  completed/failed
+
+Recording an event is an in-memory append; the record is written by the progress
+publisher's next flush, so the download thread doesn't wait on Redis for it.
+
+The API adds "queued" (at queued_at) and "served" when building the timeline.
+Fully served jobs are deleted straight away, so cleanup keeps their timeline
+(event names and timings only, no URL or filename) under dl:trace:{id} for JOB_TTL.
+"""
+
+import json
+import time
+
+from app.utils.job_store import JOB_TTL
+from app.utils.progress_publisher import progress_publisher
+from app.utils.redis_pool import async_redis, sync_redis
+
+FRAGMENT_MARKS = 10  # "fragments" events per download
+
+
+def kept_trace_key(download_id: str) -> str:
+    return f"dl:trace:{download_id}"
+
+
+class Trace:
+    """A job's trace on the worker. Events from earlier attempts are kept."""
+
+    def __init__(self, download_id: str, job: dict):
+        self.download_id = download_id
+        self.origin = job.get("queued_at") or time.time()
+        self.events: list[list] = list(job.get("trace") or [])
+        self._fragment_step = 0
+
+    def mark(self, event: str, **detail) -> None:
+        entry = [event, round((time.time() - self.origin) * 1000)]
+        if detail:
+            entry.append(detail)
+        self.events.append(entry)
+        progress_publisher.update_job(self.download_id, trace=list(self.events))
+
+    def fragment(self, done: int, total: int) -> None:
+        """Record fragment progress, FRAGMENT_MARKS times over the download."""
+        step = done * FRAGMENT_MARKS // total if total else 0
+        if step > self._fragment_step:
+            self._fragment_step = step
+            self.mark("fragments", done=done, of=total)
+
+
+def timeline(job: dict) -> list[dict]:
+    """The job's events in order, with the time since the previous one."""
+    events = [["queued", 0]] + list(job.get("trace") or [])
+    if job.get("served_at") and job.get("queued_at"):
+        events.append(["served", round((job["served_at"] - job["queued_at"]) * 1000)])
+    result, previous = [], 0
+    for entry in sorted(events, key=lambda e: e[1]):
+        event, at_ms = entry[0], entry[1]
+        result.append({"event": event, "at_ms": at_ms, "delta_ms": at_ms - previous,
+                       "detail": entry[2] if len(entry) > 2 else None})
+        previous = at_ms
+    return result
+
+
+def keep(download_id: str, job: dict, served: bool) -> None:
+    """Save a job's timeline before its record is deleted."""
+    kept = {"status": job.get("status"), "queued_at": job.get("queued_at"), "trace": job.get("trace") or []}
+    if served:
+        kept["served_at"] = time.time()
+    sync_redis.set(kept_trace_key(download_id), json.dumps(kept), ex=JOB_TTL)
+
+
+async def load_kept(download_id: str) -> dict | None:
+    raw = await async_redis.get(kept_trace_key(download_id))
+    return json.loads(raw) if raw else None
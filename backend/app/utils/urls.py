@@ -0,0 +1,33 @@
+"""
+URL helpers shared by the caches.
+
+Links pasted by users carry a lot of noise (tracking params, fragments, mixed-case
+hosts). normalize_url() strips that so the same video always maps to the same cache key.
+"""
+
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query params that never change which video a URL points to
+TRACKING_PARAMS = {"si", "feature", "fbclid", "gclid", "igshid", "ref", "ref_src", "s", "t"}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: lowercase scheme/host, no default
+    port, no fragment, no tracking params, and query params sorted."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and not (
+        (scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)
+    ):
+        host = f"{host}:{parts.port}"
+
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
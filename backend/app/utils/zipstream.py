@@ -0,0 +1,73 @@
+"""
+ZIP archives generated on the fly, for GET /api/batches/{id}/zip.
+
+zipfile can write to an unseekable stream: it then puts each entry's sizes and CRC in
+a data descriptor after the data instead of going back to patch the header. We hand
+it a sink that only collects written bytes and yield them as the archive is built, so
+nothing is staged on disk and memory stays at about one chunk.
+
+Entries are stored, not deflated — video and audio are already compressed — and are
+always ZIP64 so files over 4 GiB work.
+"""
+
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+class _Sink:
+    """Write-only, unseekable file object that buffers until drained."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _read(path: Path, chunk_size: int) -> Iterator[bytes]:
+    with open(path, "rb") as src:
+        while chunk := src.read(chunk_size):
+            yield chunk
+
+
+def stream_zip(files: Iterable[tuple[str, Path | Iterable[bytes]]], chunk_size: int) -> Iterator[bytes]:
+    """Yield a ZIP archive of `files` piece by piece: (name in archive, source) pairs, where
+    the source is a path on disk or the file's content as chunks (e.g. from another node)."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, source in files:
+            if isinstance(source, Path):
+                info = zipfile.ZipInfo.from_file(source, arcname)
+                source = _read(source, chunk_size)
+            else:
+                info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            with archive.open(info, "w", force_zip64=True) as dst:
+                for chunk in source:
+                    dst.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()  # the last entry's data descriptor and the central directory
+
+
+def unique_names(names: Iterable[str]) -> list[str]:
+    """Make archive names unique by numbering repeats ("a.mp4", "a (2).mp4")."""
+    seen: dict[str, int] = {}
+    result = []
+    for name in names:
+        count = seen.get(name, 0) + 1
+        seen[name] = count
+        if count > 1:
+            stem, dot, ext = name.rpartition(".")
+            name = f"{stem} ({count}).{ext}" if dot else f"{name} ({count})"
+        result.append(name)
+    return result
@@ -0,0 +1,72 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+    python -m bench.compare baseline.json results.json [--threshold 10]
+
+Every numeric value in the files is compared. Names ending in _ms are lower-is-better,
+names containing per_sec higher-is-better; everything else (counts, settings) is shown
+but never counts as a regression. Exits 1 if any metric got worse by more than
+--threshold percent.
+"""
+
+import argparse
+import json
+import sys
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """{"a": {"b": 1}} → {"a.b": 1}, numeric leaves only (the "meta" section is skipped)."""
+    flat = {}
+    for key, value in results.items():
+        if not prefix and key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def _direction(name: str) -> int:
+    """+1 if bigger is better, -1 if smaller is better, 0 if neither."""
+    if name.endswith("_ms"):
+        return -1
+    if "per_sec" in name:
+        return 1
+    return 0
+
+
+def compare(baseline: dict, results: dict, threshold: float = 10.0) -> list[str]:
+    """Print a table of changes; returns the names of the regressed metrics."""
+    old, new = flatten(baseline), flatten(results)
+    regressions = []
+    width = max(map(len, new), default=0)
+    for name in sorted(new):
+        if name not in old:
+            print(f"{name:<{width}}  {'':>12}  {new[name]:>12.4g}  (new)")
+            continue
+        before, after = old[name], new[name]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = _direction(name) * change < -threshold
+        if worse:
+            regressions.append(name)
+        print(f"{name:<{width}}  {before:>12.4g}  {after:>12.4g}  {change:+7.1f}%{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change that counts as a regression")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+    return 1 if compare(baseline, results, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Stand-in media origin for the benchmarks: a local HTTP server that yt-dlp's generic
+extractor treats like any site serving plain media files.
+
+  GET /progressive/{name}.mp4        — one progressive file (Range requests honoured,
+                                       so big ones take the segmented download path)
+  GET /hls/{name}/{name}.m3u8        — an HLS VOD media playlist...
+  GET /hls/{name}/{n}.ts             — ...and its segments
+  GET /dash/{name}/{name}.mpd        — a static DASH manifest (one muxed representation)...
+  GET /dash/{name}/init.mp4, {n}.m4s — ...its initialization and media segments
+
+`name` is free, so every URL a benchmark uses can be distinct (no cache hits unless
+it asks for them). It is also the last path component, which the generic extractor
+takes as the video id — and so the output filename.
+
+The bytes are synthetic: a repeated pseudo-random block, which no extractor or
+downloader inspects. The one exception is HLS when ffmpeg is installed: yt-dlp then
+runs its MPEG-TS fixup on the result, so the segments are real MPEG-TS, encoded once
+at startup from ffmpeg's test source.
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK = random.Random(0).randbytes(1024 * 1024)
+_TWICE = memoryview(BLOCK * 2)  # any BLOCK-sized window of the stream, without copying
+SEGMENT_SECONDS = 2
+
+
+def _window(start: int, end: int) -> memoryview:
+    """Bytes [start, end) of an endless stream of BLOCK; at most len(BLOCK) of them."""
+    offset = start % len(BLOCK)
+    return _TWICE[offset:offset + min(end - start, len(BLOCK))]
+
+
+def _synthetic(start: int, end: int) -> bytes:
+    """Bytes [start, end) of an endless stream of BLOCK."""
+    out = bytearray()
+    while start < end:
+        piece = _window(start, end)
+        out += piece
+        start += len(piece)
+    return bytes(out)
+
+
+def _encode_hls(seconds: int, workdir: str) -> list[bytes] | None:
+    """Real MPEG-TS segments of a test pattern, or None without ffmpeg."""
+    if not shutil.which("ffmpeg"):
+        return None
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=25:duration={seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-b:v", "2M", "-g", str(25 * SEGMENT_SECONDS),
+         "-c:a", "aac", "-f", "hls", "-hls_time", str(SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+         "-hls_segment_filename", os.path.join(workdir, "%d.ts"), os.path.join(workdir, "index.m3u8")],
+        check=True,
+    )
+    segments = []
+    while os.path.exists(path := os.path.join(workdir, f"{len(segments)}.ts")):
+        with open(path, "rb") as f:
+            segments.append(f.read())
+    return segments
+
+
+class Origin:
+    """The origin server, run from a daemon thread. Sizes are per video."""
+
+    def __init__(self, progressive_bytes: int = 8 * 1024**2, segments: int = 10,
+                 segment_bytes: int = 512 * 1024, host: str = "127.0.0.1", port: int = 0):
+        self.progressive_bytes = progressive_bytes
+        self.segments = segments
+        self.segment_bytes = segment_bytes
+        self._workdir = tempfile.mkdtemp(prefix="dl-bench-origin-")
+        self.hls_segments = _encode_hls(segments * SEGMENT_SECONDS, self._workdir)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_port}"
+
+    def start(self) -> "Origin":
+        threading.Thread(target=self._server.serve_forever, name="bench-origin", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def url(self, kind: str, name: str) -> str:
+        """Page URL of one video: kind is "progressive", "hls" or "dash"."""
+        return {
+            "progressive": f"{self.base_url}/progressive/{name}.mp4",
+            "hls": f"{self.base_url}/hls/{name}/{name}.m3u8",
+            "dash": f"{self.base_url}/dash/{name}/{name}.mpd",
+        }[kind]
+
+    # --- documents ----------------------------------------------------------------------
+
+    def _playlist(self) -> bytes:
+        count = len(self.hls_segments) if self.hls_segments else self.segments
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+        for n in range(count):
+            lines += [f"#EXTINF:{SEGMENT_SECONDS:.1f},", f"{n}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode()
+
+    def _manifest(self) -> bytes:
+        seconds = self.segments * SEGMENT_SECONDS
+        bandwidth = self.segment_bytes * 8 // SEGMENT_SECONDS
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" profiles="urn:mpeg:dash:profile:isoff-live:2011"
+     mediaPresentationDuration="PT{seconds}S" minBufferTime="PT{SEGMENT_SECONDS}S">
+  <Period id="0" start="PT0S">
+    <AdaptationSet mimeType="video/mp4" segmentAlignment="true">
+      <Representation id="muxed" bandwidth="{bandwidth}" width="640" height="360" codecs="avc1.64001e,mp4a.40.2">
+        <SegmentTemplate timescale="1" duration="{SEGMENT_SECONDS}" startNumber="0"
+                         initialization="init.mp4" media="$Number$.m4s"/>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+""".encode()
+
+    def _resource(self, path: str) -> tuple[str, bytes | int] | None:
+        """(content type, body or progressive length) for a path, or None."""
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "progressive" and parts[1].endswith(".mp4"):
+            return "video/mp4", self.progressive_bytes
+        if len(parts) != 3:
+            return None
+        kind, name, leaf = parts
+        stem, _, ext = leaf.partition(".")
+        if kind == "hls" and leaf == f"{name}.m3u8":
+            return "application/vnd.apple.mpegurl", self._playlist()
+        if kind == "hls" and ext == "ts" and stem.isdigit():
+            n = int(stem)
+            if self.hls_segments:
+                return ("video/mp2t", self.hls_segments[n]) if n < len(self.hls_segments) else None
+            return ("video/mp2t", _synthetic(n * self.segment_bytes, (n + 1) * self.segment_bytes)) \
+                if n < self.segments else None
+        if kind == "dash" and leaf == f"{name}.mpd":
+            return "application/dash+xml", self._manifest()
+        if kind == "dash" and leaf == "init.mp4":
+            return "video/mp4", _synthetic(0, 1024)
+        if kind == "dash" and ext == "m4s" and stem.isdigit() and int(stem) < self.segments:
+            n = int(stem)
+            return "video/iso.segment", _synthetic(n * self.segment_bytes, (n + 1) * self.segment_bytes)
+        return None
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self._send(head=True)
+
+            def do_GET(self):
+                self._send(head=False)
+
+            def _send(self, head: bool):
+                resource = origin._resource(self.path.split("?")[0])
+                if resource is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                content_type, body = resource
+                size = body if isinstance(body, int) else len(body)
+                start, end, status = 0, size, 200
+                header = self.headers.get("Range", "")
+                if header.startswith("bytes=") and "," not in header:
+                    first, _, last = header[len("bytes="):].partition("-")
+                    if first:
+                        start, end = int(first), min(int(last) + 1, size) if last else size
+                    else:
+                        start = max(size - int(last), 0)
+                    status = 206
+                if start >= end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(end - start))
+                self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+                self.end_headers()
+                if head:
+                    return
+                try:
+                    if isinstance(body, bytes):
+                        self.wfile.write(body[start:end])
+                        return
+                    while start < end:  # progressive: stream the synthetic bytes in 1 MiB writes
+                        piece = _window(start, end)
+                        self.wfile.write(piece)
+                        start += len(piece)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # the generic extractor hangs up after the headers
+
+        return Handler
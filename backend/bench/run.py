@@ -0,0 +1,390 @@
+"""
+End-to-end benchmark of the download pipeline, with no network access needed.
+
+Runs the real FastAPI app (uvicorn, in a thread of this process) against the stand-in
+media origin in bench/origin.py, with downloads executed by the real Celery task:
+
+  - default       — Redis is fakeredis (in memory) and the task runs in-process
+                    (task.apply() on a thread per scheduler slot — no broker involved);
+  - --redis URL   — a real Redis, and a real Celery worker started as a subprocess
+                    (or your own, with --external-worker). Use an empty scratch database.
+
+Phases, each reported in the results file:
+  extract    — POST /api/extract on distinct progressive/HLS/DASH URLs: p50/p99 latency
+  downloads  — POST /api/downloads for --jobs videos at once, until all are done:
+               jobs/sec and bytes/sec over the whole run
+  file       — GET /api/downloads/{id}/file of each finished job: time to first byte
+  sse        — --subscribers SSE streams on one download, then --sse-events progress
+               updates published like a worker does: latency from publish to receipt
+  stages     — mean per-stage times from GET /metrics (queue wait, transfer, serve...)
+
+    python -m bench.run --out results.json
+    python -m bench.run --out new.json --baseline results.json   # also compare (bench/compare.py)
+
+Run from backend/. Everything (API, origin, clients, the in-process worker) shares
+this machine, so compare results from the same machine only.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+from bench.compare import compare
+from bench.origin import Origin
+
+KINDS = ("progressive", "hls", "dash")
+FORMAT = "bestvideo+bestaudio/best"  # what the frontend sends by default
+TERMINAL = ("completed", "failed")
+
+
+def _summary(seconds: list[float]) -> dict:
+    """count, p50/p99 and mean of a list of durations, in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ordered = sorted(seconds)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))] * 1000, 3)
+
+    return {"count": len(ordered), "p50_ms": pct(50), "p99_ms": pct(99),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3)}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- environment ----------------------------------------------------------------------
+
+def _configure(args, downloads_dir: str) -> dict:
+    """Settings for the app (and a spawned worker), set before anything imports app.config."""
+    env = {
+        "DOWNLOADS_DIR": downloads_dir,
+        "REDIS_URL": args.redis or "redis://fake/0",
+        "SCHEDULER_SLOTS": str(args.slots),
+        "MAX_JOBS_PER_DOMAIN": str(args.slots),  # every video is on the one origin host
+        "MAX_CONCURRENT_DOWNLOADS": str(args.slots),
+        "MIN_FREE_BYTES": "0",
+        "JANITOR_INTERVAL": "0",
+        "EXTRACT_CACHE_LOCAL_TTL": "0",
+    }
+    if not args.redis:
+        env["EXTRACT_POOL"] = "thread"  # pool processes wouldn't share the in-memory Redis
+    os.environ.update(env)
+    return env
+
+
+def _use_fake_redis() -> None:
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("The default mode needs fakeredis (pip install fakeredis), or pass --redis URL")
+    import redis
+    import redis.asyncio as aioredis
+
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, *a, **k: fakeredis.FakeRedis(server=server))
+    aioredis.from_url = lambda *a, **k: fakeredis.FakeAsyncRedis(server=server)
+
+
+def _run_tasks_inline(slots: int) -> None:
+    """Dispatch downloads to this process: the real task, on a thread per slot."""
+    from app.tasks import dispatch
+    from app.tasks.download_task import download_video_task
+
+    pool = ThreadPoolExecutor(slots, thread_name_prefix="bench-worker")
+
+    def send_download(download_id: str, url: str, format_id: str, queue: str = "short") -> None:
+        pool.submit(download_video_task.apply, args=(download_id, url, format_id), task_id=download_id)
+
+    dispatch.send_download = send_download
+
+
+def _start_worker(env: dict, slots: int) -> subprocess.Popen:
+    """A Celery worker subprocess on both queues; returns once it answers pings."""
+    from app.tasks.celery_app import celery_app
+
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "celery", "-A", "app.tasks.celery_app", "worker", "-Q", "short,long",
+         "--concurrency", str(slots), "--loglevel", "warning"],
+        env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + 60
+    while not celery_app.control.ping(timeout=1.0):
+        if worker.poll() is not None or time.monotonic() > deadline:
+            worker.kill()
+            sys.exit("The Celery worker didn't start")
+    return worker
+
+
+def _start_api(port: int):
+    """uvicorn serving the app from a thread (its own event loop); returns the server."""
+    import uvicorn
+
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           timeout_keep_alive=60, backlog=4096))
+    threading.Thread(target=server.run, name="bench-api", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+# --- phases ---------------------------------------------------------------------------
+
+async def _extract_all(client: httpx.AsyncClient, urls: list[str], concurrency: int) -> list[float]:
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(url: str) -> None:
+        async with limit:
+            started = time.perf_counter()
+            response = await client.post("/api/extract", json={"url": url})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(url) for url in urls))
+    return latencies
+
+
+async def bench_extract(client, origin: Origin, count: int, concurrency: int) -> dict:
+    # Not timed: the first extractions pay for loading yt-dlp's extractors
+    await _extract_all(client, [origin.url(kind, f"warm-up-{i}") for i in range(concurrency) for kind in KINDS],
+                       concurrency)
+    by_kind = {}
+    for kind in KINDS:
+        urls = [origin.url(kind, f"extract-{i}") for i in range(count // len(KINDS))]
+        by_kind[kind] = await _extract_all(client, urls, concurrency)
+    return {**_summary([t for times in by_kind.values() for t in times]),
+            "by_kind": {kind: _summary(times) for kind, times in by_kind.items()}}
+
+
+async def bench_downloads(client, origin: Origin, jobs: int, concurrency: int) -> tuple[dict, list[dict]]:
+    urls = [origin.url(KINDS[i % len(KINDS)], f"download-{i}") for i in range(jobs)]
+    await _extract_all(client, urls, concurrency)  # as the frontend does first; not timed
+
+    started = time.perf_counter()
+    ids = []
+    for url in urls:
+        response = await client.post("/api/downloads", json={"url": url, "format_id": FORMAT})
+        response.raise_for_status()
+        ids.append(response.json()["id"])
+
+    finished = {}
+    while len(finished) < len(ids):
+        await asyncio.sleep(0.05)
+        for download_id in ids:
+            if download_id in finished:
+                continue
+            job = (await client.get(f"/api/downloads/{download_id}")).json()
+            if job["status"] in TERMINAL:
+                finished[download_id] = job
+    elapsed = time.perf_counter() - started
+
+    done = [job for job in finished.values() if job["status"] == "completed"]
+    total_bytes = sum(job.get("filesize") or 0 for job in done)
+    return {
+        "jobs": len(ids),
+        "completed": len(done),
+        "failed": len(ids) - len(done),
+        "seconds": round(elapsed, 3),
+        "jobs_per_sec": round(len(done) / elapsed, 3),
+        "bytes_per_sec": round(total_bytes / elapsed),
+        "errors": sorted({job.get("error_message") or "" for job in finished.values()} - {""})[:5],
+    }, done
+
+
+async def bench_file(client, jobs: list[dict]) -> dict:
+    ttfb, seconds, total, errors = [], [], 0, 0
+    for job in jobs:
+        started = time.perf_counter()
+        async with client.stream("GET", f"/api/downloads/{job['id']}/file") as response:
+            if response.status_code != 200:
+                errors += 1
+                continue
+            first = None
+            async for chunk in response.aiter_raw():
+                first = first or time.perf_counter()
+                total += len(chunk)
+        ttfb.append((first or time.perf_counter()) - started)
+        seconds.append(time.perf_counter() - started)
+    return {"ttfb": _summary(ttfb), "transfer": _summary(seconds), "errors": errors,
+            "bytes_per_sec": round(total / sum(seconds)) if seconds else 0}
+
+
+async def bench_sse(base_url: str, subscribers: int, events: int, interval: float) -> dict:
+    from app.utils.job_store import sync_job_store
+
+    download_id = f"bench-sse-{int(time.time())}"
+    sync_job_store.create(download_id, {"id": download_id, "url": "", "status": "downloading"})
+    sync_job_store.set_progress(download_id, {"status": "downloading", "progress": 0})
+
+    latencies, received = [], 0
+    connected = asyncio.Event()
+    open_streams = 0
+    connecting = asyncio.Semaphore(200)  # don't overflow the listen backlog
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+
+    async def subscriber(client: httpx.AsyncClient) -> None:
+        nonlocal open_streams, received
+        await connecting.acquire()
+        opening = True
+        try:
+            async with client.stream("GET", f"/api/downloads/{download_id}/progress") as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:") or not line[5:].strip():
+                        continue
+                    data = json.loads(line[5:])
+                    if "sent" not in data:  # the snapshot every new stream starts with
+                        connecting.release()
+                        opening = False
+                        open_streams += 1
+                        if open_streams == subscribers:
+                            connected.set()
+                        continue
+                    latencies.append(time.time() - data["sent"])
+                    received += 1
+                    if data["status"] in TERMINAL:
+                        return
+        finally:
+            if opening:
+                connecting.release()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        tasks = [asyncio.create_task(subscriber(client)) for _ in range(subscribers)]
+        await asyncio.wait_for(connected.wait(), timeout=max(60, subscribers / 50))
+        for n in range(events):
+            status = "completed" if n == events - 1 else "downloading"
+            progress = {"status": status, "progress": (n + 1) * 100 / events, "sent": time.time()}
+            await asyncio.to_thread(sync_job_store.set_progress, download_id, progress)
+            await asyncio.sleep(interval)
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=60)
+
+    sync_job_store.delete(download_id)
+    return {"subscribers": subscribers, "events": events,
+            "delivered_ratio": round(received / (subscribers * events), 4), **_summary(latencies)}
+
+
+async def stage_means(client) -> dict:
+    """Mean of every dl_*_seconds histogram, from GET /metrics."""
+    sums, counts = {}, {}
+    for line in (await client.get("/metrics")).text.splitlines():
+        if line.startswith("#") or not line.startswith("dl_"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name = series.split("{")[0]
+        for suffix, into in (("_seconds_sum", sums), ("_seconds_count", counts)):
+            if name.endswith(suffix):
+                stage = name[len("dl_"):-len(suffix)]
+                into[stage] = into.get(stage, 0) + float(value)
+    return {f"{stage}_mean_ms": round(sums[stage] / counts[stage] * 1000, 3)
+            for stage in sorted(sums) if counts.get(stage)}
+
+
+# --- main -----------------------------------------------------------------------------
+
+def _meta(args) -> dict:
+    import yt_dlp
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "yt_dlp": yt_dlp.version.__version__,
+        "ffmpeg": bool(shutil.which("ffmpeg")),
+        "redis": "real" if args.redis else "fake",
+        "worker": "inline" if not args.redis else ("external" if args.external_worker else "subprocess"),
+        "args": vars(args),
+    }
+
+
+async def _run(args, origin: Origin, base_url: str) -> dict:
+    results = {"meta": _meta(args)}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        print("extract...", flush=True)
+        results["extract"] = await bench_extract(client, origin, args.extracts, args.concurrency)
+        print("downloads...", flush=True)
+        results["downloads"], done = await bench_downloads(client, origin, args.jobs, args.concurrency)
+        print("file...", flush=True)
+        results["file"] = await bench_file(client, done)
+        print("sse...", flush=True)
+        results["sse"] = await bench_sse(base_url, args.subscribers, args.sse_events, args.sse_interval)
+        await asyncio.sleep(1.5)  # let workers flush their shared metrics
+        results["stages"] = await stage_means(client)
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark (see bench/run.py)")
+    parser.add_argument("--out", default="bench-results.json", help="results file (JSON)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold (percent)")
+    parser.add_argument("--redis", help="real Redis URL (default: fakeredis, in-process worker)")
+    parser.add_argument("--external-worker", action="store_true", help="with --redis: don't start a worker")
+    parser.add_argument("--extracts", type=int, default=60, help="extractions, split over the 3 kinds")
+    parser.add_argument("--jobs", type=int, default=30, help="downloads, split over the 3 kinds")
+    parser.add_argument("--slots", type=int, default=6, help="scheduler slots / worker concurrency")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent API requests")
+    parser.add_argument("--subscribers", type=int, default=2000, help="SSE streams")
+    parser.add_argument("--sse-events", type=int, default=20, help="progress events sent to them")
+    parser.add_argument("--sse-interval", type=float, default=0.1, help="seconds between those events")
+    parser.add_argument("--progressive-mb", type=int, default=48, help="size of a progressive video")
+    parser.add_argument("--segments", type=int, default=20, help="segments per HLS/DASH video")
+    parser.add_argument("--segment-kb", type=int, default=512, help="size of a synthetic segment")
+    args = parser.parse_args(argv)
+
+    downloads_dir = tempfile.mkdtemp(prefix="dl-bench-downloads-")
+    env = _configure(args, downloads_dir)
+    if not args.redis:
+        _use_fake_redis()
+        _run_tasks_inline(args.slots)
+
+    origin = Origin(args.progressive_mb * 1024**2, args.segments, args.segment_kb * 1024).start()
+    worker = _start_worker(env, args.slots) if args.redis and not args.external_worker else None
+    port = _free_port()
+    server = _start_api(port)
+    try:
+        results = asyncio.run(_run(args, origin, f"http://127.0.0.1:{port}"))
+    finally:
+        server.should_exit = True
+        if worker:
+            worker.terminate()
+            worker.wait()
+        origin.stop()
+        shutil.rmtree(downloads_dir, ignore_errors=True)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            return 1 if compare(json.load(f), results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())